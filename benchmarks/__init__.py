@@ -0,0 +1,4 @@
+"""
+Benchmarks for the sync's hot paths, run against recorded Strava and Visual Crossing
+responses served locally (see README.md, "Benchmarks").
+"""
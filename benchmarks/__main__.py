@@ -0,0 +1,139 @@
+import argparse
+import json
+import logging
+import sys
+import tempfile
+
+from .settings import configure
+
+# The report's columns.
+COLUMNS = "{:<24} {:>11} {:>11} {:>13}"
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks",
+        description="Benchmark the sync against local stand-ins for Strava, Visual "
+        "Crossing and the database.",
+    )
+    parser.add_argument(
+        "patterns",
+        nargs="*",
+        metavar="PATTERN",
+        help="Only run the benchmarks whose names match (e.g. 'sync_rides.*').",
+    )
+    parser.add_argument(
+        "--list", action="store_true", help="List the benchmarks and exit."
+    )
+    parser.add_argument(
+        "--repeat", type=int, help="How many times to run each benchmark."
+    )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=50,
+        metavar="MS",
+        help="How long the fake APIs take to respond, in milliseconds (default 50).",
+    )
+    parser.add_argument(
+        "--database",
+        metavar="URL",
+        help="A MySQL database with the freezing-model schema to benchmark against "
+        "(default an in-memory SQLite stand-in).",
+    )
+    parser.add_argument(
+        "--output", metavar="FILE", help="Save the results (as JSON) to this file."
+    )
+    parser.add_argument(
+        "--compare",
+        metavar="FILE",
+        help="Compare with results saved earlier, and fail on regressions.",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=10,
+        metavar="PERCENT",
+        help="How much slower a benchmark has to get to count as a regression "
+        "(default 10).",
+    )
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+
+    configure(tempfile.mkdtemp(prefix="freezing-benchmarks-"), args.database)
+
+    from . import harness, suite
+    from .database import stand_in
+    from .fakeserver import FakeServer, redirect
+    from .fixtures import visualcrossing_routes
+
+    benchmarks = harness.select(args.patterns)
+    if args.list:
+        for b in benchmarks:
+            print(f"{b.name:<24} {b.description}")
+        return 0
+
+    dialect = stand_in(args.database)
+    if dialect != "mysql":
+        skipped = [b.name for b in benchmarks if b.mysql_only]
+        if skipped:
+            print(f"Skipping (needs --database with MySQL): {', '.join(skipped)}")
+        benchmarks = [b for b in benchmarks if not b.mysql_only]
+
+    server = FakeServer(
+        suite.strava.routes() + visualcrossing_routes(), latency=args.latency / 1000
+    )
+    results = {
+        "environment": harness.environment(database=dialect, latency_ms=args.latency),
+        "benchmarks": {},
+    }
+    print(COLUMNS.format("benchmark", "median (s)", "min (s)", "items/s"))
+    with server, redirect(
+        {"www.strava.com": server.url, "weather.visualcrossing.com": server.url}
+    ):
+        for b in benchmarks:
+            result = harness.run(b, args.repeat)
+            results["benchmarks"][b.name] = result
+            per_second = result["per_second"]
+            print(
+                COLUMNS.format(
+                    b.name,
+                    f"{result['median']:.4f}",
+                    f"{result['min']:.4f}",
+                    f"{per_second:.1f}" if per_second else "-",
+                )
+            )
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        comparison = harness.compare(baseline, results, args.threshold / 100)
+        print(
+            "\nCompared with {commit} (Python {python}, {database}, "
+            "{latency_ms} ms latency):".format(**baseline["environment"])
+        )
+        for c in comparison:
+            print(
+                "{:<24} {:>10.4f}s -> {:>8.4f}s {:>+7.1%}{}".format(
+                    c["name"],
+                    c["baseline"],
+                    c["median"],
+                    c["change"],
+                    "  REGRESSION" if c["regression"] else "",
+                )
+            )
+        if any(c["regression"] for c in comparison):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,75 @@
+"""
+The database the benchmarks write to.
+"""
+
+import time
+
+from freezing.model import init_model, meta
+from freezing.model.orm import Athlete, Ride
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import scoped_session, sessionmaker
+from sqlalchemy.pool import StaticPool
+
+# Stand-ins for the SpatiaLite functions that GeoAlchemy2 calls on SQLite: geometries
+# are stored as their WKT and read back as NULL (nothing benchmarked reads them).
+_SPATIALITE_STAND_INS = {
+    "GeomFromEWKT": lambda value: value,
+    "GeomFromEWKB": lambda value: value,
+    "AsEWKB": lambda value: None,
+    "AsBinary": lambda value: None,
+    "RecoverGeometryColumn": lambda *args: 1,
+    "CreateSpatialIndex": lambda *args: 1,
+    "CheckSpatialIndex": lambda *args: None,
+    "DisableSpatialIndex": lambda *args: 1,
+    "DiscardGeometryColumn": lambda *args: 1,
+}
+
+
+def stand_in(url: str = None) -> str:
+    """
+    Point freezing.model at the database to benchmark against.
+
+    With a MySQL URL that is a real database, which must already have the freezing-model
+    schema (alembic upgrade head) and which the benchmarks add athletes and rides to.
+    Otherwise it is a new in-memory SQLite database with the tables created from the
+    models. SQLite is quick to set up but is no guide to MySQL's own speed, and the
+    queries written in MySQL's SQL (like the overlap check) can't be run on it.
+
+    :return: The name of the database's dialect.
+    """
+    if url and not url.startswith("sqlite"):
+        init_model(sqlalchemy_url=url)
+        return meta.scoped_session().get_bind().dialect.name
+
+    engine = create_engine(
+        url or "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+
+    @event.listens_for(engine, "connect")
+    def spatialite_stand_ins(dbapi_conn, connection_record):
+        for name, function in _SPATIALITE_STAND_INS.items():
+            dbapi_conn.create_function(name, -1, function)
+
+    Ride.metadata.create_all(engine)
+    meta.engine = engine
+    meta.scoped_session = scoped_session(sessionmaker(bind=engine))
+    return engine.dialect.name
+
+
+def add_athlete(athlete_id: int, name: str = None) -> Athlete:
+    """
+    Add an athlete whose access token the fake Strava API knows them by, and which
+    won't need refreshing.
+    """
+    session = meta.scoped_session()
+    athlete = session.get(Athlete, athlete_id) or Athlete()
+    athlete.id = athlete_id
+    athlete.name = athlete.display_name = name or f"Benchmark Rider {athlete_id}"
+    athlete.access_token = f"athlete-{athlete_id}"
+    athlete.refresh_token = f"refresh-{athlete_id}"
+    athlete.expires_at = int(time.time()) + 86400
+    session.add(athlete)
+    session.commit()
+    return athlete
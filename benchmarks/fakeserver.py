@@ -0,0 +1,152 @@
+"""
+A local HTTP server standing in for the Strava and Visual Crossing APIs.
+"""
+
+import json
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+from unittest.mock import patch
+from urllib.parse import parse_qs, urlsplit, urlunsplit
+
+from requests.adapters import HTTPAdapter
+
+# A route's handler gets the path match, the query string (as a dict of lists) and the
+# request headers, and returns the status code and a body: bytes, or anything else to be
+# sent as JSON.
+Handler = Callable[[re.Match, Dict[str, List[str]], Dict[str, str]], Tuple[int, Any]]
+
+
+class FakeServer(object):
+    """
+    Serves canned responses from a thread, after a configurable latency, and answers
+    a configurable fraction of requests with 429 Too Many Requests as Strava does when
+    the rate limit is used up.
+
+    :param routes: (method, path regex, handler) for each kind of request.
+    :param latency: Seconds to wait before responding: a number, or a (low, high) range
+                    to pick from at random.
+    :param throttle_rate: The fraction of requests to answer with a 429.
+    """
+
+    def __init__(
+        self,
+        routes: List[Tuple[str, str, Handler]],
+        latency: Union[float, Tuple[float, float]] = 0.0,
+        throttle_rate: float = 0.0,
+        seed: Optional[int] = None,
+    ):
+        self.routes = [(method, re.compile(path), h) for (method, path, h) in routes]
+        self.latency = latency
+        self.throttle_rate = throttle_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.throttled = 0
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), self._handler_class())
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeServer":
+        self.thread = threading.Thread(
+            target=self.httpd.serve_forever, name="fake-server", daemon=True
+        )
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self.thread:
+            self.thread.join()
+
+    def __enter__(self) -> "FakeServer":
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def respond(
+        self, method: str, url: str, headers: Dict[str, str] = None
+    ) -> Tuple[int, Dict[str, str], bytes]:
+        """
+        :return: The status, headers and body to answer a request with.
+        """
+        with self.lock:
+            self.requests += 1
+            delay = self.latency
+            if isinstance(delay, tuple):
+                delay = self.random.uniform(*delay)
+            throttle = self.random.random() < self.throttle_rate
+            if throttle:
+                self.throttled += 1
+        if delay:
+            time.sleep(delay)
+
+        if throttle:
+            return 429, {"Retry-After": "1"}, b'{"message": "Rate Limit Exceeded"}'
+
+        parts = urlsplit(url)
+        for route_method, path, handler in self.routes:
+            match = path.fullmatch(parts.path)
+            if route_method == method and match:
+                status, body = handler(match, parse_qs(parts.query), headers or {})
+                if not isinstance(body, bytes):
+                    body = json.dumps(body).encode()
+                return status, {"Content-Type": "application/json"}, body
+        return 404, {"Content-Type": "application/json"}, b'{"message": "Not Found"}'
+
+    def _handler_class(self):
+        server = self
+
+        class RequestHandler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _respond(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                if length:
+                    self.rfile.read(length)
+                status, headers, body = server.respond(
+                    self.command, self.path, dict(self.headers)
+                )
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            do_GET = do_POST = do_PUT = do_DELETE = _respond
+
+            def log_message(self, format, *args):
+                pass
+
+        return RequestHandler
+
+
+@contextmanager
+def redirect(hosts: Dict[str, str]):
+    """
+    Send every requests call for the given hosts (e.g. www.strava.com) to the fake
+    servers' URLs instead, whichever session or client makes it.
+    """
+    send = HTTPAdapter.send
+
+    def redirected_send(adapter, request, **kwargs):
+        parts = urlsplit(request.url)
+        if parts.hostname in hosts:
+            scheme, netloc = urlsplit(hosts[parts.hostname])[:2]
+            request.url = urlunsplit((scheme, netloc) + tuple(parts[2:]))
+        return send(adapter, request, **kwargs)
+
+    with patch.object(HTTPAdapter, "send", redirected_send):
+        yield
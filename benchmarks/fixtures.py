@@ -0,0 +1,245 @@
+"""
+Strava and Visual Crossing responses for the benchmarks, made from the recorded JSON
+in fixtures/ scaled up to the sizes being measured.
+"""
+
+import json
+import os
+import threading
+from copy import deepcopy
+from datetime import date, datetime, timedelta, timezone
+from functools import lru_cache
+from typing import Any, Dict, List, Tuple
+
+from freezing.model.msg.mq import ActivityUpdate, ActivityUpdateSchema
+from freezing.model.msg.strava import AspectType
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+
+# Strava reports local times as if they were UTC; the fixtures are in US Eastern time.
+LOCAL_OFFSET = timedelta(hours=-5)
+
+# Fields of a DetailedActivity that a SummaryActivity (as listed) doesn't have.
+_DETAIL_ONLY = ["segment_efforts", "photos", "description", "calories", "device_name"]
+
+
+@lru_cache(maxsize=None)
+def _load(name: str) -> Any:
+    with open(os.path.join(FIXTURES_DIR, name)) as file:
+        return json.load(file)
+
+
+def load(name: str) -> Any:
+    """
+    :return: A copy of the fixture, free to modify.
+    """
+    return deepcopy(_load(name))
+
+
+def _iso(t: datetime) -> str:
+    return t.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def detailed_activity(
+    activity_id: int, athlete_id: int, start: datetime, efforts: int = 5
+) -> Dict[str, Any]:
+    """
+    The recorded activity, as another ride.
+
+    :param start: When the ride started (UTC).
+    :param efforts: How many segment efforts it has (the recorded ones, repeated).
+    """
+    activity = load("strava_activity.json")
+    activity["id"] = activity_id
+    activity["athlete"]["id"] = athlete_id
+    activity["start_date"] = _iso(start)
+    activity["start_date_local"] = _iso(start + LOCAL_OFFSET)
+    recorded = activity["segment_efforts"]
+    activity["segment_efforts"] = []
+    for i in range(efforts):
+        effort = deepcopy(recorded[i % len(recorded)])
+        effort["id"] = activity_id * 1000 + i
+        effort["activity"]["id"] = activity_id
+        effort["athlete"]["id"] = athlete_id
+        activity["segment_efforts"].append(effort)
+    return activity
+
+
+def summary_activity(
+    activity_id: int, athlete_id: int, start: datetime
+) -> Dict[str, Any]:
+    """
+    The recorded activity as listed (without its efforts and photos), as another ride.
+    """
+    activity = detailed_activity(activity_id, athlete_id, start, efforts=0)
+    for field in _DETAIL_ONLY:
+        activity.pop(field, None)
+    activity["resource_state"] = 2
+    return activity
+
+
+def streams(points: int = 1000) -> List[Dict[str, Any]]:
+    """
+    The recorded latlng, distance, time and altitude streams, extended to the number of
+    points by carrying on in the same direction.
+    """
+    recorded = {s["type"]: s for s in load("strava_streams.json")}
+    n = len(recorded["time"]["data"])
+    (lat0, lon0), (lat1, lon1) = recorded["latlng"]["data"][:2]
+    step = (lat1 - lat0, lon1 - lon0)
+
+    def extend(values, i):
+        laps, j = divmod(i, n)
+        return values[j] + laps * (values[-1] - values[0] + values[1] - values[0])
+
+    data = {
+        "latlng": [
+            [round(lat0 + i * step[0], 6), round(lon0 + i * step[1], 6)]
+            for i in range(points)
+        ],
+        "distance": [extend(recorded["distance"]["data"], i) for i in range(points)],
+        "time": [extend(recorded["time"]["data"], i) for i in range(points)],
+        "altitude": [recorded["altitude"]["data"][i % n] for i in range(points)],
+    }
+    return [
+        dict(recorded[kind], data=values, original_size=points)
+        for kind, values in data.items()
+    ]
+
+
+def timeline(days: List[date], latitude: float, longitude: float) -> Dict[str, Any]:
+    """
+    The recorded Visual Crossing timeline (hourly weather), for each of the days at the
+    location.
+    """
+    recorded = load("visualcrossing_timeline.json")
+    recorded_day = recorded.pop("days")[0]
+    recorded_date = date.fromisoformat(recorded_day["datetime"])
+    recorded.update(
+        latitude=latitude,
+        longitude=longitude,
+        address=f"{latitude},{longitude}",
+        resolvedAddress=f"{latitude},{longitude}",
+        days=[],
+    )
+    for day in days:
+        shift = (day - recorded_date).days * 86400
+        d = deepcopy(recorded_day)
+        d["datetime"] = day.isoformat()
+        for item in [d] + d["hours"]:
+            item["datetimeEpoch"] += shift
+        d["sunriseEpoch"] += shift
+        d["sunsetEpoch"] += shift
+        recorded["days"].append(d)
+    return recorded
+
+
+def activity_update(athlete_id: int, activity_id: int, operation: AspectType) -> str:
+    """
+    :return: The body of the webhook message (as freezing-nq queues it) for a change to
+             an activity.
+    """
+    return ActivityUpdateSchema().dumps(
+        ActivityUpdate(
+            athlete_id=athlete_id, activity_id=activity_id, operation=operation
+        )
+    )
+
+
+class StravaData(object):
+    """
+    The athletes and rides that the fake Strava API knows about.
+
+    Clients are told apart by their access token, which is "athlete-<athlete id>" (see
+    benchmarks.database.add_athlete).
+    """
+
+    def __init__(self, efforts: int = 5, stream_points: int = 1000):
+        self.efforts = efforts
+        self.stream_points = stream_points
+        self.lock = threading.Lock()
+        self.rides: Dict[int, Tuple[int, datetime]] = {}
+        self.next_id = 10_000_000_000
+
+    def add_rides(
+        self,
+        athlete_id: int,
+        count: int,
+        start: datetime,
+        every: timedelta = timedelta(hours=8),
+    ) -> List[int]:
+        """
+        Give the athlete rides from start onwards.
+
+        :return: The rides' (activity) ids.
+        """
+        with self.lock:
+            ids = list(range(self.next_id, self.next_id + count))
+            self.next_id += count
+            for i, activity_id in enumerate(ids):
+                self.rides[activity_id] = (athlete_id, start + i * every)
+        return ids
+
+    def routes(self):
+        return [
+            ("GET", r"/api/v3/athlete/activities", self.list_activities),
+            ("GET", r"/api/v3/activities/(\d+)", self.get_activity),
+            ("GET", r"/api/v3/activities/(\d+)/streams/[\w,]+", self.get_streams),
+            ("GET", r"/api/v3/activities/(\d+)/photos", self.get_photos),
+        ]
+
+    def _athlete_id(self, headers: Dict[str, str]) -> int:
+        token = headers.get("Authorization", "").rpartition(" ")[2]
+        return int(token.rpartition("-")[2] or 0)
+
+    def list_activities(self, match, query, headers):
+        athlete_id = self._athlete_id(headers)
+        after = datetime.fromtimestamp(int(query.get("after", [0])[0]), timezone.utc)
+        page = int(query.get("page", [1])[0])
+        per_page = int(query.get("per_page", [30])[0])
+        with self.lock:
+            rides = sorted(
+                (start, activity_id)
+                for activity_id, (athlete, start) in self.rides.items()
+                if athlete == athlete_id and start > after
+            )
+        rides = rides[(page - 1) * per_page : page * per_page]
+        return 200, [
+            summary_activity(activity_id, athlete_id, start)
+            for (start, activity_id) in rides
+        ]
+
+    def get_activity(self, match, query, headers):
+        ride = self.rides.get(int(match.group(1)))
+        if ride is None:
+            return 404, {"message": "Record Not Found"}
+        athlete_id, start = ride
+        return 200, detailed_activity(
+            int(match.group(1)), athlete_id, start, efforts=self.efforts
+        )
+
+    def get_streams(self, match, query, headers):
+        if int(match.group(1)) not in self.rides:
+            return 404, {"message": "Record Not Found"}
+        return 200, streams(self.stream_points)
+
+    def get_photos(self, match, query, headers):
+        return 200, []
+
+
+def visualcrossing_routes():
+    def get_timeline(match, query, headers):
+        latitude, longitude = (float(v) for v in match.group(1).split(","))
+        first = date.fromisoformat(match.group(2))
+        last = date.fromisoformat(match.group(3)) if match.group(3) else first
+        days = [first + timedelta(days=n) for n in range((last - first).days + 1)]
+        return 200, timeline(days, latitude, longitude)
+
+    return [
+        (
+            "GET",
+            r"/VisualCrossingWebServices/rest/services/timeline/([-\d.]+,[-\d.]+)"
+            r"/([\d-]+)(?:/([\d-]+))?",
+            get_timeline,
+        )
+    ]
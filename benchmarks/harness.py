@@ -0,0 +1,145 @@
+"""
+Registering, timing and comparing benchmarks.
+"""
+
+import fnmatch
+import math
+import platform
+import statistics
+import subprocess
+import time
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+
+class Benchmark(NamedTuple):
+    name: str
+    func: Callable[[Any], Optional[int]]
+    setup: Optional[Callable[[], Any]]
+    repeat: int
+    mysql_only: bool
+    description: str
+
+
+BENCHMARKS: Dict[str, Benchmark] = {}
+
+
+def benchmark(
+    name: str,
+    setup: Callable[[], Any] = None,
+    repeat: int = 5,
+    mysql_only: bool = False,
+):
+    """
+    Register a benchmark.
+
+    The function is timed on its own, once per repeat, after setup (which isn't timed)
+    has made whatever it works on; it gets what setup returned. It returns how many
+    items (rides, messages, ...) it got through, for the throughput.
+
+    :param mysql_only: Whether the benchmark needs MySQL (not the SQLite stand-in).
+    """
+
+    def decorator(func):
+        BENCHMARKS[name] = Benchmark(
+            name=name,
+            func=func,
+            setup=setup,
+            repeat=repeat,
+            mysql_only=mysql_only,
+            description=(func.__doc__ or "").strip().split("\n")[0],
+        )
+        return func
+
+    return decorator
+
+
+def select(patterns: List[str] = None) -> List[Benchmark]:
+    """
+    :return: The benchmarks whose names match any of the (glob) patterns, or else all
+             of them.
+    """
+    return [
+        b
+        for name, b in sorted(BENCHMARKS.items())
+        if not patterns or any(fnmatch.fnmatch(name, p) for p in patterns)
+    ]
+
+
+def run(bench: Benchmark, repeat: int = None) -> Dict[str, Any]:
+    """
+    :return: The timings (in seconds) of each run and their summary.
+    """
+    times = []
+    items = None
+    for _ in range(repeat or bench.repeat):
+        state = bench.setup() if bench.setup else None
+        start = time.perf_counter()
+        items = bench.func(state)
+        times.append(time.perf_counter() - start)
+    median = statistics.median(times)
+    return {
+        "times": times,
+        "min": min(times),
+        "median": median,
+        "items": items,
+        "per_second": items / median if items and median else None,
+    }
+
+
+def percentiles(values: List[float], points=(50, 90, 95, 99)) -> Dict[str, float]:
+    """
+    :return: The (nearest rank) percentiles of the values, as p50 and so on, and the
+             maximum.
+    """
+    ordered = sorted(values)
+    if not ordered:
+        return {}
+    summary = {
+        f"p{p}": ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)] for p in points
+    }
+    summary["max"] = ordered[-1]
+    return summary
+
+
+def environment(**extra) -> Dict[str, Any]:
+    """
+    :return: What the results were measured with: the commit, Python, and so on.
+    """
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return dict(commit=commit, python=platform.python_version(), **extra)
+
+
+def compare(
+    baseline: Dict[str, Any], results: Dict[str, Any], threshold: float = 0.1
+) -> List[Dict[str, Any]]:
+    """
+    Compare the median times of the benchmarks measured in both.
+
+    :param threshold: How much slower (as a fraction) counts as a regression.
+    :return: For each benchmark: its name, the baseline and new medians, the change (as
+             a fraction) and whether that is a regression.
+    """
+    comparison = []
+    for name, result in sorted(results["benchmarks"].items()):
+        before = baseline["benchmarks"].get(name)
+        if before is None:
+            continue
+        change = result["median"] / before["median"] - 1 if before["median"] else 0.0
+        comparison.append(
+            {
+                "name": name,
+                "baseline": before["median"],
+                "median": result["median"],
+                "change": change,
+                "regression": change > threshold,
+            }
+        )
+    return comparison
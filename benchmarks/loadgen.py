@@ -0,0 +1,401 @@
+"""
+A load generator for the activity update (webhook) tube.
+
+It queues a mix of ride creates, updates and deletes in a local beanstalkd. Subscribers
+running in this process handle them, against a stub Strava API that serves the recorded
+activity with injected latency and rate limiting (429s). It reports the throughput and
+the percentiles of the time from queueing each message to it being handled, so that the
+number of subscribers and their throttling can be tuned.
+
+    python -m benchmarks.loadgen --database mysql+pymysql://... --subscribers 4
+"""
+
+import argparse
+import json
+import logging
+import math
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import timedelta, timezone
+from typing import Dict, List, Tuple, Union
+
+import greenstalk
+from freezing.model.msg.mq import DefinedTubes
+from freezing.model.msg.strava import AspectType
+
+from . import fixtures
+from .harness import percentiles
+from .settings import configure
+
+# Well clear of real athletes' ids, in case the database isn't a scratch one.
+FIRST_ATHLETE_ID = 990_000_000
+
+OPERATIONS = {
+    "create": AspectType.create,
+    "update": AspectType.update,
+    "delete": AspectType.delete,
+}
+
+
+def parse_mix(value: str) -> Dict[str, float]:
+    """
+    :return: The weight of each operation, from e.g. "create=70,update=25,delete=5".
+    """
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f"Unknown operation {name!r}")
+        mix[name.strip()] = float(weight)
+    if sum(mix.values()) <= 0:
+        raise argparse.ArgumentTypeError("The mix needs some weight")
+    return mix
+
+
+def parse_latency(value: str) -> Union[float, Tuple[float, float]]:
+    """
+    :return: The latency in seconds, from milliseconds ("50") or a range ("20-200").
+    """
+    low, _, high = value.partition("-")
+    if high:
+        return float(low) / 1000, float(high) / 1000
+    return float(low) / 1000
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.loadgen",
+        description="Replay webhook traffic against in-process subscribers.",
+    )
+    parser.add_argument(
+        "--database",
+        required=True,
+        metavar="URL",
+        help="A scratch MySQL database with the freezing-model schema.",
+    )
+    parser.add_argument(
+        "--beanstalkd",
+        default="localhost:11300",
+        metavar="HOST:PORT",
+        help="The beanstalkd to queue the messages in (default localhost:11300).",
+    )
+    parser.add_argument(
+        "--tube",
+        default=f"{DefinedTubes.activity_update.value}-loadgen",
+        help="The tube to use (default %(default)s, so as not to disturb a real sync).",
+    )
+    parser.add_argument(
+        "--messages", type=int, default=200, help="How many messages to queue."
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=0,
+        help="Messages to queue per second (default 0: all at once).",
+    )
+    parser.add_argument(
+        "--mix",
+        type=parse_mix,
+        default=parse_mix("create=70,update=25,delete=5"),
+        help="The mix of operations (default create=70,update=25,delete=5).",
+    )
+    parser.add_argument(
+        "--athletes", type=int, default=20, help="How many athletes ride."
+    )
+    parser.add_argument(
+        "--subscribers", type=int, default=1, help="How many subscribers to run."
+    )
+    parser.add_argument(
+        "--throttle-delay",
+        type=float,
+        metavar="SECONDS",
+        help="How long each subscriber pauses after a message (default its own).",
+    )
+    parser.add_argument(
+        "--requeue-delay",
+        type=int,
+        default=1,
+        metavar="SECONDS",
+        help="How long a message that failed waits to be retried (default 1).",
+    )
+    parser.add_argument(
+        "--latency",
+        type=parse_latency,
+        default=parse_latency("50-300"),
+        metavar="MS",
+        help="How long Strava takes to respond: milliseconds, or a range to pick from "
+        "at random (default 50-300).",
+    )
+    parser.add_argument(
+        "--throttle-rate",
+        type=float,
+        default=0.02,
+        help="The fraction of Strava requests to answer with a 429 (default 0.02).",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=600,
+        metavar="SECONDS",
+        help="Give up on messages not handled by then (default 600).",
+    )
+    parser.add_argument("--seed", type=int, help="Seed the random choices.")
+    parser.add_argument(
+        "--output", metavar="FILE", help="Save the results (as JSON) to this file."
+    )
+    return parser
+
+
+class Tracker(object):
+    """
+    When each message was queued, and how long each one took to be handled (deleted
+    from the tube), including any retries.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.queued: Dict[int, Tuple[float, str]] = {}
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.retries = 0
+        self.first_queued = None
+        self.last_handled = None
+        self.all_queued = False
+        self.done = threading.Event()
+
+    def put(self, client: greenstalk.Client, body: str, operation: str):
+        with self.lock:
+            job_id = client.put(body)
+            now = time.perf_counter()
+            self.queued[job_id] = (now, operation)
+            if self.first_queued is None:
+                self.first_queued = now
+
+    def finished_queueing(self):
+        with self.lock:
+            self.all_queued = True
+            if not self.queued:
+                self.done.set()
+
+    def handled(self, job_id: int):
+        with self.lock:
+            now = time.perf_counter()
+            queued = self.queued.pop(job_id, None)
+            if queued is None:
+                # Left in the tube by an earlier run.
+                return
+            start, operation = queued
+            self.latencies[operation].append(now - start)
+            self.last_handled = now
+            if self.all_queued and not self.queued:
+                self.done.set()
+
+    def retried(self):
+        with self.lock:
+            self.retries += 1
+
+
+class TrackingClient(object):
+    """
+    A subscriber's beanstalkd client, telling the tracker what happens to the messages.
+
+    Reserves time out after a second rather than the subscriber's thirty, so that the
+    subscribers stop promptly at the end.
+    """
+
+    def __init__(self, client: greenstalk.Client, tracker: Tracker):
+        self.client = client
+        self.tracker = tracker
+
+    def reserve(self, timeout: int = None):
+        return self.client.reserve(timeout=min(timeout or 1, 1))
+
+    def delete(self, job):
+        self.client.delete(job)
+        self.tracker.handled(job.id)
+
+    def release(self, job, **kwargs):
+        self.tracker.retried()
+        self.client.release(job, **kwargs)
+
+
+def plan(
+    strava: fixtures.StravaData,
+    athlete_ids: List[int],
+    mix: Dict[str, float],
+    messages: int,
+    rng: random.Random,
+) -> List[Tuple[str, str]]:
+    """
+    Give the athletes rides on the stub Strava, and choose what happens to them: new
+    rides are created, and rides created earlier are updated or deleted.
+
+    :return: The operation and body of each message.
+    """
+    from freezing.sync.config import config
+
+    start = config.START_DATE.astimezone(timezone.utc) + timedelta(days=1)
+    per_athlete = math.ceil(messages / len(athlete_ids))
+    # Spread the rides over the competition, but never so close that they overlap.
+    every = max(
+        timedelta(hours=1),
+        min(timedelta(hours=8), (config.END_DATE - start) / (per_athlete + 1)),
+    )
+    fresh = [
+        (athlete_id, activity_id)
+        for athlete_id in athlete_ids
+        for activity_id in strava.add_rides(athlete_id, per_athlete, start, every)
+    ]
+    rng.shuffle(fresh)
+
+    created = []
+    planned = []
+    names, weights = zip(*mix.items())
+    for _ in range(messages):
+        operation = rng.choices(names, weights)[0]
+        if operation == "create" or not created:
+            operation = "create"
+            ride = fresh.pop()
+            created.append(ride)
+        else:
+            ride = rng.choice(created)
+            if operation == "delete":
+                created.remove(ride)
+        athlete_id, activity_id = ride
+        planned.append(
+            (
+                operation,
+                fixtures.activity_update(
+                    athlete_id, activity_id, OPERATIONS[operation]
+                ),
+            )
+        )
+    return planned
+
+
+def report(tracker: Tracker, server, args) -> Dict:
+    latencies = [t for times in tracker.latencies.values() for t in times]
+    handled = len(latencies)
+    elapsed = (
+        tracker.last_handled - tracker.first_queued if tracker.last_handled else 0.0
+    )
+    results = {
+        "messages": args.messages,
+        "handled": handled,
+        "retries": tracker.retries,
+        "subscribers": args.subscribers,
+        "elapsed": elapsed,
+        "per_second": handled / elapsed if elapsed else None,
+        "strava_requests": server.requests,
+        "strava_throttled": server.throttled,
+        "latency": {"all": percentiles(latencies)},
+    }
+    for operation, times in sorted(tracker.latencies.items()):
+        results["latency"][operation] = percentiles(times)
+
+    print(
+        f"Handled {handled} of {args.messages} messages in {elapsed:.1f}s with "
+        f"{args.subscribers} subscribers: {results['per_second'] or 0:.2f} messages/s, "
+        f"{tracker.retries} retries"
+    )
+    print(f"Strava answered {server.requests} requests, {server.throttled} with a 429")
+    print(
+        "\n{:<10} {:>8} {:>8} {:>8} {:>8} {:>8}".format(
+            "latency", "p50", "p90", "p95", "p99", "max"
+        )
+    )
+    for operation, summary in results["latency"].items():
+        if summary:
+            print(
+                "{:<10} {p50:>7.2f}s {p90:>7.2f}s {p95:>7.2f}s {p99:>7.2f}s "
+                "{max:>7.2f}s".format(operation, **summary)
+            )
+    return results
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+    rng = random.Random(args.seed)
+
+    configure(
+        tempfile.mkdtemp(prefix="freezing-loadgen-"),
+        args.database,
+        REQUEUE_DELAY=str(args.requeue_delay),
+    )
+
+    from freezing.sync.subscribe import ActivityUpdateSubscriber
+
+    from .database import add_athlete, stand_in
+    from .fakeserver import FakeServer, redirect
+
+    if stand_in(args.database) != "mysql":
+        print("The subscriber needs MySQL: pass --database with a MySQL URL.")
+        return 2
+
+    strava = fixtures.StravaData()
+    athlete_ids = [FIRST_ATHLETE_ID + n for n in range(args.athletes)]
+    for athlete_id in athlete_ids:
+        add_athlete(athlete_id)
+    messages = plan(strava, athlete_ids, args.mix, args.messages, rng)
+
+    host, _, port = args.beanstalkd.partition(":")
+    address = (host, int(port or 11300))
+    tracker = Tracker()
+    shutdown_event = threading.Event()
+    server = FakeServer(
+        strava.routes(),
+        latency=args.latency,
+        throttle_rate=args.throttle_rate,
+        seed=args.seed,
+    )
+
+    with server, redirect({"www.strava.com": server.url}):
+        subscribers = []
+        for n in range(args.subscribers):
+            subscriber = ActivityUpdateSubscriber(
+                TrackingClient(greenstalk.Client(address, watch=args.tube), tracker),
+                shutdown_event,
+            )
+            if args.throttle_delay is not None:
+                subscriber._THROTTLE_DELAY = args.throttle_delay
+            thread = threading.Thread(
+                target=subscriber.run_forever, name=f"subscriber-{n}", daemon=True
+            )
+            thread.start()
+            subscribers.append(thread)
+
+        counts = Counter(operation for operation, _ in messages)
+        print(
+            "Queueing {} messages ({}) for {} subscribers".format(
+                len(messages),
+                ", ".join(f"{op} {count}" for op, count in counts.items()),
+                args.subscribers,
+            )
+        )
+        with greenstalk.Client(address, use=args.tube) as producer:
+            begun = time.perf_counter()
+            for i, (operation, body) in enumerate(messages):
+                if args.rate:
+                    time.sleep(max(0.0, begun + i / args.rate - time.perf_counter()))
+                tracker.put(producer, body, operation)
+        tracker.finished_queueing()
+
+        if not tracker.done.wait(args.timeout):
+            print(f"Gave up waiting after {args.timeout}s")
+        shutdown_event.set()
+        for thread in subscribers:
+            thread.join()
+
+    results = report(tracker, server, args)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,28 @@
+"""
+The configuration the benchmarks run with.
+"""
+
+import os
+
+
+def configure(workdir: str, database: str = None, **settings: str):
+    """
+    Set up the environment the configuration is read from, before anything reads it:
+    caches and state in workdir, and a competition the fixtures' rides fall in.
+
+    :param settings: Any other settings, by environment variable.
+    """
+    os.environ.update(
+        SQLALCHEMY_URL=database or "sqlite://",
+        STRAVA_CLIENT_ID="0",
+        STRAVA_CLIENT_SECRET="benchmark",
+        STRAVA_ACTIVITY_CACHE_DIR=os.path.join(workdir, "activities"),
+        VISUAL_CROSSING_API_KEY="benchmark",
+        VISUAL_CROSSING_CACHE_DIR=os.path.join(workdir, "weather"),
+        SYNC_STATE_DIR=os.path.join(workdir, "state"),
+        START_DATE="2025-01-01T00:00:00-05:00",
+        END_DATE="2025-03-20T00:01:00-04:00",
+        **settings,
+    )
+    for name in ("STRAVA_ACTIVITY_CACHE_DIR", "SYNC_STATE_DIR"):
+        os.makedirs(os.environ[name], exist_ok=True)
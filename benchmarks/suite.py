@@ -0,0 +1,270 @@
+"""
+The benchmarks themselves.
+
+Importing this reads the configuration, so the environment has to be set up first (see
+benchmarks.__main__).
+"""
+
+import itertools
+import tempfile
+import threading
+from datetime import datetime, timedelta, timezone
+
+import greenstalk
+from freezing.model import meta
+from freezing.model.msg.strava import AspectType
+from stravalib.model import DetailedActivity, Stream
+
+from freezing.sync.config import config
+from freezing.sync.data.activity import ActivitySync
+from freezing.sync.data.streams import StreamSync
+from freezing.sync.subscribe import ActivityUpdateSubscriber
+from freezing.sync.utils.cache import CachingActivityFetcher
+from freezing.sync.wx.aggregate import RideWeatherAggregator
+from freezing.sync.wx.visualcrossing.api import HistoVisualCrossing
+from freezing.sync.wx.visualcrossing.cache import DayCache
+from freezing.sync.wx.visualcrossing.model import Forecast
+
+from . import fixtures
+from .database import add_athlete
+from .harness import benchmark
+
+# How much each benchmark works through.
+RIDES = 100
+EFFORTS = 100
+STREAM_POINTS = 5000
+WEATHER_RIDES = 500
+WEATHER_LOCATIONS = 20
+CACHED_OBJECTS = 200
+MESSAGES = 50
+
+# What the fake Strava API serves (see benchmarks.__main__).
+strava = fixtures.StravaData(efforts=5, stream_points=1000)
+
+_athlete_ids = itertools.count(1000)
+
+
+def _first_ride() -> datetime:
+    return config.START_DATE.astimezone(timezone.utc) + timedelta(days=1, hours=12)
+
+
+def _athlete_with_rides(count: int):
+    athlete = add_athlete(next(_athlete_ids))
+    ids = strava.add_rides(athlete.id, count, start=_first_ride())
+    return athlete, ids
+
+
+def _ride(efforts: int = 5):
+    """
+    :return: A ride written to the database, and the activity it was written from.
+    """
+    athlete, (activity_id,) = _athlete_with_rides(1)
+    activity = DetailedActivity.model_validate(
+        fixtures.detailed_activity(
+            activity_id, athlete.id, _first_ride(), efforts=efforts
+        )
+    )
+    ride = ActivitySync().write_ride(activity)
+    meta.scoped_session().commit()
+    return activity, ride
+
+
+def _sync_new_setup():
+    athlete, _ = _athlete_with_rides(RIDES)
+    return athlete
+
+
+@benchmark("sync_rides.new", setup=_sync_new_setup)
+def sync_rides_new(athlete):
+    """
+    List an athlete's rides from Strava and write them all (none stored yet).
+    """
+    ActivitySync()._sync_rides(
+        start_date=config.START_DATE, end_date=config.END_DATE, athlete=athlete
+    )
+    return RIDES
+
+
+def _sync_unchanged_setup():
+    athlete = _sync_new_setup()
+    sync_rides_new(athlete)
+    return athlete
+
+
+@benchmark("sync_rides.unchanged", setup=_sync_unchanged_setup)
+def sync_rides_unchanged(athlete):
+    """
+    List an athlete's rides from Strava and find them all already stored.
+    """
+    return sync_rides_new(athlete)
+
+
+@benchmark("write_ride_efforts", setup=lambda: _ride(efforts=EFFORTS))
+def write_ride_efforts(activity_and_ride):
+    """
+    Replace a ride's segment efforts.
+    """
+    activity, ride = activity_and_ride
+    ActivitySync().write_ride_efforts(activity, ride)
+    meta.scoped_session().commit()
+    return EFFORTS
+
+
+def _streams_setup():
+    _, ride = _ride()
+    streams = [Stream.model_validate(s) for s in fixtures.streams(STREAM_POINTS)]
+    return streams, ride
+
+
+@benchmark("write_ride_streams", setup=_streams_setup)
+def write_ride_streams(streams_and_ride):
+    """
+    Replace a ride's GPS track.
+    """
+    streams, ride = streams_and_ride
+    StreamSync().write_ride_streams(streams, ride)
+    meta.scoped_session().commit()
+    return STREAM_POINTS
+
+
+def _weather_setup():
+    first = _first_ride()
+    forecast = Forecast(
+        fixtures.timeline(
+            [(first + timedelta(days=n)).date() for n in range(3)], 38.88, -77.07
+        )
+    )
+    rides = [
+        (
+            first + timedelta(minutes=7 * n),
+            first + timedelta(minutes=7 * n + 45 + n % 90),
+            2400.0,
+        )
+        for n in range(WEATHER_RIDES)
+    ]
+    return forecast, rides
+
+
+@benchmark("weather.aggregate", setup=_weather_setup)
+def weather_aggregate(forecast_and_rides):
+    """
+    Summarize the weather during rides from a three day forecast.
+    """
+    forecast, rides = forecast_and_rides
+    aggregator = RideWeatherAggregator(forecast.hours)
+    for start, end, moving_time in rides:
+        aggregator.aggregate(start=start, end=end, moving_time=moving_time)
+    return len(rides)
+
+
+def _weather_fetch_setup():
+    return HistoVisualCrossing(
+        api_key=config.VISUAL_CROSSING_API_KEY, cache_dir=tempfile.mkdtemp()
+    )
+
+
+@benchmark("weather.fetch", setup=_weather_fetch_setup)
+def weather_fetch(api):
+    """
+    Fetch and cache three days of weather for each of a number of locations.
+    """
+    first = _first_ride()
+    for n in range(WEATHER_LOCATIONS):
+        api.histo_forecast_range(
+            start=first,
+            end=first + timedelta(days=2),
+            latitude=round(38.8 + n * 0.01, 4),
+            longitude=-77.07,
+        )
+    return WEATHER_LOCATIONS
+
+
+def _weather_cache_setup():
+    cache = DayCache(tempfile.mkdtemp())
+    first = _first_ride().date()
+    days = [first + timedelta(days=n) for n in range(CACHED_OBJECTS)]
+    forecast = Forecast(fixtures.timeline(days, 38.88, -77.07))
+    for day in forecast.days:
+        cache.write(-77.07, 38.88, 23, forecast, day)
+    return cache, days
+
+
+@benchmark("cache.weather_read", setup=_weather_cache_setup)
+def cache_weather_read(cache_and_days):
+    """
+    Read days of weather from the cache.
+    """
+    cache, days = cache_and_days
+    for day in days:
+        cache.read(-77.07, 38.88, day, 12)
+    return len(days)
+
+
+def _activity_cache_setup():
+    fetcher = CachingActivityFetcher(cache_basedir=tempfile.mkdtemp(), client=None)
+    for n in range(CACHED_OBJECTS):
+        fetcher.cache_object_json(
+            athlete_id=1,
+            object_id=n,
+            object_json=fixtures.detailed_activity(n, 1, _first_ride()),
+        )
+    return fetcher
+
+
+@benchmark("cache.activity_read", setup=_activity_cache_setup)
+def cache_activity_read(fetcher):
+    """
+    Read activities from the cache and parse them.
+    """
+    for n in range(CACHED_OBJECTS):
+        fetcher.fetch(athlete_id=1, object_id=n, only_cache=True)
+    return CACHED_OBJECTS
+
+
+class QueueClient(object):
+    """
+    Just enough of a beanstalkd client for the subscriber, with the jobs in memory. The
+    subscriber is told to stop once they have all been handled.
+    """
+
+    def __init__(self, bodies, shutdown_event: threading.Event):
+        self.jobs = [greenstalk.Job(id=n, body=body) for n, body in enumerate(bodies)]
+        self.shutdown_event = shutdown_event
+        self.released = 0
+
+    def reserve(self, timeout=None):
+        if not self.jobs:
+            self.shutdown_event.set()
+            raise greenstalk.TimedOutError()
+        return self.jobs.pop(0)
+
+    def delete(self, job):
+        pass
+
+    def release(self, job, delay=0):
+        self.released += 1
+
+
+def _subscriber_setup():
+    athlete, ids = _athlete_with_rides(MESSAGES)
+    bodies = [
+        fixtures.activity_update(athlete.id, activity_id, AspectType.create)
+        for activity_id in ids
+    ]
+    shutdown_event = threading.Event()
+    subscriber = ActivityUpdateSubscriber(
+        QueueClient(bodies, shutdown_event), shutdown_event
+    )
+    # Measure the work, not the pause the subscriber takes to spare the rate limit.
+    subscriber._THROTTLE_DELAY = 0
+    return subscriber
+
+
+@benchmark("subscriber.throughput", setup=_subscriber_setup, mysql_only=True)
+def subscriber_throughput(subscriber):
+    """
+    Handle webhook messages for new rides: fetch and store each one's detail, streams
+    and photos.
+    """
+    subscriber.run_forever()
+    return MESSAGES - subscriber.client.released
@@ -7,6 +7,7 @@ from freezing.model import init_model
 
 from freezing.sync.config import config, init_logging
 from freezing.sync.exc import CommandError
+from freezing.sync.profiling import profiled
 
 
 class BaseCommand(metaclass=abc.ABCMeta):
@@ -52,6 +53,19 @@ class BaseCommand(metaclass=abc.ABCMeta):
             help="Whether to output logs with color.",
         )
 
+        parser.add_argument(
+            "--profile",
+            action="store_true",
+            default=False,
+            help="Profile the command and log where the time went.",
+        )
+
+        parser.add_argument(
+            "--profile-output",
+            help="Also save the profile to this file (or directory), for pstats.",
+            metavar="PATH",
+        )
+
         return parser
 
     def parse(self, args=None):
@@ -90,7 +104,11 @@ class BaseCommand(metaclass=abc.ABCMeta):
         init_model(sqlalchemy_url=config.SQLALCHEMY_URL)
 
         try:
-            self.execute(args)
+            if args.profile or args.profile_output:
+                with profiled(self.name, self.logger, output=args.profile_output):
+                    self.execute(args)
+            else:
+                self.execute(args)
         except CommandError as ce:
             parser.error(str(ce))
             raise SystemExit(127)
@@ -27,11 +27,27 @@ class SyncAthletesScript(BaseCommand):
             metavar="NUM",
         )
 
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            default=False,
+            help="Update athletes even if nothing has changed on Strava.",
+        )
+
+        parser.add_argument(
+            "--due-only",
+            action="store_true",
+            default=False,
+            help="Only refresh the athletes that are due (new, teamless or stale).",
+        )
+
         return parser
 
     def execute(self, args):
         fetcher = AthleteSync(logger=self.logger)
-        fetcher.sync_athletes(max_records=args.max_records)
+        fetcher.sync_athletes(
+            max_records=args.max_records, force=args.force, due_only=args.due_only
+        )
 
 
 def main():
@@ -0,0 +1,47 @@
+from datetime import timedelta
+
+from freezing.sync.cli import BaseCommand
+from freezing.sync.data.tokens import TokenSync
+
+
+class SyncTokensScript(BaseCommand):
+    """
+    Refreshes the Strava access tokens that are about to expire.
+    """
+
+    name = "sync-tokens"
+    description = "Refresh expiring Strava access tokens."
+
+    def build_parser(self):
+        parser = super().build_parser()
+
+        parser.add_argument(
+            "--window",
+            type=int,
+            help="Refresh tokens that expire within this many minutes.",
+            metavar="MINUTES",
+        )
+
+        parser.add_argument(
+            "--max-records",
+            type=int,
+            help="Limit number of tokens to refresh.",
+            metavar="NUM",
+        )
+
+        return parser
+
+    def execute(self, args):
+        sync = TokenSync(logger=self.logger)
+        sync.refresh_tokens(
+            window=timedelta(minutes=args.window) if args.window else None,
+            max_records=args.max_records,
+        )
+
+
+def main():
+    SyncTokensScript().run()
+
+
+if __name__ == "__main__":
+    main()
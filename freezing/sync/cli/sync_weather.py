@@ -29,6 +29,21 @@ class SyncWeatherScript(BaseCommand):
             help="Whether to only use existing cache.",
         )
 
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            default=False,
+            help="Look for rides missing weather back to the start of the competition, "
+            "not just the last WEATHER_BACKLOG_DAYS.",
+        )
+
+        parser.add_argument(
+            "--prefetch",
+            action="store_true",
+            default=False,
+            help="Just warm the cache for yesterday where people have been riding.",
+        )
+
         parser.add_argument(
             "--limit",
             type=int,
@@ -40,8 +55,14 @@ class SyncWeatherScript(BaseCommand):
 
     def execute(self, args):
         fetcher = WeatherSync(logger=self.logger)
+        if args.prefetch:
+            fetcher.prefetch_weather()
+            return
         fetcher.sync_weather(
-            clear=args.clear, cache_only=args.cache_only, limit=args.limit
+            clear=args.clear,
+            cache_only=args.cache_only,
+            limit=args.limit,
+            full=args.all,
         )
 
 
@@ -26,11 +26,123 @@ class Config:
     STRAVA_ACTIVITY_CACHE_DIR = env(
         "STRAVA_ACTIVITY_CACHE_DIR", default="/data/cache/activities"
     )
+    # Tokens that expire within STRAVA_TOKEN_REFRESH_WINDOW are refreshed in the
+    # background every STRAVA_TOKEN_REFRESH_INTERVAL. Strava only issues a new token once
+    # the old one has under an hour left, so the window is capped at an hour. Clients
+    # only refresh inline when a token is two intervals past that, i.e. the background
+    # refresh has fallen behind.
+    STRAVA_TOKEN_REFRESH_WINDOW: timedelta = env(
+        "STRAVA_TOKEN_REFRESH_WINDOW_MINUTES",
+        cast=int,
+        default=60,
+        postprocessor=lambda val: timedelta(minutes=val),
+    )
+    STRAVA_TOKEN_REFRESH_INTERVAL: timedelta = env(
+        "STRAVA_TOKEN_REFRESH_INTERVAL_MINUTES",
+        cast=int,
+        default=15,
+        postprocessor=lambda val: timedelta(minutes=val),
+    )
+
+    # How many athletes' photos to list from Strava at once.
+    PHOTO_SYNC_CONCURRENCY = env("PHOTO_SYNC_CONCURRENCY", cast=int, default=4)
+    # Photos are refetched after a detail fetch when the ride's photo count or primary
+    # photo changes, and otherwise at most this often (to catch caption edits).
+    PHOTO_REFRESH_MAX_AGE: timedelta = env(
+        "PHOTO_REFRESH_MAX_AGE_HOURS",
+        cast=int,
+        default=24,
+        postprocessor=lambda val: timedelta(hours=val),
+    )
 
     VISUAL_CROSSING_API_KEY = env("VISUAL_CROSSING_API_KEY")
     VISUAL_CROSSING_CACHE_DIR = env(
         "VISUAL_CROSSING_CACHE_DIR", default="/data/cache/weather"
     )
+    VISUAL_CROSSING_CONCURRENCY = env(
+        "VISUAL_CROSSING_CONCURRENCY", cast=int, default=4
+    )
+    VISUAL_CROSSING_SNAP_RADIUS_KM = env(
+        "VISUAL_CROSSING_SNAP_RADIUS_KM", cast=float, default=8.0
+    )
+    VISUAL_CROSSING_FALLBACK_RADIUS_KM = env(
+        "VISUAL_CROSSING_FALLBACK_RADIUS_KM", cast=float, default=50.0
+    )
+    VISUAL_CROSSING_FALLBACK_DAYS = env(
+        "VISUAL_CROSSING_FALLBACK_DAYS", cast=int, default=1
+    )
+
+    # The hourly weather sync looks for rides missing weather from this many days back,
+    # and a full sync once a day (at this local hour) goes back to the competition start.
+    WEATHER_BACKLOG_DAYS = env("WEATHER_BACKLOG_DAYS", cast=int, default=3)
+    WEATHER_FULL_SYNC_HOUR = env("WEATHER_FULL_SYNC_HOUR", cast=int, default=3)
+
+    # Warm the weather cache once a day (at this local hour) for the locations of rides
+    # from the last few days.
+    WEATHER_PREFETCH_HOUR = env("WEATHER_PREFETCH_HOUR", cast=int, default=0)
+    WEATHER_PREFETCH_DAYS = env("WEATHER_PREFETCH_DAYS", cast=int, default=7)
+    WEATHER_PREFETCH_CONCURRENCY = env(
+        "WEATHER_PREFETCH_CONCURRENCY", cast=int, default=1
+    )
+
+    # Weather providers to use, in order of preference (only visualcrossing for now).
+    WEATHER_PROVIDERS = env(
+        "WEATHER_PROVIDERS", cast=list, subcast=str, default=["visualcrossing"]
+    )
+
+    # Per-provider least seconds between weather requests (e.g. "ncdc=1.0,wunder=6.0"),
+    # and how many times to retry a request that is rate limited or errors.
+    WX_MIN_REQUEST_INTERVAL = env(
+        "WX_MIN_REQUEST_INTERVAL", cast=dict, subcast=float, default={}
+    )
+    WX_MAX_RETRIES = env("WX_MAX_RETRIES", cast=int, default=3)
+
+    # Threads for each class of scheduled job (strava, weather), and whether to use
+    # MySQL advisory locks so that only one sync process runs each job at a time.
+    JOB_THREADS = env("JOB_THREADS", cast=dict, subcast=int, default={})
+    JOB_LOCKS = env("JOB_LOCKS", cast=bool, default=True)
+    # When several sync processes run, the athletes are split into SYNC_PARTITIONS
+    # partitions, which are leased out between them (see freezing.sync.partitions).
+    SYNC_PARTITIONS = env("SYNC_PARTITIONS", cast=int, default=1)
+    SYNC_PARTITION_HEARTBEAT = env(
+        "SYNC_PARTITION_HEARTBEAT_SECONDS", cast=int, default=30
+    )
+
+    SYNC_STATE_DIR = env("SYNC_STATE_DIR", default="/data/cache/state")
+
+    # Profile every scheduled job run, logging a summary and saving the profiles to
+    # PROFILE_DIR (if set).
+    PROFILE_JOBS = env("PROFILE_JOBS", cast=bool, default=False)
+    PROFILE_DIR = env("PROFILE_DIR", default=None)
+
+    FAILURE_RETRY_BASE: timedelta = env(
+        "FAILURE_RETRY_BASE_MINUTES",
+        cast=int,
+        default=60,
+        postprocessor=lambda val: timedelta(minutes=val),
+    )
+    FAILURE_RETRY_MAX: timedelta = env(
+        "FAILURE_RETRY_MAX_DAYS",
+        cast=int,
+        default=7,
+        postprocessor=lambda val: timedelta(days=val),
+    )
+
+    # Athletes are refreshed from Strava in slices of ATHLETE_REFRESH_BATCH: new athletes
+    # first, then those without a team every hour, then everyone else daily.
+    ATHLETE_REFRESH_BATCH = env("ATHLETE_REFRESH_BATCH", cast=int, default=50)
+    ATHLETE_REFRESH_INTERVAL: timedelta = env(
+        "ATHLETE_REFRESH_INTERVAL_HOURS",
+        cast=int,
+        default=24,
+        postprocessor=lambda val: timedelta(hours=val),
+    )
+    ATHLETE_UNRESOLVED_REFRESH_INTERVAL: timedelta = env(
+        "ATHLETE_UNRESOLVED_REFRESH_INTERVAL_MINUTES",
+        cast=int,
+        default=60,
+        postprocessor=lambda val: timedelta(minutes=val),
+    )
 
     COMPETITION_TEAMS = env("TEAMS", cast=list, subcast=int, default=[])
     OBSERVER_TEAMS = env("OBSERVER_TEAMS", cast=list, subcast=int, default=[])
@@ -1,13 +1,105 @@
 import abc
 import logging
+import threading
 import time
-from typing import Union
+from datetime import timedelta
+from typing import Dict, NamedTuple, Optional, Union
 
 from freezing.model import meta
 from freezing.model.orm import Athlete
 from stravalib import Client
+from stravalib.util.limiter import DefaultRateLimiter
 
 from freezing.sync.config import Config
+from freezing.sync.metrics import record_rate_limits, strava_response_hook
+
+# Strava only issues a new access token once the old one has less than this left.
+STRAVA_REFRESH_HORIZON = timedelta(hours=1)
+
+# However far behind the token sync is, refresh inline before a token has less than
+# this left, so that it doesn't expire part way through a sync.
+MIN_INLINE_REFRESH_MARGIN = timedelta(minutes=5)
+
+
+def inline_refresh_margin() -> timedelta:
+    """
+    How little time a token can have left before a client refreshes it inline.
+
+    The token sync refreshes every token as soon as Strava will, once every
+    STRAVA_TOKEN_REFRESH_INTERVAL, so a token it hasn't got to yet has at least the
+    horizon less one interval left. Clients leave it one more interval before stepping
+    in themselves.
+    """
+    return max(
+        STRAVA_REFRESH_HORIZON - 2 * Config.STRAVA_TOKEN_REFRESH_INTERVAL,
+        MIN_INLINE_REFRESH_MARGIN,
+    )
+
+
+class Token(NamedTuple):
+    access_token: str
+    refresh_token: str
+    expires_at: int
+
+
+class TokenCache(object):
+    """
+    The freshest Strava tokens we know of for each athlete, shared by everything in the
+    process, so that an Athlete loaded before the token sync refreshed its token still
+    gets the new one.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.tokens: Dict[int, Token] = {}
+
+    def get(self, athlete_id: int) -> Optional[Token]:
+        with self.lock:
+            return self.tokens.get(athlete_id)
+
+    def put(self, athlete_id: int, token: Token):
+        with self.lock:
+            current = self.tokens.get(athlete_id)
+            if current is None or (current.expires_at or 0) <= (token.expires_at or 0):
+                self.tokens[athlete_id] = token
+
+    def apply(self, athlete: Athlete) -> bool:
+        """
+        Give an athlete the cached token, if it is fresher than the one it has. (This
+        doesn't save the athlete: whoever cached the token already saved it.)
+
+        :return: Whether the athlete was updated.
+        """
+        token = self.get(athlete.id)
+        if token is None or (token.expires_at or 0) <= (athlete.expires_at or 0):
+            return False
+        athlete.access_token = token.access_token
+        athlete.refresh_token = token.refresh_token
+        athlete.expires_at = token.expires_at
+        return True
+
+
+token_cache = TokenCache()
+
+
+class SharedRateLimiter(object):
+    """
+    One stravalib rate limiter for every client in the process. Strava's rate limits
+    are per application rather than per athlete, so when clients for several athletes
+    are making requests at once they have to wait their turn together.
+    """
+
+    def __init__(self, limiter=None):
+        self.limiter = limiter or DefaultRateLimiter()
+        self.lock = threading.Lock()
+
+    def __call__(self, response_headers, method):
+        record_rate_limits(response_headers, method)
+        with self.lock:
+            self.limiter(response_headers, method)
+
+
+rate_limiter = SharedRateLimiter()
 
 
 class StravaClientForAthlete(Client):
@@ -31,16 +123,25 @@ class StravaClientForAthlete(Client):
                 raise ValueError(
                     "Athlete ID does not exist in database: {}".format(athlete_id)
                 )
+        # The token sync normally refreshes tokens before they get close to expiring, so
+        # this should mean there's nothing to refresh below.
+        token_cache.apply(athlete)
         super(StravaClientForAthlete, self).__init__(
-            access_token=athlete.access_token, rate_limit_requests=True
+            access_token=athlete.access_token,
+            rate_limit_requests=True,
+            rate_limiter=rate_limiter,
         )
+        # Time every request (rsession is stravalib's own, so it may not be there).
+        session = getattr(getattr(self, "protocol", None), "rsession", None)
+        if session is not None:
+            session.hooks["response"].append(strava_response_hook)
         self.refresh_access_token(athlete)
 
     def refresh_access_token(self, athlete: Athlete):
         assert athlete, "No athlete ID or Athlete object provided."
         if athlete.refresh_token is not None:
-            an_hour_from_now = time.time() + 60 * 60
-            if athlete.access_token is None or athlete.expires_at < an_hour_from_now:
+            stale = time.time() + inline_refresh_margin().total_seconds()
+            if athlete.access_token is None or athlete.expires_at < stale:
                 refresh_token = athlete.refresh_token
                 self.logger.info(
                     "access token for athlete %s is stale, expires_at=%s",
@@ -76,6 +177,10 @@ class StravaClientForAthlete(Client):
             athlete.expires_at = token_dict["expires_at"]
             meta.scoped_session().add(athlete)
             meta.scoped_session().commit()
+            token_cache.put(
+                athlete.id,
+                Token(athlete.access_token, athlete.refresh_token, athlete.expires_at),
+            )
 
 
 class BaseSync(metaclass=abc.ABCMeta):
@@ -1,5 +1,7 @@
 import logging
+import os
 import re
+from bisect import bisect_left, bisect_right
 from datetime import datetime, timedelta
 from typing import List, Optional
 
@@ -21,14 +23,24 @@ from freezing.sync.exc import (
     DataEntryError,
     IneligibleActivity,
 )
+from freezing.sync.partitions import leases
 from freezing.sync.utils import wktutils
 from freezing.sync.utils.cache import CachingActivityFetcher
+from freezing.sync.utils.failures import FailureLog
+from freezing.sync.utils.state import PartitionedState
 
 from . import BaseSync, StravaClientForAthlete
 
 # Amount of activity overlap to permit
 _overlap_ignore = timedelta(minutes=3)
 
+# Rides whose detail recently failed to fetch are left alone for a while (see FailureLog).
+_detail_failures_state = "detail-failures.json"
+
+# The photo count and primary photo each ride had when its photos were last queued for
+# a sync (see ActivitySync._photos_changed).
+_photo_fingerprints_state = "photo-fingerprints.json"
+
 
 class ActivitySync(BaseSync):
     name = "sync-activity"
@@ -333,11 +345,30 @@ class ActivitySync(BaseSync):
         if activity_id:
             q = q.filter(Ride.id == activity_id)
 
+        if not athlete_id and not activity_id:
+            q = q.filter(leases.clause(Ride.athlete_id))
+
+        failures = FailureLog(
+            os.path.join(config.SYNC_STATE_DIR, _detail_failures_state),
+            base_delay=config.FAILURE_RETRY_BASE,
+            max_delay=config.FAILURE_RETRY_MAX,
+            logger=self.logger,
+        )
+        if not rewrite and not activity_id:
+            # Asking for a ride explicitly (or a rewrite) tries it regardless.
+            backing_off = failures.backing_off()
+            if backing_off:
+                self.logger.info(
+                    "Skipping {} rides that recently failed".format(len(backing_off))
+                )
+                q = q.filter(Ride.id.notin_(backing_off))
+
         if max_records:
             self.logger.info("Limiting to {} records".format(max_records))
             q = q.limit(max_records)
 
         use_cache = use_cache or only_cache
+        photo_fingerprints = self._photo_fingerprints()
 
         self.logger.info("Fetching details for {} activities".format(q.count()))
 
@@ -359,17 +390,29 @@ class ActivitySync(BaseSync):
                     only_cache=only_cache,
                 )
 
-                self.update_ride_complete(strava_activity=strava_activity, ride=ride)
+                self.update_ride_complete(
+                    strava_activity=strava_activity,
+                    ride=ride,
+                    photo_fingerprints=photo_fingerprints,
+                )
 
                 session.commit()
+                failures.clear(ride.id, ride.athlete_id)
 
-            except Exception:
+            except Exception as x:
                 self.logger.exception(
                     "Error fetching/writing activity detail {}, athlete {}".format(
                         ride.id, ride.athlete
                     )
                 )
                 session.rollback()
+                failures.record(ride.id, ride.athlete_id, x)
+                # The ride's photos may or may not have been queued; make sure they are
+                # next time.
+                photo_fingerprints.for_athlete(ride.athlete_id).pop(str(ride.id))
+
+        failures.save()
+        photo_fingerprints.save()
 
     def delete_activity(self, *, athlete_id: int, activity_id: int):
         session = meta.scoped_session()
@@ -460,12 +503,19 @@ class ActivitySync(BaseSync):
                 )
                 raise
 
-    def update_ride_complete(self, strava_activity: DetailedActivity, ride: Ride):
+    def update_ride_complete(
+        self,
+        strava_activity: DetailedActivity,
+        ride: Ride,
+        photo_fingerprints: PartitionedState = None,
+    ):
         """
         Updates all ride data from a fully-populated Strava `Activity`.
 
         :param strava_activity: The Activity that has been populated from detailed fetch.
         :param ride: The database ride object to update.
+        :param photo_fingerprints: The photo fingerprints, when updating many rides
+                                   (otherwise they are loaded and saved here).
         """
         session = meta.scoped_session()
 
@@ -499,12 +549,65 @@ class ActivitySync(BaseSync):
             )
             raise
         ride.detail_fetched = True
-        # We don't get events when photo descriptions are updated, so instead
-        # every time we fetch the details we schedule a photo fetch. This will
-        # trigger alongside our automatic ride-effort re-sync. We don't gate
-        # this on activity.total_photo_count because if someone deletes their
-        # photos in Strava we probably want to resync and delete our photos.
-        ride.photos_fetched = False
+        # We don't get events when photos are added, removed or recaptioned, so instead
+        # we schedule a photo fetch when a detail fetch shows the photo count or primary
+        # photo has changed (including to no photos, so that we delete ours), and
+        # otherwise every PHOTO_REFRESH_MAX_AGE to pick up caption edits.
+        fingerprints = photo_fingerprints
+        if fingerprints is None:
+            # Only this ride's athlete's partition is needed.
+            fingerprints = self._photo_fingerprints(held=[])
+        if self._photos_changed(strava_activity, ride, fingerprints):
+            ride.photos_fetched = False
+        if photo_fingerprints is None:
+            fingerprints.save()
+
+    def _photo_fingerprints(self, held: List[int] = None) -> PartitionedState:
+        """
+        :param held: The partitions to load up front (see PartitionedState).
+        :return: The photo fingerprints, less those too old to matter any more.
+        """
+        fingerprints = PartitionedState(
+            os.path.join(config.SYNC_STATE_DIR, _photo_fingerprints_state),
+            held=held,
+            logger=self.logger,
+        )
+        expired = (datetime.utcnow() - config.PHOTO_REFRESH_MAX_AGE).isoformat()
+        for ride_id, entry in fingerprints.items():
+            if entry.get("queued", "") < expired:
+                fingerprints.discard(ride_id)
+        return fingerprints
+
+    def _photos_changed(
+        self,
+        strava_activity: DetailedActivity,
+        ride: Ride,
+        fingerprints: PartitionedState,
+    ) -> bool:
+        """
+        Whether a ride's photos need syncing after a detail fetch: because its photo
+        count or primary photo has changed since they were last queued, or because that
+        was over PHOTO_REFRESH_MAX_AGE ago. Records the fingerprint if so.
+        """
+        primary = strava_activity.photos.primary if strava_activity.photos else None
+        fingerprint = {
+            "count": strava_activity.total_photo_count or 0,
+            "primary": str(primary.unique_id) if primary else None,
+        }
+        now = datetime.utcnow()
+        expired = (now - config.PHOTO_REFRESH_MAX_AGE).isoformat()
+        fingerprints = fingerprints.for_athlete(ride.athlete_id)
+        entry = fingerprints.get(str(ride.id))
+        if (
+            entry
+            and entry.get("count") == fingerprint["count"]
+            and entry.get("primary") == fingerprint["primary"]
+            and entry.get("queued", "") >= expired
+        ):
+            self.logger.debug("Photos unchanged for {!r}".format(ride))
+            return False
+        fingerprints[str(ride.id)] = dict(fingerprint, queued=now.isoformat())
+        return True
 
     def check_activity(
         self,
@@ -668,37 +771,62 @@ class ActivitySync(BaseSync):
             )
         ]
 
-        # If this rider has overlapping rides, just select the largest ride. This is because when
-        # we run a full sync the database may be empty so we pull all rides from Strava then filter
-        # and then insert, so filtering can't look at the database.
-        def overlaps_larger(
-            activity: SummaryActivity, activities: List[SummaryActivity]
-        ):
-            overlaps = [
-                a
-                for a in activities
-                if a.id != activity.id
-                and "#nooverlap" not in a.name.lower()
-                and a.distance > activity.distance
-                and (
-                    a.start_date + _overlap_ignore
-                    <= activity.start_date + activity.elapsed_time.timedelta()
-                )
-                and (
-                    a.start_date + a.elapsed_time.timedelta()
-                    >= activity.start_date + _overlap_ignore
+        return self.exclude_overlapping_rides(filtered_rides)
+
+    def exclude_overlapping_rides(
+        self, activities: List[SummaryActivity]
+    ) -> List[SummaryActivity]:
+        """
+        If this rider has overlapping rides, just select the largest ride. This is because when
+        we run a full sync the database may be empty so we pull all rides from Strava then filter
+        and then insert, so filtering can't look at the database.
+
+        A ride is excluded if a larger (by distance) ride overlaps it by more than
+        _overlap_ignore, unless either has #nooverlap in its name. The rides are sorted
+        by start time once, so each ride is only compared with the rides that start
+        close enough to overlap it, rather than with every other ride.
+
+        :param activities: The rider's (eligible) activities.
+        :return: The activities not overlapped by a larger one, in the same order.
+        """
+        spans = [
+            (a.start_date, a.start_date + a.elapsed_time.timedelta())
+            for a in activities
+        ]
+        nooverlap = ["#nooverlap" in a.name.lower() for a in activities]
+
+        # The rides that can exclude others, by start time. Nothing that starts more than
+        # the longest of them before a ride can reach it.
+        candidates = sorted(
+            (i for i in range(len(activities)) if not nooverlap[i]),
+            key=lambda i: spans[i][0],
+        )
+        starts = [spans[i][0] for i in candidates]
+        longest = max(
+            (spans[i][1] - spans[i][0] for i in candidates), default=timedelta(0)
+        )
+
+        non_overlapping_rides = []
+        for i, activity in enumerate(activities):
+            start, end = spans[i]
+            overlaps = []
+            if not nooverlap[i]:
+                lo = bisect_left(starts, start + _overlap_ignore - longest)
+                hi = bisect_right(starts, end - _overlap_ignore)
+                overlaps = sorted(
+                    j
+                    for j in candidates[lo:hi]
+                    if activities[j].id != activity.id
+                    and activities[j].distance > activity.distance
+                    and spans[j][1] >= start + _overlap_ignore
                 )
-            ]
-            if overlaps and "#nooverlap" not in activity.name.lower():
-                overlap_ids = ", ".join([str(a.id) for a in overlaps])
+            if overlaps:
+                overlap_ids = ", ".join([str(activities[j].id) for j in overlaps])
                 self.logger.info(
                     f"Excluding ride {activity.id} because of overlap with {overlap_ids}"
                 )
-                return True
-
-        non_overlapping_rides = [
-            a for a in filtered_rides if not overlaps_larger(a, filtered_rides)
-        ]
+            else:
+                non_overlapping_rides.append(activity)
 
         return non_overlapping_rides
 
@@ -963,6 +1091,7 @@ class ActivitySync(BaseSync):
             q = sess.query(Athlete)
             q = q.filter(Athlete.access_token is not None)
             q = q.filter(func.mod(Athlete.id, total_segments) == segment)
+            q = q.filter(leases.clause(Athlete.id))
             athletes: List[Athlete] = q.all()
             self.logger.info(
                 "Selecting segment {} / {}, found {} athletes".format(
@@ -1,4 +1,9 @@
+import hashlib
+import json
+import os
+from collections import defaultdict
 from datetime import datetime
+from typing import Dict, List, Set
 
 from freezing.model import meta
 from freezing.model.orm import Athlete, Team
@@ -6,9 +11,46 @@ from stravalib import model as sm
 
 from freezing.sync.config import config
 from freezing.sync.exc import MultipleTeamsError, NoTeamsError
+from freezing.sync.partitions import leases
+from freezing.sync.utils.state import PartitionedState
 
 from . import BaseSync, StravaClientForAthlete
 
+# Fingerprints of what we last saw of each athlete on Strava (see athlete_fingerprint).
+FINGERPRINTS_STATE = "athlete-fingerprints.json"
+
+# When each athlete was last refreshed from Strava, and whether their team was unresolved.
+REFRESH_STATE = "athlete-refresh.json"
+
+# How many athletes to update between commits.
+COMMIT_BATCH_SIZE = 50
+
+
+def athlete_fingerprint(strava_athlete: sm.DetailedAthlete, all_done: bool) -> str:
+    """
+    A hash of everything about an athlete that registering them depends on: their name,
+    profile photo and clubs, plus the team configuration they are matched against.
+    """
+    clubs = (
+        None
+        if strava_athlete.clubs is None
+        else sorted(
+            [c.id, c.name, c.profile, c.cover_photo] for c in strava_athlete.clubs
+        )
+    )
+    fields = [
+        strava_athlete.id,
+        strava_athlete.firstname,
+        strava_athlete.lastname,
+        strava_athlete.profile,
+        clubs,
+        sorted(config.COMPETITION_TEAMS),
+        sorted(config.OBSERVER_TEAMS),
+        config.MAIN_TEAM,
+        all_done,
+    ]
+    return hashlib.sha1(json.dumps(fields, default=str).encode("utf-8")).hexdigest()
+
 
 class AthleteSync(BaseSync):
     name = "sync-athletes"
@@ -19,44 +61,168 @@ class AthleteSync(BaseSync):
         end_time = config.END_DATE
         return loc_time > end_time
 
-    def sync_athletes(self, max_records: int = None):
+    def sync_athletes(
+        self, max_records: int = None, force: bool = False, due_only: bool = False
+    ):
+        """
+        Update athletes (and their teams) from Strava.
+
+        Athletes whose Strava name, profile and clubs haven't changed since the last
+        sync are left alone, unless force is set.
+
+        :param max_records: The most athletes to update.
+        :param force: Update athletes even if nothing has changed.
+        :param due_only: Only refresh the athletes that are due (see due_athletes), up
+                         to max_records or ATHLETE_REFRESH_BATCH of them.
+        """
+        fingerprints = PartitionedState(
+            os.path.join(config.SYNC_STATE_DIR, FINGERPRINTS_STATE), logger=self.logger
+        )
+        schedule = PartitionedState(
+            os.path.join(config.SYNC_STATE_DIR, REFRESH_STATE), logger=self.logger
+        )
+        all_done = self.all_done()
+
         with meta.transaction_context() as sess:
             # We iterate over all of our athletes that have access tokens.
             # (We can't fetch anything for those that don't.)
 
             q = sess.query(Athlete)
-            q = q.filter(Athlete.access_token is not None)
-            if max_records:
-                self.logger.info("Limiting to {} records.".format(max_records))
-                q = q.limit(max_records)
+            q = q.filter(Athlete.access_token is not None, leases.clause(Athlete.id))
+            if due_only:
+                athletes = self.due_athletes(
+                    q.all(), schedule, limit=max_records or config.ATHLETE_REFRESH_BATCH
+                )
+                self.logger.info("{} athletes are due a refresh.".format(len(athletes)))
+            else:
+                if max_records:
+                    self.logger.info("Limiting to {} records.".format(max_records))
+                    q = q.limit(max_records)
+                athletes = q.all()
+
+            # Load every display name once, for checking new ones against.
+            display_names = defaultdict(set)
+            for athlete_id, display_name in sess.query(
+                Athlete.id, Athlete.display_name
+            ):
+                display_names[display_name].add(athlete_id)
+
+            # Fingerprints are only kept once the changes they describe are committed.
+            pending = {}
+            unchanged = 0
 
-            for athlete in q.all():
-                self.logger.info("Updating athlete: {0}".format(athlete))
+            def commit():
+                sess.commit()
+                for athlete_id, fingerprint in pending.items():
+                    fingerprints.for_athlete(athlete_id)[str(athlete_id)] = fingerprint
+                pending.clear()
+
+            for athlete in athletes:
+                self.logger.debug("Checking athlete: {0}".format(athlete))
+                refreshed = schedule.for_athlete(athlete.id).get(str(athlete.id)) or {}
+                unresolved = refreshed.get("unresolved", False)
                 try:
                     client = StravaClientForAthlete(athlete)
                     strava_athlete = client.get_athlete()
-                    self.register_athlete(strava_athlete, athlete.access_token)
-                    if not self.all_done():
-                        self.register_athlete_team(strava_athlete, athlete)
-                except NoTeamsError as ex:
-                    self.logger.info(
-                        f'Athlete "{athlete}" is not on a registered team: {ex}'
-                    )
-                except MultipleTeamsError as ex:
-                    self.logger.info(
-                        f'Athlete "{athlete}" is on multiple competition teams: {ex}'
-                    )
+                    fingerprint = athlete_fingerprint(strava_athlete, all_done)
+                    seen = fingerprints.for_athlete(athlete.id).get(str(athlete.id))
+                    if not force and seen == fingerprint:
+                        unchanged += 1
+                    else:
+                        self.logger.info("Updating athlete: {0}".format(athlete))
+                        # Team errors are down to the athlete's clubs, so there's no
+                        # point trying again until those change.
+                        pending[athlete.id] = fingerprint
+                        unresolved = False
+                        # Each athlete's changes go in a savepoint, flushed as it's
+                        # released, so that an error only rolls back this athlete's
+                        # rather than failing the batch's commit.
+                        with sess.begin_nested():
+                            self.register_athlete(
+                                strava_athlete, athlete.access_token, display_names
+                            )
+                            if not all_done:
+                                unresolved = not self._register_team(
+                                    strava_athlete, athlete
+                                )
                 except Exception:
+                    unresolved = True
+                    pending.pop(athlete.id, None)
                     self.logger.exception(
                         "Error registering athlete {0}".format(athlete), exc_info=True
                     )
 
+                schedule.for_athlete(athlete.id)[str(athlete.id)] = {
+                    "last_refreshed": datetime.utcnow().isoformat(),
+                    "unresolved": unresolved,
+                }
+
+                if len(pending) >= COMMIT_BATCH_SIZE:
+                    commit()
+
+            commit()
+
+        fingerprints.save()
+        schedule.save()
+        self.logger.info("{0} athletes were unchanged.".format(unchanged))
+
+    def _register_team(
+        self, strava_athlete: sm.DetailedAthlete, athlete: Athlete
+    ) -> bool:
+        """
+        register_athlete_team, logging (rather than raising) the athlete's team errors:
+        the athlete is still saved, just without a team.
+
+        :return: Whether the athlete's team was resolved.
+        """
+        try:
+            self.register_athlete_team(strava_athlete, athlete)
+            return True
+        except NoTeamsError as ex:
+            self.logger.info(f'Athlete "{athlete}" is not on a registered team: {ex}')
+        except MultipleTeamsError as ex:
+            self.logger.info(
+                f'Athlete "{athlete}" is on multiple competition teams: {ex}'
+            )
+        return False
+
+    def due_athletes(
+        self, athletes: List[Athlete], schedule: PartitionedState, limit: int
+    ) -> List[Athlete]:
+        """
+        Choose which athletes to refresh, most urgent first: athletes we have never
+        refreshed (e.g. because they just authorized), then those whose team we couldn't
+        work out last time (every ATHLETE_UNRESOLVED_REFRESH_INTERVAL), then everyone
+        else (every ATHLETE_REFRESH_INTERVAL). Within each, the longest ago goes first.
+        """
+        now = datetime.utcnow()
+        due = []
+        for athlete in athletes:
+            refreshed = schedule.for_athlete(athlete.id).get(str(athlete.id))
+            if refreshed is None:
+                due.append((0, datetime.min, athlete))
+                continue
+            last_refreshed = datetime.fromisoformat(refreshed["last_refreshed"])
+            if refreshed.get("unresolved"):
+                if last_refreshed <= now - config.ATHLETE_UNRESOLVED_REFRESH_INTERVAL:
+                    due.append((1, last_refreshed, athlete))
+            elif last_refreshed <= now - config.ATHLETE_REFRESH_INTERVAL:
+                due.append((2, last_refreshed, athlete))
+        due.sort(key=lambda d: (d[0], d[1]))
+        return [athlete for _, _, athlete in due[:limit]]
+
     def register_athlete(
-        self, strava_athlete: sm.DetailedAthlete, access_token: str
+        self,
+        strava_athlete: sm.DetailedAthlete,
+        access_token: str,
+        display_names: Dict[str, Set[int]] = None,
     ) -> Athlete:
         """
         Ensure specified athlete is added to database, returns athlete model.
 
+        :param display_names: The ids of the athletes using each display name, if
+                              already loaded (it is kept up to date). Otherwise the
+                              database is checked for conflicts.
         :return: The added athlete model object.
         :rtype: :class:`bafs.model.Athlete`
         """
@@ -72,6 +238,8 @@ class AthleteSync(BaseSync):
         athlete.access_token = access_token
 
         def already_exists(display_name) -> bool:
+            if display_names is not None:
+                return bool(display_names.get(display_name, set()) - {athlete.id})
             return (
                 session.query(Athlete)
                 .filter(Athlete.id != athlete.id)
@@ -91,6 +259,7 @@ class AthleteSync(BaseSync):
 
         # Only update the display name if it is either:
         # a new athlete, or the athlete name has changed
+        old_display_name = athlete.display_name
         try:
             if athlete_name != athlete.name:
                 self.logger.info(
@@ -106,6 +275,9 @@ class AthleteSync(BaseSync):
         finally:
             athlete.name = athlete_name
             session.add(athlete)
+            if display_names is not None:
+                display_names.get(old_display_name, set()).discard(athlete.id)
+                display_names.setdefault(athlete.display_name, set()).add(athlete.id)
         return athlete
 
     def register_athlete_team(
@@ -114,7 +286,8 @@ class AthleteSync(BaseSync):
         """
         Updates db with configured team that matches the athlete's teams.
 
-        Updates the passed-in Athlete model object with created/updated team.
+        Updates the passed-in Athlete model object with created/updated team. The
+        changes are left for the caller to commit.
 
         :param strava_athlete: The Strava model object for the athlete.
         :param athlete_model: The athlete model object.
@@ -129,58 +302,55 @@ class AthleteSync(BaseSync):
         self.logger.info(
             "Checking {0!r} against {1!r}".format(strava_athlete.clubs, all_teams)
         )
-        try:
-            if strava_athlete.clubs is None:
-                raise NoTeamsError(
-                    "Athlete {0} ({1} {2}): No clubs returned- {3}. {4}.".format(
-                        strava_athlete.id,
-                        strava_athlete.firstname,
-                        strava_athlete.lastname,
-                        "Full Profile Access required",
-                        "Please re-authorize",
-                    )
+        if strava_athlete.clubs is None:
+            raise NoTeamsError(
+                "Athlete {0} ({1} {2}): No clubs returned- {3}. {4}.".format(
+                    strava_athlete.id,
+                    strava_athlete.firstname,
+                    strava_athlete.lastname,
+                    "Full Profile Access required",
+                    "Please re-authorize",
                 )
-            matches = [c for c in strava_athlete.clubs if c.id in all_teams]
-            self.logger.debug("Matched: {0!r}".format(matches))
-            athlete_model.team = None
-            if len(matches) > 1:
-                # you can be on multiple teams
-                # as long as only one is an official team
-                matches = [c for c in matches if c.id not in config.OBSERVER_TEAMS]
-            if len(matches) > 1:
-                self.logger.info(
-                    "Multiple teams matched for {}: {}".format(
-                        strava_athlete,
-                        matches,
-                    )
+            )
+        matches = [c for c in strava_athlete.clubs if c.id in all_teams]
+        self.logger.debug("Matched: {0!r}".format(matches))
+        athlete_model.team = None
+        if len(matches) > 1:
+            # you can be on multiple teams
+            # as long as only one is an official team
+            matches = [c for c in matches if c.id not in config.OBSERVER_TEAMS]
+        if len(matches) > 1:
+            self.logger.info(
+                "Multiple teams matched for {}: {}".format(
+                    strava_athlete,
+                    matches,
                 )
-                raise MultipleTeamsError(matches)
-            if len(matches) == 0:
-                # Fall back to main team if it is the only team they are in
-                matches = [c for c in strava_athlete.clubs if c.id == config.MAIN_TEAM]
-            if len(matches) == 0:
-                raise NoTeamsError(
-                    "Athlete {0} ({1} {2}): {3} {4}".format(
-                        strava_athlete.id,
-                        strava_athlete.firstname,
-                        strava_athlete.lastname,
-                        "No teams matched ours. Teams defined:",
-                        strava_athlete.clubs,
-                    )
+            )
+            raise MultipleTeamsError(matches)
+        if len(matches) == 0:
+            # Fall back to main team if it is the only team they are in
+            matches = [c for c in strava_athlete.clubs if c.id == config.MAIN_TEAM]
+        if len(matches) == 0:
+            raise NoTeamsError(
+                "Athlete {0} ({1} {2}): {3} {4}".format(
+                    strava_athlete.id,
+                    strava_athlete.firstname,
+                    strava_athlete.lastname,
+                    "No teams matched ours. Teams defined:",
+                    strava_athlete.clubs,
                 )
-            else:
-                club = matches[0]
-                # create the team row if it does not exist
-                team = meta.scoped_session().get(Team, club.id)
-                if team is None:
-                    team = Team()
-                team.id = club.id
-                team.name = club.name
-                team.cover_photo = club.cover_photo
-                team.profile_photo = club.profile
-                team.leaderboard_exclude = club.id in config.OBSERVER_TEAMS
-                athlete_model.team = team
-                meta.scoped_session().add(team)
-                return team
-        finally:
-            meta.scoped_session().commit()
+            )
+        else:
+            club = matches[0]
+            # create the team row if it does not exist
+            team = meta.scoped_session().get(Team, club.id)
+            if team is None:
+                team = Team()
+            team.id = club.id
+            team.name = club.name
+            team.cover_photo = club.cover_photo
+            team.profile_photo = club.profile
+            team.leaderboard_exclude = club.id in config.OBSERVER_TEAMS
+            athlete_model.team = team
+            meta.scoped_session().add(team)
+            return team
@@ -0,0 +1,62 @@
+from datetime import datetime, timedelta
+
+import greenstalk
+from freezing.model import meta
+from freezing.model.msg.mq import DefinedTubes
+from freezing.model.orm import Ride
+from sqlalchemy import func, text
+
+from freezing.sync.config import config, statsd
+
+from . import BaseSync
+
+
+class BacklogSync(BaseSync):
+    name = "sync-backlog"
+    description = "Report how much sync work is waiting to statsd."
+
+    def report_backlog(self):
+        """
+        Report how much work is waiting, as statsd gauges: rides still needing detail,
+        tracks, photos and (from the last WEATHER_BACKLOG_DAYS) weather, and activity
+        updates waiting in beanstalkd.
+        """
+        with meta.transaction_context() as sess:
+            public = sess.query(func.count(Ride.id)).filter(Ride.private.is_(False))
+            for name, pending in (
+                ("detail", Ride.detail_fetched.is_(False)),
+                ("track", Ride.track_fetched.is_(False)),
+                ("photos", Ride.photos_fetched.is_(False)),
+            ):
+                statsd.gauge(f"backlog.{name}", public.filter(pending).scalar())
+
+            # Roughly the hourly weather sync's query: recent rides without weather.
+            since = max(
+                config.START_DATE.replace(tzinfo=None),
+                datetime.now() - timedelta(days=config.WEATHER_BACKLOG_DAYS),
+            )
+            statsd.gauge(
+                "backlog.weather",
+                sess.execute(
+                    text(
+                        """
+                        select count(*) from rides R
+                        join ride_geo G on G.ride_id = R.id
+                        where R.start_date >= :since and R.start_date < :now
+                        and not exists (
+                            select 1 from ride_weather W where W.ride_id = R.id
+                        )
+                        """
+                    ).bindparams(since=since, now=datetime.now())
+                ).scalar(),
+            )
+
+        tube = DefinedTubes.activity_update.value
+        try:
+            with greenstalk.Client(
+                (config.BEANSTALKD_HOST, config.BEANSTALKD_PORT), use=tube
+            ) as beanstalk:
+                stats = beanstalk.stats_tube(tube)
+            statsd.gauge("backlog.activity_updates", stats["current-jobs-ready"])
+        except (OSError, greenstalk.Error):
+            self.logger.warning("Unable to read the activity update queue's depth")
@@ -1,10 +1,18 @@
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import timedelta
+from typing import List
+
 from freezing.model import meta, orm
 from freezing.model.orm import Ride, RidePhoto
 from sqlalchemy import and_
 from stravalib.client import BatchedResultsIterator
 from stravalib.model import ActivityPhoto
 
+from freezing.sync.config import config
 from freezing.sync.data import StravaClientForAthlete
+from freezing.sync.partitions import leases
 
 from . import BaseSync
 
@@ -22,7 +30,23 @@ class PhotoSync(BaseSync):
         activity_id: int | None = None,
         force: bool = False,
         verbose: bool = False,
+        max_workers: int | None = None,
+        time_budget: timedelta | None = None,
     ):
+        """
+        List the photos of every ride that needs it from Strava, several athletes at a
+        time, and write them out.
+
+        :param max_workers: How many athletes to fetch photos for at once (default
+                            PHOTO_SYNC_CONCURRENCY).
+        :param time_budget: Stop starting new athletes after this long, leaving the rest
+                            of the rides for the next run.
+        """
+        max_workers = max_workers or config.PHOTO_SYNC_CONCURRENCY
+        deadline = None
+        if time_budget:
+            deadline = time.monotonic() + time_budget.total_seconds()
+
         with meta.transaction_context() as sess:
             q = sess.query(Ride)
             q = q.filter_by(private=False)
@@ -32,28 +56,96 @@ class PhotoSync(BaseSync):
                 q = q.filter_by(athlete_id=athlete_id)
             if activity_id:
                 q = q.filter_by(id=activity_id)
+            if not athlete_id and not activity_id:
+                q = q.filter(leases.clause(Ride.athlete_id))
 
+            rides = {}
+            rides_by_athlete = defaultdict(list)
             for ride in q:
-                self.logger.info("Writing out photos for {0!r}".format(ride))
+                rides[ride.id] = ride
+                rides_by_athlete[ride.athlete_id].append(ride)
+
+            # Build the clients here rather than in the workers, since doing so may
+            # refresh (and save) the athlete's token.
+            clients = {}
+            for athlete, athlete_rides in rides_by_athlete.items():
                 try:
-                    client = StravaClientForAthlete(ride.athlete)
-                    big_photos = client.get_activity_photos(ride.id, size=BigSize)
-                    if verbose:
-                        for photo in big_photos:
-                            self.logger.info(f"Big photo: {str(photo)}")
-                    self.write_ride_photos_nonprimary(big_photos, ride, BigSize)
-                    # We don't display thumbnails because they are too small, so don't
-                    # sync them anymore.
-                    # small_photos = client.get_activity_photos(ride.id, size=SmallSize)
-                    # self.write_ride_photos_nonprimary(small_photos, ride, SmallSize)
+                    clients[athlete] = StravaClientForAthlete(athlete_rides[0].athlete)
                 except:
                     self.logger.exception(
-                        "Error fetching/writing "
-                        "non-primary photos activity "
-                        "{0}, athlete {1}".format(ride.id, ride.athlete),
+                        "Error creating client for athlete {0}".format(athlete),
                         exc_info=True,
                     )
 
+            self.logger.info(
+                "Fetching photos for {0} rides of {1} athletes with {2} workers".format(
+                    len(rides),
+                    len(clients),
+                    max_workers,
+                )
+            )
+
+            # Only the listing happens in the pool (one athlete per worker, since their
+            # client isn't thread safe): the database is all written from here.
+            with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                futures = [
+                    pool.submit(
+                        self._list_photos,
+                        client,
+                        [ride.id for ride in rides_by_athlete[athlete]],
+                        deadline,
+                    )
+                    for athlete, client in clients.items()
+                ]
+                for future in as_completed(futures):
+                    for ride_id, photos in future.result():
+                        self._write_photos(rides[ride_id], photos, verbose)
+
+    def _list_photos(
+        self, client: StravaClientForAthlete, ride_ids: List[int], deadline: float
+    ):
+        """
+        Fetch the photos for one athlete's rides, one after the other.
+
+        :return: (ride id, photos or the exception fetching them) for each ride fetched.
+        """
+        results = []
+        for ride_id in ride_ids:
+            if deadline and time.monotonic() > deadline:
+                self.logger.info(
+                    "Out of time, leaving {0} rides for the next run".format(
+                        len(ride_ids) - len(results)
+                    )
+                )
+                break
+            try:
+                photos = list(client.get_activity_photos(ride_id, size=BigSize))
+            except Exception as x:
+                photos = x
+            results.append((ride_id, photos))
+        return results
+
+    def _write_photos(self, ride: Ride, photos, verbose: bool):
+        self.logger.info("Writing out photos for {0!r}".format(ride))
+        try:
+            if isinstance(photos, Exception):
+                raise photos
+            if verbose:
+                for photo in photos:
+                    self.logger.info(f"Big photo: {str(photo)}")
+            self.write_ride_photos_nonprimary(photos, ride, BigSize)
+            # We don't display thumbnails because they are too small, so don't
+            # sync them anymore.
+            # small_photos = client.get_activity_photos(ride.id, size=SmallSize)
+            # self.write_ride_photos_nonprimary(small_photos, ride, SmallSize)
+        except:
+            self.logger.exception(
+                "Error fetching/writing "
+                "non-primary photos activity "
+                "{0}, athlete {1}".format(ride.id, ride.athlete),
+                exc_info=True,
+            )
+
     def write_ride_photos_nonprimary(
         self,
         activity_photos: BatchedResultsIterator[ActivityPhoto],
@@ -70,8 +162,23 @@ class PhotoSync(BaseSync):
         :type ride: bafs.orm.Ride
         """
 
-        photos = meta.scoped_session().query(RidePhoto).filter_by(ride_id=ride.id)
-        existing_photos = {photo.id: photo for photo in photos}
+        session = meta.scoped_session()
+        # Plain rows rather than RidePhoto objects, so that the bulk statements below
+        # can't leave stale objects in the session.
+        existing_photos = {
+            row.id: row
+            for row in session.query(
+                RidePhoto.id,
+                RidePhoto.primary,
+                RidePhoto.img_l,
+                RidePhoto.img_t,
+                RidePhoto.caption,
+            ).filter(RidePhoto.ride_id == ride.id)
+        }
+        url_column = "img_l" if size == BigSize else "img_t"  # horrid, drop thumbnails
+        added = {}
+        updated = {}
+        seen = set()
         found_primary = False
         found_photo = False
 
@@ -86,38 +193,51 @@ class PhotoSync(BaseSync):
             if activity_photo.caption and "#nobafs" in activity_photo.caption.lower():
                 continue
             found_photo = True
-
-            # If it's already in the db, then skip it.
-            photo = existing_photos.get(activity_photo.unique_id)
-            if photo:
-                del existing_photos[activity_photo.unique_id]
-                found_primary = found_primary or photo.primary
-            else:
-                self.logger.info(
-                    "Adding photo {}: {}".format(
-                        activity_photo.unique_id, activity_photo.caption
+            photo_id = activity_photo.unique_id
+            seen.add(photo_id)
+            url = activity_photo.urls.get(str(size))
+
+            existing = existing_photos.get(photo_id)
+            if existing is None:
+                if photo_id not in added:
+                    self.logger.info(
+                        "Adding photo {}: {}".format(photo_id, activity_photo.caption)
                     )
-                )
-                photo = RidePhoto(
-                    id=activity_photo.unique_id,
-                    ride_id=ride.id,
-                    ref=activity_photo.ref,
-                    primary=False,
-                    source=activity_photo.source,  # meaningless
-                )
-                meta.scoped_session().add(photo)
-
-            if size == BigSize:  # horrid, we should just remove thumbnails
-                photo.img_l = activity_photo.urls.get(str(size)) or photo.img_l
-            else:
-                photo.img_t = activity_photo.urls.get(str(size)) or photo.img_t
-            photo.caption = activity_photo.caption
-
-            meta.scoped_session().flush()
+                added[photo_id] = {
+                    "id": photo_id,
+                    "ride_id": ride.id,
+                    "ref": activity_photo.ref,
+                    "primary": False,
+                    "source": activity_photo.source,  # meaningless
+                    url_column: url,
+                    "caption": activity_photo.caption,
+                }
+                continue
 
-        for deleted_photo in existing_photos.values():
-            self.logger.info("Deleting deleted photo {}".format(deleted_photo))
-            meta.scoped_session().delete(deleted_photo)
+            found_primary = found_primary or existing.primary
+            url = url or getattr(existing, url_column)
+            if (url, activity_photo.caption) != (
+                getattr(existing, url_column),
+                existing.caption,
+            ):
+                updated[photo_id] = {
+                    "id": photo_id,
+                    url_column: url,
+                    "caption": activity_photo.caption,
+                }
+
+        deleted = [photo_id for photo_id in existing_photos if photo_id not in seen]
+        for photo_id in deleted:
+            self.logger.info("Deleting deleted photo {}".format(photo_id))
+
+        if added:
+            session.bulk_insert_mappings(RidePhoto, list(added.values()))
+        if updated:
+            session.bulk_update_mappings(RidePhoto, list(updated.values()))
+        if deleted:
+            session.query(RidePhoto).filter(RidePhoto.id.in_(deleted)).delete(
+                synchronize_session=False
+            )
 
         ride.photos_fetched = True
 
@@ -11,6 +11,7 @@ from stravalib.model import Stream
 
 from freezing.sync.config import config
 from freezing.sync.exc import ActivityNotFound
+from freezing.sync.partitions import leases
 from freezing.sync.utils import wktutils
 from freezing.sync.utils.cache import CachingStreamFetcher
 
@@ -44,6 +45,8 @@ class StreamSync(BaseSync):
         if athlete_id:
             self.logger.info("Filtering activity details for {}".format(athlete_id))
             q = q.filter(Ride.athlete_id == athlete_id)
+        else:
+            q = q.filter(leases.clause(Ride.athlete_id))
 
         if max_records:
             self.logger.info("Limiting to {} records".format(max_records))
@@ -0,0 +1,93 @@
+import time
+from datetime import timedelta
+
+from freezing.model import meta
+from freezing.model.orm import Athlete
+from stravalib import Client
+
+from freezing.sync.config import config
+
+from . import STRAVA_REFRESH_HORIZON, BaseSync, Token, token_cache
+
+
+class TokenSync(BaseSync):
+    """
+    Refresh athletes' Strava access tokens in the background before they expire, so
+    that the activity webhook and the scheduled syncs never have to stop and refresh
+    one themselves.
+    """
+
+    name = "sync-tokens"
+    description = "Refresh expiring Strava access tokens."
+
+    def refresh_tokens(self, window: timedelta = None, max_records: int = None) -> int:
+        """
+        Refresh every token that expires within window, saving each athlete's new
+        tokens as soon as they arrive and then sharing them through the token cache.
+
+        Strava issues a new refresh token with each refresh, and the old one stops
+        working. So each athlete's new tokens are committed on their own, and an error
+        later in the batch can't roll them back.
+
+        :param window: How soon a token must expire to be refreshed (default
+                       STRAVA_TOKEN_REFRESH_WINDOW, and at most an hour).
+        :param max_records: Limit the number of tokens to refresh.
+        :return: The number of tokens refreshed.
+        """
+        # Strava hands back the same token until it has under an hour left.
+        window = min(
+            window or config.STRAVA_TOKEN_REFRESH_WINDOW, STRAVA_REFRESH_HORIZON
+        )
+        expiring = int(time.time() + window.total_seconds())
+        client = Client()
+        refreshed = 0
+
+        with meta.transaction_context() as sess:
+            q = sess.query(Athlete)
+            q = q.filter(Athlete.refresh_token != None)  # noqa: E711
+            q = q.filter(Athlete.expires_at < expiring)
+            q = q.order_by(Athlete.expires_at)
+            if max_records:
+                q = q.limit(max_records)
+
+            for athlete in q.all():
+                athlete_id = athlete.id
+                try:
+                    token_dict = client.refresh_access_token(
+                        config.STRAVA_CLIENT_ID,
+                        config.STRAVA_CLIENT_SECRET,
+                        athlete.refresh_token,
+                    )
+                except Exception:
+                    # Most likely the athlete revoked access; the next sync that needs
+                    # their token will say so.
+                    self.logger.exception(
+                        "Error refreshing access token for athlete {}".format(
+                            athlete_id
+                        )
+                    )
+                    continue
+                token = Token(
+                    token_dict["access_token"],
+                    token_dict["refresh_token"],
+                    token_dict["expires_at"],
+                )
+                athlete.access_token = token.access_token
+                athlete.refresh_token = token.refresh_token
+                athlete.expires_at = token.expires_at
+                try:
+                    sess.commit()
+                except Exception:
+                    self.logger.exception(
+                        "Error saving refreshed access token for athlete {}".format(
+                            athlete_id
+                        )
+                    )
+                    sess.rollback()
+                    continue
+                # Only share the new tokens once they are committed.
+                token_cache.put(athlete_id, token)
+                refreshed += 1
+
+        self.logger.info("Refreshed {} expiring access tokens".format(refreshed))
+        return refreshed
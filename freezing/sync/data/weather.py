@@ -1,25 +1,48 @@
 import logging
+import os
+from collections import defaultdict
 from datetime import datetime, timedelta
-from decimal import Decimal
-from statistics import mean
 
 from freezing.model import meta, orm
 from pytz import timezone
-from sqlalchemy import text
+from sqlalchemy import bindparam, text
 
 from freezing.sync.config import config
 from freezing.sync.data import BaseSync
+from freezing.sync.exc import ConfigurationError
+from freezing.sync.partitions import leases
+from freezing.sync.utils.failures import FailureLog
+from freezing.sync.utils.state import PartitionedState
 from freezing.sync.utils.wktutils import parse_point_wkt
+from freezing.sync.wx.aggregate import RideWeatherAggregator
+from freezing.sync.wx.providers import VisualCrossingProvider, WeatherRouter
+from freezing.sync.wx.transport import shared_transport
 from freezing.sync.wx.visualcrossing.api import HistoVisualCrossing
-
+from freezing.sync.wx.visualcrossing.fallback import NeighbourWeather
+from freezing.sync.wx.visualcrossing.locations import LocationIndex
 
 # We only synchronize weather for yesterday's rides to avoid syncing early in the day and then having
 # no (or forecasted) weather data for the rest of the day in our cache. This means our weather
-# stats are always just up until yesterday. Shrug. We could do better. We also round lat/long
-# to 1 decimal place which is about 10 miles which is terribly imprecise, but our current weather
-# data is also very non hyperlocal and so this is just fine. We also only fetch weather data for
-# the start day of the ride, so an epic century that starts just before midnight will receive no
-# credit for the blizzard that starts at one minute past midnight.
+# stats are always just up until yesterday. Shrug. We could do better. We also snap each ride to
+# weather we already have cached within a few miles, or else round lat/long to 1 decimal place,
+# which is about 10 miles which is terribly imprecise, but our current weather data is also very
+# non hyperlocal and so this is just fine. Rides that span midnight fetch every day they cover in
+# one range request, so an epic century that starts just before midnight does get credit for the
+# blizzard that starts at one minute past midnight.
+#
+# If Visual Crossing can't give us a ride's weather (it's down, or we're running cache only), we fill
+# in stand-in weather from the nearest cached location and day instead of retrying the ride every
+# run. Those rides are remembered in a state file (one per partition, when several sync processes
+# share the work) and re-fetched properly once the API is back.
+DEGRADED_STATE = "weather-degraded.json"
+
+# Rides we couldn't get any weather for at all are left alone for a while (see FailureLog).
+FAILURES_STATE = "weather-failures.json"
+
+# How often to try to replace a ride's stand-in weather with the real thing.
+UPGRADE_INTERVAL = timedelta(hours=6)
+
+
 class WeatherSync(BaseSync):
     """
     Synchronize rides from data with the database.
@@ -29,13 +52,22 @@ class WeatherSync(BaseSync):
     description = "Sync all ride weather"
 
     def sync_weather(
-        self, clear: bool = False, limit: int = None, cache_only: bool = False
+        self,
+        clear: bool = False,
+        limit: int = None,
+        cache_only: bool = False,
+        full: bool = False,
     ):
+        """
+        :param full: Look for rides missing weather since the start of the competition,
+                     rather than only those from the last WEATHER_BACKLOG_DAYS.
+        """
         sess = meta.scoped_session()
 
         if clear:
             self.logger.info("Clearing all weather data!")
             sess.query(orm.RideWeather).delete()
+            full = True
 
         if limit:
             self.logger.info("Fetching weather for first {0} rides".format(limit))
@@ -45,161 +77,448 @@ class WeatherSync(BaseSync):
         # Find rides that have geo, but no weather
         # We only look at rides that ended over an hour ago, so we know there is weather observation rather than
         # forecast, and we have to care that now() is in system timezone.
-        sess.query(orm.RideWeather)
-        q = text(
-            """
+        #
+        # The end-time test wraps the columns in functions, so on its own it means
+        # checking every ride. Nearly all the rides missing weather are recent ones, so
+        # we only look at rides that started in the last WEATHER_BACKLOG_DAYS (and not
+        # later than could have finished an hour ago: ride start dates are stored in
+        # local time, which is never more than 14 hours ahead of UTC). Rides whose
+        # earlier failures are due a retry are added by id, whenever they are from.
+        # A full sync (once a day, see freezing.sync.run) looks back to the start of the
+        # competition, for rides that turned up late.
+        #
+        # Rides that have recently failed are skipped until their retry time comes
+        # round, and when several sync processes share the work, each takes its own
+        # athletes' rides.
+        window_start, window_end = self._backlog_window(full)
+        failures = FailureLog(
+            os.path.join(config.SYNC_STATE_DIR, FAILURES_STATE),
+            base_delay=config.FAILURE_RETRY_BASE,
+            max_delay=config.FAILURE_RETRY_MAX,
+            logger=self.logger,
+        )
+        backing_off = failures.backing_off()
+        if backing_off:
+            self.logger.info(
+                "Skipping {0} rides that recently failed".format(len(backing_off))
+            )
+        retrying = [] if full else failures.retrying()
+        rides = """
             select R.id, ST_AsText(G.start_geo) AS start_geo from rides R
             join ride_geo G on G.ride_id = R.id
-            left join ride_weather W on W.ride_id = R.id
-            where W.ride_id is null
+            where {0}
+            and not exists (select 1 from ride_weather W where W.ride_id = R.id)
             and date_add(CONVERT_TZ(R.start_date, R.timezone, 'SYSTEM'), INTERVAL R.elapsed_time SECOND) < (NOW() - INTERVAL 1 HOUR)
-            ;
+            {1}
+            {2}
             """
+        filters = (
+            "and R.id not in :backing_off" if backing_off else "",
+            (
+                "and mod(crc32(R.athlete_id), :partition_count) in :partitions"
+                if leases.partitioned
+                else ""
+            ),
+        )
+        selects = [
+            rides.format(
+                "R.start_date >= :window_start and R.start_date < :window_end",
+                *filters,
+            )
+        ]
+        if retrying:
+            selects.append(rides.format("R.id in :retrying", *filters))
+        q = text(" union ".join(selects) + ";").bindparams(
+            window_start=window_start, window_end=window_end
         )
+        if backing_off:
+            q = q.bindparams(
+                bindparam("backing_off", value=backing_off, expanding=True)
+            )
+        if retrying:
+            q = q.bindparams(bindparam("retrying", value=retrying, expanding=True))
+        if leases.partitioned:
+            q = q.bindparams(
+                bindparam("partitions", value=leases.owned(), expanding=True),
+                partition_count=leases.partitions,
+            )
 
-        visual_crossing = HistoVisualCrossing(
-            api_key=config.VISUAL_CROSSING_API_KEY,
-            cache_dir=config.VISUAL_CROSSING_CACHE_DIR,
-            cache_only=cache_only,
-            logger=self.logger,
+        visual_crossing = self._visual_crossing(
+            cache_only=cache_only, max_workers=config.VISUAL_CROSSING_CONCURRENCY
         )
 
+        router = self._weather_router(visual_crossing, cache_only=cache_only)
+
         rows = sess.execute(q).fetchall()  # @UndefinedVariable
+        if limit and len(rows) > limit:
+            logging.info("Limit ({0}) reached".format(limit))
+            rows = rows[:limit]
+
+        degraded = PartitionedState(
+            os.path.join(config.SYNC_STATE_DIR, DEGRADED_STATE), logger=self.logger
+        )
+        upgrading = set()
+        if not cache_only and (not limit or len(rows) < limit):
+            upgrade_rows = self._upgrade_rows(sess, degraded)
+            if limit:
+                upgrade_rows = upgrade_rows[: limit - len(rows)]
+            upgrading = {r._mapping["id"] for r in upgrade_rows}
+            rows = rows + upgrade_rows
         num_rides = len(rows)
 
-        for i, r in enumerate(rows):
-            if limit and i >= limit:
-                logging.info("Limit ({0}) reached".format(limit))
-                break
+        locations = LocationIndex.from_cache_dir(
+            config.VISUAL_CROSSING_CACHE_DIR,
+            radius_km=config.VISUAL_CROSSING_SNAP_RADIUS_KM,
+        )
+        fallback = NeighbourWeather(
+            cache=visual_crossing.cache,
+            locations=locations,
+            radius_km=config.VISUAL_CROSSING_FALLBACK_RADIUS_KM,
+            max_days=config.VISUAL_CROSSING_FALLBACK_DAYS,
+            logger=self.logger,
+        )
 
+        # Work out what every ride needs up front, so that the distinct cache misses can
+        # be fetched concurrently rather than one blocking request per ride.
+        work = []
+        for r in rows:
             ride = sess.get(orm.Ride, r._mapping["id"])
             start_geo_wkt = r._mapping["start_geo"]
-            self.logger.info(
-                "Processing ride: {0} ({1}/{2}) ({3})".format(
-                    ride.id, i, num_rides, start_geo_wkt
-                )
-            )
-
             try:
-                # If you can't reproduce the ancient infrastructure required by all this and so can't run any of the
-                # geoalchemy stuff you can hardcode this to debug
-                # start_geo_wkt = "POINT(-76.96 38.96)"
-                # start_geo_wkt = meta.scoped_session().scalar(ride.geo.start_geo.wkt)
-                point = parse_point_wkt(start_geo_wkt)
-
-                # We round lat/lon to decrease the granularity and allow better re-use of cache data.
-                # Gives about an 80% hit rate vs about 20% for 2 decimals.
-                lon = round(Decimal(point.lon), 1)
-                lat = round(Decimal(point.lat), 1)
-
-                self.logger.debug(
-                    "Ride metadata: time={0} dur={1} loc={2}/{3}".format(
-                        ride.start_date, ride.elapsed_time, lat, lon
-                    )
+                params = self._fetch_params(ride, start_geo_wkt, locations)
+                work.append((ride, start_geo_wkt, params))
+            except Exception as x:
+                self.logger.exception(
+                    "Error getting weather data for ride: {0}".format(ride)
                 )
-
-                ride_today = datetime.now(timezone(ride.timezone))
-                start_date = ride.start_date.replace(tzinfo=timezone(ride.timezone))
-                fetch_date = start_date + timedelta(seconds=ride.elapsed_time)
-                # For caching purposes we're saying we want weather as of the end of the ride, so if
-                # we have weather from earlier in the day we don't use it. Because we're lame and
-                # don't want to handle rides that span midnight, we max to 23:59 of the day. If
-                # we are fetching old weather, we also just ask for the end of the day so we will
-                # use the latest cache file.
-                if (
-                    fetch_date.date() < ride_today.date()
-                    or fetch_date.date() != start_date.date()
-                ):
-                    fetch_date = start_date.replace(
-                        hour=23, minute=59, second=0, microsecond=0
-                    )
-
+                if ride.id not in upgrading:
+                    failures.record(ride.id, ride.athlete_id, x)
+
+        router.prefetch(params for (_, _, params) in work)
+
+        # Rides that need the same forecast share it, so each forecast is loaded and
+        # turned into columns once however many rides it covers.
+        by_forecast = defaultdict(list)
+        for ride, start_geo_wkt, (start_date, fetch_date, lat, lon) in work:
+            key = (lat, lon, start_date.date(), fetch_date.date(), fetch_date.hour)
+            by_forecast[key].append((ride, start_geo_wkt, start_date, fetch_date))
+
+        i = 0
+        for (lat, lon, _, _, _), group in by_forecast.items():
+            start_date, fetch_date = group[0][2], group[0][3]
+            stand_in = False
+            try:
                 # VC gives us back weather in the timezone of the lat/lon that we asked. So we ask for
-                # weather in the ride-local date and interpret times accordingly.
-                hist = visual_crossing.histo_forecast(
-                    time=fetch_date, latitude=lat, longitude=lon
+                # weather in the ride-local dates and interpret times accordingly.
+                hist = router.histo_forecast_range(
+                    start=start_date, end=fetch_date, latitude=lat, longitude=lon
                 )
-
                 self.logger.debug("Got response in timezone {0}".format(hist.timezone))
-
-                ride_start = start_date.astimezone(tz=hist.timezone)
-                ride_end = ride_start + timedelta(seconds=ride.elapsed_time)
-
-                # NOTE: if elapsed_time is significantly more than moving_time then we need to assume
-                # that the rider wasn't actually riding for this entire time (and maybe just grab temps closest to start of
-                # ride as opposed to averaging observations during ride.
-
-                ride_observations = [
-                    d for d in hist.day.hours if ride_start <= d.time <= ride_end
-                ]
-
-                start_obs = min(
-                    hist.day.hours,
-                    key=lambda d: abs((d.time - ride_start).total_seconds()),
-                )
-                end_obs = min(
-                    hist.day.hours,
-                    key=lambda d: abs((d.time - ride_end).total_seconds()),
+                aggregator = RideWeatherAggregator(hist.hours)
+            except Exception as x:
+                # Rides being upgraded already have stand-in weather, so leave them be.
+                for ride, _, _, _ in group:
+                    if ride.id not in upgrading:
+                        self.logger.exception(
+                            "Error getting weather data for ride: {0}".format(ride)
+                        )
+                skipped = len(group)
+                group = [g for g in group if g[0].id not in upgrading]
+                hist = self._stand_in(
+                    fallback, group, start_date, fetch_date, latitude=lat, longitude=lon
                 )
-
-                if len(ride_observations) <= 2:
-                    # if we don't have many observations, bookend the list with the start/end observations without double counting
-                    ride_observations = (
-                        [start_obs]
-                        + [
-                            o
-                            for o in ride_observations
-                            if o is not start_obs and o is not end_obs
-                        ]
-                        + [end_obs]
+                if hist is None:
+                    for ride, _, _, _ in group:
+                        failures.record(ride.id, ride.athlete_id, x)
+                    i += skipped
+                    continue
+                i += skipped - len(group)
+                aggregator = RideWeatherAggregator(hist.hours)
+                stand_in = True
+
+            for ride, start_geo_wkt, start_date, _ in group:
+                self.logger.info(
+                    "Processing ride: {0} ({1}/{2}) ({3})".format(
+                        ride.id, i, num_rides, start_geo_wkt
                     )
+                )
+                i += 1
 
-                for x in ride_observations:
-                    self.logger.debug("Observation: {0}".format(x.__dict__))
-
-                rw = orm.RideWeather()
-                rw.ride_id = ride.id
-                rw.ride_temp_start = start_obs.temperature
-                rw.ride_temp_end = end_obs.temperature
-
-                rw.ride_temp_avg = mean([o.temperature for o in ride_observations])
+                try:
+                    if ride.id in upgrading:
+                        sess.query(orm.RideWeather).filter(
+                            orm.RideWeather.ride_id == ride.id
+                        ).delete()
 
-                rw.ride_windchill_start = start_obs.apparent_temperature
-                rw.ride_windchill_end = end_obs.apparent_temperature
-                rw.ride_windchill_avg = mean(
-                    [o.apparent_temperature for o in ride_observations]
-                )
+                    ride_start = start_date.astimezone(tz=hist.timezone)
+                    ride_end = ride_start + timedelta(seconds=ride.elapsed_time)
 
-                # scale the cumulative precipitation over the observation period by the fraction of time spent moving
-                scale = (
-                    ride.moving_time
-                    / timedelta(hours=len(ride_observations)).total_seconds()
-                )
-                rw.ride_precip = (
-                    sum([o.precip_accumulation for o in ride_observations]) * scale
-                )
-                rw.ride_rain = any([o.precip_type == "rain" for o in ride_observations])
-                rw.ride_snow = any([o.precip_type == "snow" for o in ride_observations])
+                    rw = orm.RideWeather()
+                    rw.ride_id = ride.id
+                    for field, value in aggregator.aggregate(
+                        start=ride_start, end=ride_end, moving_time=ride.moving_time
+                    ).items():
+                        setattr(rw, field, value)
 
-                rw.wind_speed = mean([o.wind_speed for o in ride_observations])
-                rw.wind_gust = max([o.wind_gust for o in ride_observations])
+                    rw.day_temp_min = hist.day.temperature_min
+                    rw.day_temp_max = hist.day.temperature_max
 
-                rw.day_temp_min = hist.day.temperature_min
-                rw.day_temp_max = hist.day.temperature_max
+                    rw.sunrise = hist.day.sunrise.time()
+                    rw.sunset = hist.day.sunset.time()
 
-                rw.sunrise = hist.day.sunrise.time()
-                rw.sunset = hist.day.sunset.time()
+                    self.logger.debug("Ride weather: {0}".format(rw.__dict__))
 
-                self.logger.debug("Ride weather: {0}".format(rw.__dict__))
+                    sess.add(rw)
+                    sess.flush()
 
-                sess.add(rw)
-                sess.flush()
+                except Exception as x:
+                    self.logger.exception(
+                        "Error getting weather data for ride: {0}".format(ride)
+                    )
+                    sess.rollback()
+                    if ride.id not in upgrading:
+                        failures.record(ride.id, ride.athlete_id, x)
+
+                else:
+                    sess.commit()
+                    failures.clear(ride.id, ride.athlete_id)
+                    rides_degraded = degraded.for_athlete(ride.athlete_id)
+                    if stand_in:
+                        rides_degraded[str(ride.id)] = datetime.utcnow().isoformat()
+                    elif ride.id in upgrading:
+                        self.logger.info(
+                            "Replaced stand-in weather for ride {0}".format(ride.id)
+                        )
+                        rides_degraded.pop(str(ride.id))
+
+        degraded.save()
+        failures.save()
+
+    def prefetch_weather(self, days: int = None):
+        """
+        Warm the weather cache for yesterday everywhere people have been riding lately,
+        so that the hourly sync mostly hits the cache.
+
+        Only whole days are worth fetching ahead: today's weather would only be good up
+        to now, so the sync would fetch it again for any ride later in the day.
+
+        Locations are snapped the same way the sync does, so they land on the same cache
+        files, and are fetched with little concurrency to leave room for the sync.
+
+        :param days: How many days back to look for rides (or WEATHER_PREFETCH_DAYS).
+        """
+        days = days or config.WEATHER_PREFETCH_DAYS
+        sess = meta.scoped_session()
+        q = text(
+            """
+            select distinct ST_AsText(G.start_geo) AS start_geo, R.timezone from rides R
+            join ride_geo G on G.ride_id = R.id
+            where R.start_date >= :since
+            ;
+            """
+        ).bindparams(since=datetime.utcnow() - timedelta(days=days))
+        rows = sess.execute(q).fetchall()
 
+        locations = LocationIndex.from_cache_dir(
+            config.VISUAL_CROSSING_CACHE_DIR,
+            radius_km=config.VISUAL_CROSSING_SNAP_RADIUS_KM,
+        )
+        cells = {}
+        for r in rows:
+            try:
+                point = parse_point_wkt(r._mapping["start_geo"])
+                cell = locations.snap(latitude=point.lat, longitude=point.lon)
+                cells.setdefault(cell, timezone(r._mapping["timezone"]))
             except:
                 self.logger.exception(
-                    "Error getting weather data for ride: {0}".format(ride)
+                    "Error reading ride location {0}".format(r._mapping["start_geo"])
                 )
-                sess.rollback()
 
+        requests = []
+        for (lat, lon), tz in cells.items():
+            # Asked for as of the end of the day, as the sync does for days that are over.
+            yesterday = (datetime.now(tz) - timedelta(days=1)).replace(
+                hour=0, minute=0, second=0, microsecond=0
+            )
+            requests.append(
+                (yesterday, yesterday.replace(hour=23, minute=59), lat, lon)
+            )
+
+        self.logger.info(
+            "Prefetching weather for {0} locations with rides in the last {1} days".format(
+                len(cells), days
+            )
+        )
+        visual_crossing = self._visual_crossing(
+            cache_only=False, max_workers=config.WEATHER_PREFETCH_CONCURRENCY
+        )
+        fetched = visual_crossing.prefetch(requests)
+        self.logger.info("Prefetched weather with {0} requests".format(fetched))
+
+    def _visual_crossing(self, cache_only: bool, max_workers: int):
+        return HistoVisualCrossing(
+            api_key=config.VISUAL_CROSSING_API_KEY,
+            cache_dir=config.VISUAL_CROSSING_CACHE_DIR,
+            cache_only=cache_only,
+            logger=self.logger,
+            max_workers=max_workers,
+            transport=shared_transport(
+                "visualcrossing",
+                pool_size=config.VISUAL_CROSSING_CONCURRENCY,
+                logger=self.logger,
+            ),
+        )
+
+    def _weather_router(
+        self, visual_crossing: HistoVisualCrossing, cache_only: bool
+    ) -> WeatherRouter:
+        """
+        Route weather requests to the configured WEATHER_PROVIDERS, in order.
+        """
+        providers = []
+        for name in config.WEATHER_PROVIDERS:
+            if name == VisualCrossingProvider.name:
+                providers.append(VisualCrossingProvider(visual_crossing))
             else:
-                sess.commit()
+                raise ConfigurationError(f"Unknown weather provider: {name}")
+        return WeatherRouter(providers, logger=self.logger)
+
+    def _upgrade_rows(self, sess, degraded: PartitionedState):
+        """
+        Find the rides with stand-in weather that are due another try at the real thing,
+        among this process's athletes.
+
+        The time each one was last tried is bumped, so that a ride whose weather still
+        can't be fetched waits UPGRADE_INTERVAL before it is tried again.
+        """
+        now = datetime.utcnow()
+        due = [
+            int(ride_id)
+            for ride_id, tried in degraded.items()
+            if datetime.fromisoformat(tried) <= now - UPGRADE_INTERVAL
+        ]
+        if not due:
+            return []
+
+        q = text(
+            """
+            select R.id, R.athlete_id, ST_AsText(G.start_geo) AS start_geo from rides R
+            join ride_geo G on G.ride_id = R.id
+            where R.id in :ride_ids
+            {0}
+            ;
+            """.format(
+                "and mod(crc32(R.athlete_id), :partition_count) in :partitions"
+                if leases.partitioned
+                else ""
+            )
+        ).bindparams(bindparam("ride_ids", value=due, expanding=True))
+        if leases.partitioned:
+            q = q.bindparams(
+                bindparam("partitions", value=leases.owned(), expanding=True),
+                partition_count=leases.partitions,
+            )
+        rows = sess.execute(q).fetchall()
+
+        found = set()
+        for r in rows:
+            found.add(r._mapping["id"])
+            degraded.for_athlete(r._mapping["athlete_id"])[
+                str(r._mapping["id"])
+            ] = now.isoformat()
+        for ride_id in due:
+            if ride_id not in found:
+                # The ride has since been deleted (or its athlete is no longer ours).
+                degraded.discard(str(ride_id))
+
+        self.logger.info(
+            "Trying to replace stand-in weather for {0} rides".format(len(rows))
+        )
+        return rows
+
+    def _stand_in(
+        self,
+        fallback: NeighbourWeather,
+        group,
+        start_date: datetime,
+        fetch_date: datetime,
+        latitude,
+        longitude,
+    ):
+        """
+        Stand-in weather from nearby cached days for rides we couldn't get weather for.
+
+        :return: The stand-in forecast, or None if there isn't one close enough.
+        """
+        if not group or fallback.cache is None:
+            return None
+        try:
+            hist = fallback.histo_forecast_range(
+                start=start_date, end=fetch_date, latitude=latitude, longitude=longitude
+            )
+        except:
+            self.logger.exception(
+                "Error getting stand-in weather for {0}x{1}".format(longitude, latitude)
+            )
+            return None
+        if hist is None or not hist.hours:
+            return None
+        self.logger.warning(
+            "Using stand-in weather from nearby cached days for rides: {0}".format(
+                ", ".join(str(ride.id) for ride, _, _, _ in group)
+            )
+        )
+        return hist
+
+    def _backlog_window(self, full: bool = False):
+        """
+        The range of (local, naive) ride start dates to look for rides missing weather
+        in: the last WEATHER_BACKLOG_DAYS, or the whole competition if full.
+        """
+        now = datetime.utcnow()
+        window_start = config.START_DATE.replace(tzinfo=None) - timedelta(days=1)
+        if not full:
+            # Local times can be up to 12 hours behind UTC.
+            recent = now - timedelta(days=config.WEATHER_BACKLOG_DAYS, hours=12)
+            window_start = max(window_start, recent)
+        window_end = now + timedelta(hours=14) - timedelta(hours=1)
+        return window_start, window_end
+
+    def _fetch_params(
+        self, ride: orm.Ride, start_geo_wkt: str, locations: LocationIndex
+    ):
+        """
+        Work out which forecast to request for a ride.
+
+        :return: A (start_date, fetch_date, latitude, longitude) tuple for the ride, where
+                 the forecast should cover start_date to fetch_date.
+        """
+        # If you can't reproduce the ancient infrastructure required by all this and so can't run any of the
+        # geoalchemy stuff you can hardcode this to debug
+        # start_geo_wkt = "POINT(-76.96 38.96)"
+        # start_geo_wkt = meta.scoped_session().scalar(ride.geo.start_geo.wkt)
+        point = parse_point_wkt(start_geo_wkt)
+
+        # We use the nearest location we already have weather cached for, if it's close
+        # enough. Otherwise we round lat/lon to decrease the granularity and allow better
+        # re-use of cache data. Rounding alone gives about an 80% hit rate vs about 20% for
+        # 2 decimals, but two rides either side of a grid line would cost two requests.
+        lat, lon = locations.snap(latitude=point.lat, longitude=point.lon)
+
+        self.logger.debug(
+            "Ride metadata: time={0} dur={1} loc={2}/{3}".format(
+                ride.start_date, ride.elapsed_time, lat, lon
+            )
+        )
+
+        ride_today = datetime.now(timezone(ride.timezone))
+        start_date = ride.start_date.replace(tzinfo=timezone(ride.timezone))
+        fetch_date = start_date + timedelta(seconds=ride.elapsed_time)
+        # For caching purposes we're saying we want weather as of the end of the ride, so if
+        # we have weather from earlier in the day we don't use it. Every day before the one
+        # the ride ends on is over, so we want all of those. If we are fetching old weather,
+        # we also just ask for the end of the day so we will use the latest cache file.
+        if fetch_date.date() < ride_today.date():
+            fetch_date = fetch_date.replace(hour=23, minute=59, second=0, microsecond=0)
+
+        return start_date, fetch_date, lat, lon
@@ -0,0 +1,125 @@
+import functools
+import logging
+from contextlib import contextmanager
+from typing import Callable, Dict
+
+from apscheduler.executors.pool import ThreadPoolExecutor
+from apscheduler.schedulers.background import BackgroundScheduler
+from freezing.model import meta
+from sqlalchemy import text
+
+from freezing.sync.config import config
+from freezing.sync.profiling import profiled_job
+
+# Jobs are grouped into classes that each get their own pool of threads, so that (say) a
+# slow weather sync can't hold up the Strava syncs.
+STRAVA = "strava"
+WEATHER = "weather"
+
+DEFAULT_JOB_THREADS = {STRAVA: 3, WEATHER: 1}
+
+logger = logging.getLogger(__name__)
+
+
+def build_scheduler(job_threads: Dict[str, int] = None) -> BackgroundScheduler:
+    """
+    A scheduler that never runs two instances of the same job at once, and runs a job
+    that was missed (because it was still running, or its threads were busy) once when
+    it can rather than once for every missed run.
+
+    :param job_threads: The number of threads for each job class (default
+                        DEFAULT_JOB_THREADS, overridden by JOB_THREADS).
+    """
+    job_threads = dict(DEFAULT_JOB_THREADS, **(job_threads or config.JOB_THREADS))
+    executors = {
+        job_class: ThreadPoolExecutor(max(1, threads))
+        for job_class, threads in job_threads.items()
+    }
+    executors.setdefault("default", ThreadPoolExecutor(1))
+    return BackgroundScheduler(
+        executors=executors,
+        job_defaults={"coalesce": True, "max_instances": 1, "misfire_grace_time": None},
+    )
+
+
+def add_job(
+    scheduler: BackgroundScheduler,
+    func: Callable,
+    trigger: str,
+    name: str,
+    job_class: str,
+    exclusive_run: bool = True,
+    **kwargs,
+):
+    """
+    Schedule a job in a job class, holding the job's advisory lock (see advisory_lock)
+    while it runs.
+
+    :param name: Identifies the job, to the scheduler and between processes.
+    :param exclusive_run: Whether to take the lock, which a job that only works on this
+                          process's partitions (see freezing.sync.partitions) needn't.
+    :param kwargs: Passed on to the scheduler (trigger arguments, kwargs, etc.).
+    """
+    if config.PROFILE_JOBS:
+        func = profiled_job(name, output=config.PROFILE_DIR)(func)
+    return scheduler.add_job(
+        exclusive(name)(func) if exclusive_run else func,
+        trigger,
+        id=name,
+        name=name,
+        executor=job_class,
+        replace_existing=True,
+        **kwargs,
+    )
+
+
+def exclusive(name: str):
+    """
+    Decorate a job so that it is skipped if another process is already running it.
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with advisory_lock(name) as acquired:
+                if not acquired:
+                    logger.info(f"Skipping {name}: it is running in another process")
+                    return None
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+@contextmanager
+def advisory_lock(name: str, timeout: int = 0):
+    """
+    Hold a named MySQL lock (GET_LOCK) for the duration, so that only one sync process
+    at a time does a piece of work.
+
+    The lock is held on a connection of its own, since the work itself commits (which
+    hands its connection back to the pool) and the lock belongs to the connection.
+    Without MySQL (or with JOB_LOCKS off) there is nothing to coordinate with, and the
+    lock is always acquired.
+
+    :param timeout: How many seconds to wait for the lock.
+    :return: Whether the lock was acquired.
+    """
+    engine = meta.scoped_session().get_bind() if config.JOB_LOCKS else None
+    if engine is None or engine.dialect.name != "mysql":
+        yield True
+        return
+
+    # MySQL lock names are limited to 64 characters.
+    lock_name = f"freezing-sync:{name}"[:64]
+    with engine.connect() as conn:
+        acquired = conn.execute(
+            text("SELECT GET_LOCK(:name, :timeout)"),
+            {"name": lock_name, "timeout": timeout},
+        ).scalar()
+        try:
+            yield acquired == 1
+        finally:
+            if acquired == 1:
+                conn.execute(text("SELECT RELEASE_LOCK(:name)"), {"name": lock_name})
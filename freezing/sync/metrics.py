@@ -0,0 +1,80 @@
+import re
+import time
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from stravalib.util.limiter import get_rates_from_response_headers
+
+from freezing.sync.config import statsd
+
+
+@contextmanager
+def timed(metric: str, tags=None):
+    """
+    Report how long the block took, in milliseconds, as a statsd timing.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        statsd.timing(metric, (time.perf_counter() - start) * 1000, tags=tags)
+
+
+def strava_response_hook(response, *args, **kwargs):
+    """
+    A requests response hook timing each Strava API call, tagged by endpoint (with the
+    ids taken out) and status.
+    """
+    path = re.sub(r"/\d+", "/:id", urlparse(response.url).path)
+    statsd.timing(
+        "strava.request",
+        response.elapsed.total_seconds() * 1000,
+        tags=[
+            f"endpoint:{path}",
+            f"method:{response.request.method}",
+            f"status:{response.status_code}",
+        ],
+    )
+    return response
+
+
+def record_rate_limits(response_headers, method):
+    """
+    Report how much of Strava's (15 minute and daily) rate limits we have left.
+    """
+    rates = get_rates_from_response_headers(response_headers, method)
+    if rates:
+        statsd.gauge(
+            "strava.ratelimit.short.remaining", rates.short_limit - rates.short_usage
+        )
+        statsd.gauge(
+            "strava.ratelimit.long.remaining", rates.long_limit - rates.long_usage
+        )
+
+
+def instrument_sessions():
+    """
+    Time every database flush and commit.
+    """
+
+    @event.listens_for(Session, "before_flush")
+    def before_flush(session, flush_context, instances):
+        session.info["flush_start"] = time.perf_counter()
+
+    @event.listens_for(Session, "after_flush_postexec")
+    def after_flush(session, flush_context):
+        start = session.info.pop("flush_start", None)
+        if start is not None:
+            statsd.timing("db.flush", (time.perf_counter() - start) * 1000)
+
+    @event.listens_for(Session, "before_commit")
+    def before_commit(session):
+        session.info["commit_start"] = time.perf_counter()
+
+    @event.listens_for(Session, "after_commit")
+    def after_commit(session):
+        start = session.info.pop("commit_start", None)
+        if start is not None:
+            statsd.timing("db.commit", (time.perf_counter() - start) * 1000)
@@ -0,0 +1,200 @@
+import logging
+import math
+import threading
+import zlib
+from typing import List, Optional
+
+from freezing.model import meta
+from sqlalchemy import func, text, true
+
+MEMBER_LOCK = "freezing-sync:member:{0}"
+PARTITION_LOCK = "freezing-sync:partition:{0}"
+
+
+def partition_of(athlete_id: int, partitions: int) -> int:
+    # The same as MOD(CRC32(athlete_id), partitions) in MySQL. A hash rather than a
+    # plain modulus, so as not to line up with sync_rides_distributed's segments.
+    return zlib.crc32(str(athlete_id).encode()) % partitions
+
+
+class PartitionLeases(object):
+    """
+    Shares athletes (and so their rides) out between several sync processes.
+
+    Athletes are hashed into a fixed number of partitions, and each process leases a
+    fair share of the partitions by holding a MySQL named lock (GET_LOCK) for each one.
+    The backlog queries then only select rides of athletes in this process's partitions.
+
+    The locks are held on one connection of the process's own, so a process that dies
+    (or loses its connection) gives up its partitions automatically. A heartbeat keeps
+    that connection alive and notices when it is lost. It also counts the live processes
+    (each holds a member lock as well), gives back partitions beyond this process's fair
+    share for newcomers to take, and takes over any partitions that nobody holds.
+
+    With one partition (the default), or without MySQL, this process has everything and
+    the queries aren't filtered.
+    """
+
+    def __init__(self, partitions: int = 1, logger: logging.Logger = None):
+        self.partitions = max(1, partitions)
+        self.logger = logger or logging.getLogger(__name__)
+        self.lock = threading.Lock()
+        self.owned_partitions = set(range(self.partitions))
+        self.engine = None
+        self.conn = None
+        self.member = None
+        self.stopped = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+
+    @property
+    def partitioned(self) -> bool:
+        return self.partitions > 1
+
+    def partition_of(self, athlete_id: int) -> int:
+        return partition_of(athlete_id, self.partitions)
+
+    def owned(self) -> List[int]:
+        with self.lock:
+            return sorted(self.owned_partitions)
+
+    def owns(self, athlete_id: int) -> bool:
+        return not self.partitioned or self.partition_of(athlete_id) in self.owned()
+
+    def clause(self, athlete_id_column):
+        """
+        :return: A filter for the rows whose athlete is in this process's partitions.
+        """
+        if not self.partitioned:
+            return true()
+        return func.mod(func.crc32(athlete_id_column), self.partitions).in_(
+            self.owned()
+        )
+
+    def start(self, partitions: int, heartbeat: float):
+        """
+        Take the first leases and keep them up to date every heartbeat seconds.
+
+        :param partitions: The number of partitions to share between the processes
+                           (which must be the same for them all).
+        """
+        self.partitions = max(1, partitions)
+        with self.lock:
+            self.owned_partitions = set(range(self.partitions))
+        if not self.partitioned:
+            return
+        engine = meta.scoped_session().get_bind()
+        if engine.dialect.name != "mysql":
+            self.logger.warning(
+                "Partitioning needs MySQL; this process will sync everything."
+            )
+            self.partitions = 1
+            self.owned_partitions = {0}
+            return
+        self.engine = engine
+        with self.lock:
+            self.owned_partitions = set()
+        self.heartbeat()
+        self.thread = threading.Thread(
+            target=self._run, args=(heartbeat,), name="partition-leases", daemon=True
+        )
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread:
+            self.thread.join()
+        self._disconnect()
+
+    def _run(self, interval: float):
+        while not self.stopped.wait(interval):
+            try:
+                self.heartbeat()
+            except Exception:
+                self.logger.exception("Error renewing partition leases")
+
+    def heartbeat(self):
+        if not self._alive():
+            self._disconnect()
+            self.conn = self.engine.connect()
+        if self.member is None:
+            self.member = self._claim_member()
+            if self.member is None:
+                self.conn.commit()
+                return
+
+        members = sum(
+            1
+            for slot in range(self.partitions)
+            if self._scalar("SELECT IS_USED_LOCK(:name)", MEMBER_LOCK.format(slot))
+        )
+        share = math.ceil(self.partitions / max(1, members))
+
+        owned = self.owned()
+        for partition in owned[share:]:
+            self._scalar("SELECT RELEASE_LOCK(:name)", PARTITION_LOCK.format(partition))
+            owned.remove(partition)
+        for partition in range(self.partitions):
+            if len(owned) >= share:
+                break
+            if partition not in owned and self._get_lock(
+                PARTITION_LOCK.format(partition)
+            ):
+                owned.append(partition)
+
+        # GET_LOCK isn't transactional, but don't leave a transaction open for hours.
+        self.conn.commit()
+
+        with self.lock:
+            changed = self.owned_partitions != set(owned)
+            self.owned_partitions = set(owned)
+        if changed:
+            self.logger.info(
+                "Now syncing partitions {0} of {1} ({2} processes)".format(
+                    sorted(owned), self.partitions, members
+                )
+            )
+
+    def _alive(self) -> bool:
+        if self.conn is None:
+            return False
+        try:
+            if self.member is None:
+                return self.conn.execute(text("SELECT 1")).scalar() == 1
+            # Our member lock is a canary for all of them: they go together.
+            return self._scalar(
+                "SELECT IS_USED_LOCK(:name) = CONNECTION_ID()",
+                MEMBER_LOCK.format(self.member),
+            )
+        except Exception:
+            self.logger.warning("Lost the partition leases' connection", exc_info=True)
+            return False
+
+    def _claim_member(self) -> Optional[int]:
+        for slot in range(self.partitions):
+            if self._get_lock(MEMBER_LOCK.format(slot)):
+                return slot
+        self.logger.info(
+            "More sync processes than partitions; this one has nothing to do for now."
+        )
+        return None
+
+    def _disconnect(self):
+        with self.lock:
+            self.owned_partitions = set()
+        if self.conn is not None:
+            try:
+                self.conn.close()
+            except Exception:
+                pass
+        self.conn = None
+        self.member = None
+
+    def _get_lock(self, name: str) -> bool:
+        return self._scalar("SELECT GET_LOCK(:name, 0)", name) == 1
+
+    def _scalar(self, sql: str, name: str):
+        return self.conn.execute(text(sql), {"name": name}).scalar()
+
+
+# The leases for this process (see freezing.sync.run).
+leases = PartitionLeases()
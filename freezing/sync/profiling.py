@@ -0,0 +1,95 @@
+import cProfile
+import functools
+import io
+import logging
+import os
+import pstats
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Iterable, Tuple
+
+# Where the time goes that we care about, as (file, function) in the profile: waiting
+# on HTTP (every requests call ends up in Session.send) and on SQL.
+HTTP_FUNCTIONS = [("requests/sessions.py", "send")]
+SQL_FUNCTIONS = [
+    ("sqlalchemy/engine/default.py", "do_execute"),
+    ("sqlalchemy/engine/default.py", "do_executemany"),
+    ("sqlalchemy/engine/default.py", "do_execute_no_params"),
+]
+
+
+@contextmanager
+def profiled(
+    name: str, logger: logging.Logger = None, output: str = None, top: int = 20
+):
+    """
+    Profile the block with cProfile and log a summary: how many SQL statements ran,
+    the time spent in SQL and waiting on HTTP, and the top functions by cumulative time.
+
+    Only the calling thread is profiled, so work a job hands to a pool of threads (like
+    the photo listing) shows up as time waiting for the pool.
+
+    :param output: A file to save the full profile to (for pstats or snakeviz), or a
+                   directory to save it to under a name made from name and the time.
+    :param top: How many functions to list.
+    """
+    logger = logger or logging.getLogger(__name__)
+    profile = cProfile.Profile()
+    start = time.perf_counter()
+    profile.enable()
+    try:
+        yield profile
+    finally:
+        profile.disable()
+        elapsed = time.perf_counter() - start
+
+        buf = io.StringIO()
+        stats = pstats.Stats(profile, stream=buf)
+        sql_calls, sql_time = _totals(stats, SQL_FUNCTIONS)
+        _, http_time = _totals(stats, HTTP_FUNCTIONS)
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(top)
+        logger.info(
+            f"Profile of {name}: {elapsed:.2f}s total, {sql_calls} SQL statements "
+            f"taking {sql_time:.2f}s, {http_time:.2f}s waiting on HTTP\n"
+            f"{buf.getvalue()}"
+        )
+
+        if output:
+            path = output
+            if os.path.isdir(output):
+                stamp = datetime.now().strftime("%Y%m%dT%H%M%S")
+                path = os.path.join(output, f"{name}-{stamp}.prof")
+            stats.dump_stats(path)
+            logger.info(f"Saved the profile of {name} to {path}")
+
+
+def profiled_job(name: str, output: str = None):
+    """
+    Decorate a scheduled job so that every run of it is profiled (see profiled).
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with profiled(name, logger=logging.getLogger(name), output=output):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def _totals(
+    stats: pstats.Stats, functions: Iterable[Tuple[str, str]]
+) -> Tuple[int, float]:
+    """
+    :return: The number of calls to, and the cumulative time in, the functions.
+    """
+    calls, cumulative = 0, 0.0
+    for (filename, _, function), (_, ncalls, _, ctime, _) in stats.stats.items():
+        filename = filename.replace(os.sep, "/")
+        if any(filename.endswith(f) and function == fn for (f, fn) in functions):
+            calls += ncalls
+            cumulative += ctime
+    return calls, cumulative
@@ -1,7 +1,7 @@
 import threading
+from datetime import datetime, timedelta
 
 import arrow
-from apscheduler.schedulers.background import BackgroundScheduler
 from freezing.model import init_model
 from freezing.model.msg.mq import DefinedTubes
 from greenstalk import Client
@@ -10,8 +10,13 @@ from freezing.sync.autolog import log
 from freezing.sync.config import config, init_logging
 from freezing.sync.data.activity import ActivitySync
 from freezing.sync.data.athlete import AthleteSync
+from freezing.sync.data.backlog import BacklogSync
 from freezing.sync.data.photos import PhotoSync
+from freezing.sync.data.tokens import TokenSync
 from freezing.sync.data.weather import WeatherSync
+from freezing.sync.jobs import STRAVA, WEATHER, add_job, build_scheduler
+from freezing.sync.metrics import instrument_sessions
+from freezing.sync.partitions import leases
 
 # from freezing.sync.workflow import configured_publisher
 from freezing.sync.subscribe import ActivityUpdateSubscriber
@@ -32,10 +37,18 @@ def main():
     )
 
     init_model(config.SQLALCHEMY_URL)
+    instrument_sessions()
+
+    # With several sync processes, each takes a share of the athletes. The jobs that
+    # only work on this process's athletes' rides can then run in every process at once.
+    leases.start(config.SYNC_PARTITIONS, heartbeat=config.SYNC_PARTITION_HEARTBEAT)
+    exclusive_run = not leases.partitioned
 
     shutdown_event = threading.Event()
 
-    scheduler = BackgroundScheduler()
+    # Each job runs one instance at a time (across processes, too: see
+    # freezing.sync.jobs), and missed runs are run once rather than queueing up.
+    scheduler = build_scheduler()
 
     # workflow_publisher = configured_publisher()
 
@@ -43,6 +56,31 @@ def main():
     weather_sync = WeatherSync()
     athlete_sync = AthleteSync()
     photo_sync = PhotoSync()
+    token_sync = TokenSync()
+    backlog_sync = BacklogSync()
+
+    # Report how much work is waiting every 15 minutes. The counts scan the rides
+    # table, so not every minute.
+    add_job(
+        scheduler,
+        backlog_sync.report_backlog,
+        "interval",
+        name="report-backlog",
+        job_class="default",
+        minutes=15,
+    )
+
+    # Refresh access tokens before they expire (and once at startup), so that nothing
+    # else has to wait for a refresh.
+    add_job(
+        scheduler,
+        token_sync.refresh_tokens,
+        "interval",
+        name="refresh-tokens",
+        job_class=STRAVA,
+        minutes=config.STRAVA_TOKEN_REFRESH_INTERVAL.total_seconds() / 60,
+        next_run_time=datetime.now(),
+    )
 
     # Every hour run a sync on the activities for athletes
     # falling into the specified segment
@@ -55,22 +93,85 @@ def main():
             total_segments=4, segment=(arrow.now().hour % 4)
         )
 
-    scheduler.add_job(segmented_sync_activities, "cron", minute="50")
+    add_job(
+        scheduler,
+        segmented_sync_activities,
+        "cron",
+        name="sync-activities",
+        exclusive_run=exclusive_run,
+        job_class=STRAVA,
+        minute="50",
+    )
 
     # Sync ride details every 5 minutes. This only fetches rides flagged
     # for detail sync so won't hammer Strava. Mostly this only happens
     # when photo sync identifies photos but no primary.
-    scheduler.add_job(activity_sync.sync_rides_detail, "interval", minutes=5)
+    add_job(
+        scheduler,
+        activity_sync.sync_rides_detail,
+        "interval",
+        name="sync-details",
+        exclusive_run=exclusive_run,
+        job_class=STRAVA,
+        minutes=5,
+    )
 
-    # Sync weather every hour
-    scheduler.add_job(weather_sync.sync_weather, "cron", minute="45")
+    # Sync weather every hour for recent rides, and once a day for all the
+    # competition's rides, to catch any that were uploaded late.
+    def sync_weather():
+        weather_sync.sync_weather(
+            full=datetime.now(config.TIMEZONE).hour == config.WEATHER_FULL_SYNC_HOUR
+        )
 
-    # Sync athletes every hour
-    scheduler.add_job(athlete_sync.sync_athletes, "cron", minute="30")
+    add_job(
+        scheduler,
+        sync_weather,
+        "cron",
+        name="sync-weather",
+        exclusive_run=exclusive_run,
+        job_class=WEATHER,
+        minute="45",
+    )
+
+    # Once a day, warm the weather cache for where people have been riding, so that
+    # the hourly weather syncs mostly hit the cache.
+    add_job(
+        scheduler,
+        weather_sync.prefetch_weather,
+        "cron",
+        name="prefetch-weather",
+        job_class=WEATHER,
+        hour=config.WEATHER_PREFETCH_HOUR,
+        minute="20",
+        timezone=config.TIMEZONE,
+    )
+
+    # Refresh the athletes that are due every 15 minutes: new athletes and those
+    # without a team first, and everyone else once a day.
+    add_job(
+        scheduler,
+        athlete_sync.sync_athletes,
+        "interval",
+        name="sync-athletes",
+        exclusive_run=exclusive_run,
+        job_class=STRAVA,
+        minutes=15,
+        kwargs={"due_only": True},
+    )
 
     # Sync photos every 5 minutes. This only fetches rides flagged
-    # for sync so won't hammer Strava.
-    scheduler.add_job(photo_sync.sync_photos, "interval", minutes=5)
+    # for sync so won't hammer Strava. Whatever doesn't get done in 4 minutes waits
+    # for the next run rather than overlapping it.
+    add_job(
+        scheduler,
+        photo_sync.sync_photos,
+        "interval",
+        name="sync-photos",
+        exclusive_run=exclusive_run,
+        job_class=STRAVA,
+        minutes=5,
+        kwargs={"time_budget": timedelta(minutes=4)},
+    )
 
     scheduler.start()
 
@@ -86,6 +187,7 @@ def main():
     def shutdown_app():
         shutdown_event.wait()
         scheduler.shutdown()
+        leases.stop()
 
     shutdown_monitor = threading.Thread(target=shutdown_app)
     shutdown_monitor.start()
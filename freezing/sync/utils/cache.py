@@ -8,6 +8,8 @@ from stravalib.client import Client
 from stravalib.exc import ObjectNotFound
 from stravalib.model import BoundClientEntity, DetailedActivity, Stream
 
+from freezing.sync.metrics import timed
+
 
 class CachingAthleteObjectFetcher(metaclass=abc.ABCMeta):
     @property
@@ -87,7 +89,7 @@ class CachingAthleteObjectFetcher(metaclass=abc.ABCMeta):
         athlete_id: int,
         object_id: int,
         use_cache: bool = True,
-        only_cache: bool = False
+        only_cache: bool = False,
         # ):
     ) -> Optional[BoundClientEntity]:
         pass
@@ -98,7 +100,7 @@ class CachingAthleteObjectFetcher(metaclass=abc.ABCMeta):
         athlete_id: int,
         object_id: int,
         use_cache: bool = True,
-        only_cache: bool = False
+        only_cache: bool = False,
     ) -> Optional[Any]:
         """
         Fetches an object, possibly from cache, and returns the JSON for it.
@@ -110,9 +112,10 @@ class CachingAthleteObjectFetcher(metaclass=abc.ABCMeta):
         :return:
         """
         if use_cache:
-            object_json = self.get_cached_object_json(
-                athlete_id=athlete_id, object_id=object_id
-            )
+            with timed("cache.read", tags=[f"cache:{self.object_type}"]):
+                object_json = self.get_cached_object_json(
+                    athlete_id=athlete_id, object_id=object_id
+                )
         else:
             object_json = None
 
@@ -139,9 +142,12 @@ class CachingAthleteObjectFetcher(metaclass=abc.ABCMeta):
 
             try:
                 self.logger.info("Caching {} {}".format(self.object_type, object_id))
-                self.cache_object_json(
-                    athlete_id=athlete_id, object_id=object_id, object_json=object_json
-                )
+                with timed("cache.write", tags=[f"cache:{self.object_type}"]):
+                    self.cache_object_json(
+                        athlete_id=athlete_id,
+                        object_id=object_id,
+                        object_json=object_json,
+                    )
             except ObjectNotFound:
                 self.logger.debug(
                     "{} not found (ignoring): {}".format(self.object_type, object_id)
@@ -181,7 +187,7 @@ class CachingActivityFetcher(CachingAthleteObjectFetcher):
         athlete_id: int,
         object_id: int,
         use_cache: bool = True,
-        only_cache: bool = False
+        only_cache: bool = False,
     ) -> Optional[DetailedActivity]:
         """
         Fetches activity and returns it.
@@ -221,7 +227,7 @@ class CachingStreamFetcher(CachingAthleteObjectFetcher):
         athlete_id: int,
         object_id: int,
         use_cache: bool = True,
-        only_cache: bool = False
+        only_cache: bool = False,
     ) -> Optional[List[Stream]]:
         """
         Fetches activity and returns it.
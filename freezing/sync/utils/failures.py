@@ -0,0 +1,93 @@
+import logging
+from datetime import datetime, timedelta
+from typing import List
+
+from freezing.sync.utils.state import PartitionedState
+
+
+class FailureLog(object):
+    """
+    Persisted record of the objects (e.g. rides) whose sync keeps failing, so that the
+    backlog queries can leave them alone for a while instead of repeating a known-bad
+    request every run.
+
+    Like the RideError table, each entry keeps the reason and when it was last seen,
+    plus the number of attempts and when to next retry. The delay doubles with each
+    failed attempt, from base_delay up to max_delay.
+
+    The entries are kept by the athlete the object belongs to (see PartitionedState).
+    """
+
+    def __init__(
+        self,
+        path: str,
+        base_delay: timedelta,
+        max_delay: timedelta,
+        logger: logging.Logger = None,
+    ):
+        self.logger = logger or logging.getLogger(__name__)
+        self.state = PartitionedState(path, logger=self.logger)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def record(self, object_id: int, athlete_id: int, reason) -> datetime:
+        """
+        Record a failed attempt.
+
+        :return: When the object should next be retried.
+        """
+        now = datetime.utcnow()
+        state = self.state.for_athlete(athlete_id)
+        entry = state.get(str(object_id)) or {}
+        attempts = entry.get("attempts", 0) + 1
+        delay = min(self.base_delay * 2 ** min(attempts - 1, 20), self.max_delay)
+        next_retry = now + delay
+        state[str(object_id)] = {
+            "attempts": attempts,
+            "next_retry": next_retry.isoformat(),
+            "last_seen": now.isoformat(),
+            "reason": str(reason)[:1024],
+        }
+        self.logger.info(
+            "Attempt {0} for {1} failed, next retry after {2}".format(
+                attempts, object_id, next_retry
+            )
+        )
+        return next_retry
+
+    def clear(self, object_id: int, athlete_id: int):
+        """
+        Forget about an object's failures, e.g. because it has now succeeded.
+        """
+        self.state.for_athlete(athlete_id).pop(str(object_id))
+
+    def backing_off(self) -> List[int]:
+        """
+        :return: The ids of the objects that shouldn't be retried yet.
+        """
+        now = datetime.utcnow()
+        ids = []
+        for object_id, entry in self.state.items():
+            next_retry = datetime.fromisoformat(entry["next_retry"])
+            if next_retry > now:
+                ids.append(int(object_id))
+            elif next_retry < now - self.max_delay:
+                # Long enough ago that it must have succeeded or gone away.
+                self.state.discard(object_id)
+        return ids
+
+    def retrying(self) -> List[int]:
+        """
+        :return: The ids of the objects that have failed before and are due a retry.
+        """
+        now = datetime.utcnow()
+        return [
+            int(object_id)
+            for object_id, entry in self.state.items()
+            if now - self.max_delay
+            <= datetime.fromisoformat(entry["next_retry"])
+            <= now
+        ]
+
+    def save(self):
+        self.state.save()
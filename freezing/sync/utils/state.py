@@ -0,0 +1,156 @@
+import json
+import logging
+import os
+import threading
+from typing import Any, Dict, Iterable, Iterator, List, Set, Tuple
+
+from freezing.sync.config import config
+from freezing.sync.partitions import leases, partition_of
+
+
+class StateFile(object):
+    """
+    A small JSON document of sync bookkeeping that doesn't belong in the database,
+    keyed by string.
+
+    The file is read once when opened. save() writes back only the entries changed
+    since, on top of what is in the file by then, so that another process saving the
+    same file in the meantime doesn't lose its entries (unless they are the same ones).
+    A missing or unreadable file is treated as empty and a failed save is logged rather
+    than raised.
+    """
+
+    def __init__(self, path: str, logger: logging.Logger = None):
+        self.path = path
+        self.logger = logger or logging.getLogger(__name__)
+        self.data: Dict[str, Any] = self._load()
+        self.changed: Set[str] = set()
+
+    def _load(self) -> Dict[str, Any]:
+        try:
+            with open(self.path, "r") as fp:
+                data = json.load(fp)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError):
+            self.logger.warning(f"Ignoring unreadable state file {self.path}")
+            return {}
+        return data if isinstance(data, dict) else {}
+
+    def save(self):
+        if not self.changed:
+            return
+        data = self._load()
+        for key in self.changed:
+            if key in self.data:
+                data[key] = self.data[key]
+            else:
+                data.pop(key, None)
+        self.data = data
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w") as fp:
+                json.dump(self.data, fp)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            self.logger.warning(f"Unable to save state file {self.path}", exc_info=True)
+        else:
+            self.changed.clear()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self.data.get(key, default)
+
+    def pop(self, key: str, default: Any = None) -> Any:
+        if key in self.data:
+            self.changed.add(key)
+        return self.data.pop(key, default)
+
+    def __getitem__(self, key: str) -> Any:
+        return self.data[key]
+
+    def __setitem__(self, key: str, value: Any):
+        self.data[key] = value
+        self.changed.add(key)
+
+    def __delitem__(self, key: str):
+        del self.data[key]
+        self.changed.add(key)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.data
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self.data))
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def items(self):
+        return list(self.data.items())
+
+
+class PartitionedState(object):
+    """
+    Sync bookkeeping about athletes or their rides, kept in a StateFile for each
+    partition of the athletes (see freezing.sync.partitions), so that sync processes
+    sharing the athletes out only write the files of their own partitions. With one
+    partition it is the single file at path.
+
+    Entries are reached through the file for their athlete (loaded when first needed),
+    and items() covers the partitions this process holds. Changing SYNC_PARTITIONS
+    starts the files afresh.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        partitions: int = None,
+        held: Iterable[int] = None,
+        logger: logging.Logger = None,
+    ):
+        """
+        :param partitions: How many partitions there are (default SYNC_PARTITIONS).
+        :param held: The partitions this process holds (default those it has leased,
+                     or all of them when it isn't sharing the work).
+        """
+        self.path = path
+        self.logger = logger or logging.getLogger(__name__)
+        self.partitions = max(1, partitions or config.SYNC_PARTITIONS)
+        if held is None:
+            held = leases.owned() if leases.partitioned else range(self.partitions)
+        self.held = sorted(held)
+        self.files: Dict[int, StateFile] = {}
+        for partition in self.held:
+            self._file(partition)
+
+    def for_athlete(self, athlete_id: int) -> StateFile:
+        """
+        :return: The file for the athlete's partition.
+        """
+        return self._file(partition_of(athlete_id, self.partitions))
+
+    def items(self) -> List[Tuple[str, Any]]:
+        return [
+            item for partition in self.held for item in self._file(partition).items()
+        ]
+
+    def discard(self, key: str):
+        """
+        Remove an entry, from whichever partition's file it is in.
+        """
+        for state in self.files.values():
+            state.pop(key)
+
+    def save(self):
+        for state in self.files.values():
+            state.save()
+
+    def _file(self, partition: int) -> StateFile:
+        if partition not in self.files:
+            path = self.path
+            if self.partitions > 1:
+                root, ext = os.path.splitext(self.path)
+                path = f"{root}.{partition}-of-{self.partitions}{ext}"
+            self.files[partition] = StateFile(path, logger=self.logger)
+        return self.files[partition]
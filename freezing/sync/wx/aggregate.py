@@ -0,0 +1,93 @@
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+from statistics import mean
+from typing import Any, Dict, List
+
+
+class RideWeatherAggregator(object):
+    """
+    Summarizes the weather during rides from a forecast's hourly observations.
+
+    The hours are turned into sorted columns once, so each ride that shares the
+    forecast costs a couple of binary searches rather than scans over every hour.
+    """
+
+    def __init__(self, hours: List[Any]):
+        hours = sorted(hours, key=lambda h: h.time)
+        if not hours:
+            raise ValueError("No hourly observations to aggregate.")
+        self.times = [h.time.timestamp() for h in hours]
+        self.temperature = [h.temperature for h in hours]
+        self.apparent_temperature = [h.apparent_temperature for h in hours]
+        self.precip_accumulation = [h.precip_accumulation for h in hours]
+        self.rain = [h.precip_type == "rain" for h in hours]
+        self.snow = [h.precip_type == "snow" for h in hours]
+        self.wind_speed = [h.wind_speed for h in hours]
+        self.wind_gust = [h.wind_gust for h in hours]
+
+    def nearest(self, t: float) -> int:
+        """
+        :return: The index of the (first) observation closest to t, preferring the
+                 earlier one if two are equally close.
+        """
+        i = bisect_left(self.times, t)
+        if i == len(self.times) or (
+            i > 0 and t - self.times[i - 1] <= self.times[i] - t
+        ):
+            i -= 1
+        return bisect_left(self.times, self.times[i])
+
+    def aggregate(
+        self, start: datetime, end: datetime, moving_time: float
+    ) -> Dict[str, Any]:
+        """
+        Summarize the weather for one ride.
+
+        :param start: When the ride started (timezone aware).
+        :param end: When the ride ended (timezone aware).
+        :param moving_time: How long the rider was moving, in seconds.
+        :return: The ride_* and wind_* values for the ride's RideWeather.
+        """
+        t_start, t_end = start.timestamp(), end.timestamp()
+        first = self.nearest(t_start)
+        last = self.nearest(t_end)
+
+        # NOTE: if elapsed_time is significantly more than moving_time then we need to assume
+        # that the rider wasn't actually riding for this entire time (and maybe just grab temps closest to start of
+        # ride as opposed to averaging observations during ride.
+        lo, hi = bisect_left(self.times, t_start), bisect_right(self.times, t_end)
+        if hi - lo <= 2:
+            # if we don't have many observations, bookend the list with the start/end observations without double counting
+            observations = (
+                [first]
+                + [i for i in range(lo, hi) if i != first and i != last]
+                + [last]
+            )
+
+            def column(values):
+                return [values[i] for i in observations]
+
+            num_observations = len(observations)
+        else:
+
+            def column(values):
+                return values[lo:hi]
+
+            num_observations = hi - lo
+
+        # scale the cumulative precipitation over the observation period by the fraction of time spent moving
+        scale = moving_time / (num_observations * 3600)
+
+        return {
+            "ride_temp_start": self.temperature[first],
+            "ride_temp_end": self.temperature[last],
+            "ride_temp_avg": mean(column(self.temperature)),
+            "ride_windchill_start": self.apparent_temperature[first],
+            "ride_windchill_end": self.apparent_temperature[last],
+            "ride_windchill_avg": mean(column(self.apparent_temperature)),
+            "ride_precip": sum(column(self.precip_accumulation)) * scale,
+            "ride_rain": any(column(self.rain)),
+            "ride_snow": any(column(self.snow)),
+            "wind_speed": mean(column(self.wind_speed)),
+            "wind_gust": max(column(self.wind_gust)),
+        }
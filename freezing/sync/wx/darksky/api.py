@@ -3,9 +3,9 @@ from datetime import datetime
 from json import dumps, load, loads
 from logging import Logger, getLogger
 
-from requests import get
 from requests.exceptions import HTTPError
 
+from ..transport import Transport, shared_transport
 from .model import Forecast
 
 # there is a nice dark sky library, but it is GPL and thus incompatible.
@@ -23,6 +23,7 @@ class HistoDarkSky(object):
         cache_dir: str = None,
         cache_only: bool = False,
         logger: Logger = None,
+        transport: Transport = None,
     ):
         self.api_key = api_key
         self.cache_dir = cache_dir
@@ -30,6 +31,7 @@ class HistoDarkSky(object):
         self.logger = logger or getLogger(__name__)
         if cache_only and not cache_dir:
             raise RuntimeError("Cache only but no cache dir 8(")
+        self.transport = transport or shared_transport("darksky", logger=self.logger)
 
     def histo_forecast(
         self, time: datetime, latitude: float, longitude: float
@@ -48,13 +50,11 @@ class HistoDarkSky(object):
         )
 
     def _forecast(self, time: datetime, latitude: float, longitude: float):
-        response = get(
+        response = self.transport.get(
             url=f"https://api.darksky.net/forecast/{self.api_key}/{latitude},{longitude},{time.isoformat()}",
             params={"units": "us", "exclude": "minutely,alerts,flags"},
-            headers={"Accept-Encoding": "gzip"},
-            timeout=15,
         )
-        if response.status_code is not 200:
+        if response.status_code != 200:
             raise HTTPError(
                 f"Bad response: {response.status_code} {response.reason}: {response.text}"
             )
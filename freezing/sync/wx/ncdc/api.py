@@ -2,12 +2,10 @@ import functools
 import json
 import logging
 import os
-import time
 import urllib.parse
 from datetime import datetime
 
-import requests
-
+from ..transport import Transport, shared_transport
 from . import model
 
 """
@@ -43,12 +41,18 @@ class Fault(Exception):
 class Client(object):
     base_url = urllib.parse.urlparse("http://www.ncdc.noaa.gov/cdo-services/services")
 
-    def __init__(self, token, cache_dir=None):
+    def __init__(self, token, cache_dir=None, transport: Transport = None):
         self.log = logging.getLogger(
             "{0.__module__}.{0.__name__}".format(self.__class__)
         )
         self.token = token
         self.cache_dir = cache_dir
+        # Requests are spaced a second apart to start with (unless WX_MIN_REQUEST_INTERVAL
+        # says otherwise), since otherwise we can get 503 errors from the server; the
+        # transport slows down further if we still do.
+        self.transport = transport or shared_transport(
+            "ncdc", min_interval=1.0, logger=self.log
+        )
         if self.cache_dir and not os.path.exists(self.cache_dir):
             os.makedirs(self.cache_dir)
 
@@ -96,13 +100,10 @@ class Client(object):
         )
 
         self.log.debug("GET {0!r} with params {1!r}".format(url, params))
-        raw = requests.get(url, params=params)
+        raw = self.transport.get(url, params=params)
         raw.raise_for_status()
         self._handle_protocol_error(raw.json())
 
-        # We add a 1s pause here, since otherwise we can get 503 errors from the server
-        time.sleep(1.0)
-
         return raw
 
     def datasets(self):
@@ -212,7 +213,6 @@ if __name__ == "__main__":
                 print("Getting station data for %r" % r)
                 coll = c.station_data(station=r.id, date=desired_date)
                 desired_data.fill(coll)
-                time.sleep(1.0)
             else:
                 print("Skipping station %r because date doesn't match." % r)
     else:
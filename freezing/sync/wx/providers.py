@@ -0,0 +1,157 @@
+import abc
+from datetime import datetime, timedelta
+from logging import Logger, getLogger
+from typing import Dict, Iterable, List, Tuple
+
+from requests.exceptions import ConnectionError, HTTPError, Timeout
+
+from .transport import RETRY_STATUSES
+from .visualcrossing.api import HistoVisualCrossing
+from .visualcrossing.model import Forecast
+
+# All providers return weather in the Visual Crossing model (a Forecast of Days of
+# Hours), since that's the one the weather sync works with. Visual Crossing is the only
+# one for now: the other weather APIs in freezing.sync.wx (Dark Sky, Weather Underground
+# and NCDC's old CDO services) have been shut down.
+
+
+class WeatherProvider(metaclass=abc.ABCMeta):
+    """
+    A source of historical hourly weather.
+    """
+
+    name: str
+
+    @abc.abstractmethod
+    def is_cached(
+        self, start: datetime, end: datetime, latitude: float, longitude: float
+    ) -> bool:
+        """
+        :return: Whether every day from start to end can be answered without a request.
+        """
+
+    @abc.abstractmethod
+    def histo_forecast_range(
+        self, start: datetime, end: datetime, latitude: float, longitude: float
+    ) -> Forecast:
+        """
+        :return: The weather for every day from start to end, inclusive.
+        """
+
+    def prefetch(self, requests: Iterable[Tuple[datetime, datetime, float, float]]):
+        """
+        Warm the cache for a batch of (start, end, latitude, longitude) requests, if the
+        provider can do that any quicker than one at a time.
+
+        :return: The number of requests made.
+        """
+        return 0
+
+
+class VisualCrossingProvider(WeatherProvider):
+    name = "visualcrossing"
+
+    def __init__(self, client: HistoVisualCrossing):
+        self.client = client
+
+    def is_cached(
+        self, start: datetime, end: datetime, latitude: float, longitude: float
+    ) -> bool:
+        return all(
+            self.client.is_cached(time=as_of, latitude=latitude, longitude=longitude)
+            for as_of in self.client._as_of_times(start=start, end=end)
+        )
+
+    def histo_forecast_range(
+        self, start: datetime, end: datetime, latitude: float, longitude: float
+    ) -> Forecast:
+        return self.client.histo_forecast_range(
+            start=start, end=end, latitude=latitude, longitude=longitude
+        )
+
+    def prefetch(self, requests: Iterable[Tuple[datetime, datetime, float, float]]):
+        return self.client.prefetch(requests)
+
+
+class WeatherRouter(object):
+    """
+    Gets weather from whichever provider can give it, so that weather keeps flowing
+    during an outage or when a provider's quota runs out.
+
+    A provider that already has the weather cached is asked first. Otherwise the
+    providers are tried in order. A provider that is down (it can't be reached, or is
+    still throttling or failing after the transport's retries) is skipped for cooldown
+    before it is tried again (unless it has the weather cached), so an outage costs one
+    failed request rather than one per ride. Any other error is down to the request
+    itself, so it is raised for that ride alone.
+    """
+
+    def __init__(
+        self,
+        providers: List[WeatherProvider],
+        cooldown: timedelta = timedelta(minutes=10),
+        logger: Logger = None,
+    ):
+        if not providers:
+            raise ValueError("No weather providers configured.")
+        self.providers = providers
+        self.cooldown = cooldown
+        self.logger = logger or getLogger(__name__)
+        self.down_until: Dict[str, datetime] = {}
+
+    def histo_forecast_range(
+        self, start: datetime, end: datetime, latitude: float, longitude: float
+    ) -> Forecast:
+        cached = [
+            p
+            for p in self.providers
+            if p.is_cached(start=start, end=end, latitude=latitude, longitude=longitude)
+        ]
+        now = datetime.utcnow()
+        available = [
+            p
+            for p in self.providers
+            if p not in cached and self.down_until.get(p.name, now) <= now
+        ]
+
+        errors = []
+        for provider in cached + available:
+            try:
+                return provider.histo_forecast_range(
+                    start=start, end=end, latitude=latitude, longitude=longitude
+                )
+            except Exception as x:
+                if not _is_outage(x):
+                    raise
+                self.logger.warning(
+                    f"Error getting weather from {provider.name}, "
+                    f"skipping it for {self.cooldown}: {x}"
+                )
+                self.down_until[provider.name] = datetime.utcnow() + self.cooldown
+                errors.append(f"{provider.name}: {x}")
+
+        raise RuntimeError(
+            f"No weather for {longitude}x{latitude} from {start} to {end}: "
+            + ("; ".join(errors) or "all providers are cooling down")
+        )
+
+    def prefetch(self, requests: Iterable[Tuple[datetime, datetime, float, float]]):
+        """
+        Warm the first provider's cache; the others are only there for when it fails.
+        """
+        return self.providers[0].prefetch(requests)
+
+
+def _is_outage(x: Exception) -> bool:
+    """
+    :return: Whether an error means the provider is down, rather than that something is
+             wrong with the one request.
+    """
+    if isinstance(x, (ConnectionError, Timeout)):
+        return True
+    response = getattr(x, "response", None)
+    return (
+        isinstance(x, HTTPError)
+        and response is not None
+        and response.status_code in RETRY_STATUSES
+    )
@@ -4,15 +4,165 @@ Adapted from http://michelanders.blogspot.com/2010/12/calulating-sunrise-and-sun
 
 from __future__ import division
 
-from datetime import datetime, time
+from datetime import date, datetime, time
+from functools import lru_cache
 from math import acos, asin, cos
 from math import degrees as deg
 from math import radians as rad
 from math import sin, tan
+from typing import Iterable, List, NamedTuple, Tuple
 
 import pytz
 from dateutil.tz import tzlocal
 
+# Locations are rounded to this many decimal places for the memoized table. Up to 60
+# degrees north or south, that is at most about a minute out for sunrise and sunset
+# (almost all of it from the latitude), and more towards the poles.
+TABLE_PLACES = 1
+
+
+class SunTimes(NamedTuple):
+    sunrise: time
+    sunset: time
+    solarnoon: time
+
+
+def _dayfromdate(when: date) -> int:
+    # datetime days are numbered in the Gregorian calendar
+    # while the calculations from NOAA are distibuted as
+    # OpenOffice spreadsheets with days numbered from
+    # 1/1/1900. The difference are those numbers taken for
+    # 18/12/2010
+    return when.toordinal() - (734124 - 40529)
+
+
+def _calc(latitude, longitude, day, time, timezone):
+    """
+    Perform the actual calculations for sunrise, sunset and
+    a number of related quantities.
+
+    latitude and longitude are in decimal degrees (north and east are positive), day is
+    the NOAA day number, time is the fraction of the day past midnight and timezone is
+    in hours (east is positive).
+
+    Returns the (solarnoon, sunrise, sunset) fractions of the day.
+    """
+    Jday = day + 2415018.5 + time - timezone / 24  # Julian day
+    Jcent = (Jday - 2451545) / 36525  # Julian century
+
+    Manom = 357.52911 + Jcent * (35999.05029 - 0.0001537 * Jcent)
+    Mlong = 280.46646 + Jcent * (36000.76983 + Jcent * 0.0003032) % 360
+    Eccent = 0.016708634 - Jcent * (0.000042037 + 0.0001537 * Jcent)
+    Mobliq = (
+        23
+        + (
+            26
+            + ((21.448 - Jcent * (46.815 + Jcent * (0.00059 - Jcent * 0.001813)))) / 60
+        )
+        / 60
+    )
+    obliq = Mobliq + 0.00256 * cos(rad(125.04 - 1934.136 * Jcent))
+    vary = tan(rad(obliq / 2)) * tan(rad(obliq / 2))
+    Seqcent = (
+        sin(rad(Manom)) * (1.914602 - Jcent * (0.004817 + 0.000014 * Jcent))
+        + sin(rad(2 * Manom)) * (0.019993 - 0.000101 * Jcent)
+        + sin(rad(3 * Manom)) * 0.000289
+    )
+    Struelong = Mlong + Seqcent
+    Sapplong = Struelong - 0.00569 - 0.00478 * sin(rad(125.04 - 1934.136 * Jcent))
+    declination = deg(asin(sin(rad(obliq)) * sin(rad(Sapplong))))
+
+    eqtime = 4 * deg(
+        vary * sin(2 * rad(Mlong))
+        - 2 * Eccent * sin(rad(Manom))
+        + 4 * Eccent * vary * sin(rad(Manom)) * cos(2 * rad(Mlong))
+        - 0.5 * vary * vary * sin(4 * rad(Mlong))
+        - 1.25 * Eccent * Eccent * sin(2 * rad(Manom))
+    )
+
+    hourangle = deg(
+        acos(
+            cos(rad(90.833)) / (cos(rad(latitude)) * cos(rad(declination)))
+            - tan(rad(latitude)) * tan(rad(declination))
+        )
+    )
+
+    solarnoon_t = (720 - 4 * longitude - eqtime + timezone * 60) / 1440
+    sunrise_t = solarnoon_t - hourangle * 4 / 1440
+    sunset_t = solarnoon_t + hourangle * 4 / 1440
+    return solarnoon_t, sunrise_t, sunset_t
+
+
+def _timefromdecimalday(day):
+    """
+    returns a datetime.time object.
+
+    day is a decimal day between 0.0 and 1.0, e.g. noon = 0.5
+    """
+    hours = (24 * day) % 24
+    h = int(hours)
+    minutes = (hours - h) * 60
+    m = int(minutes)
+    seconds = (minutes - m) * 60
+    s = int(seconds)
+    return time(hour=h, minute=m, second=s)
+
+
+@lru_cache(maxsize=65536)
+def _table(lat_key: float, lon_key: float, day: int):
+    """
+    Memoized UTC (solarnoon, sunrise, sunset) day fractions for a rounded location and
+    a NOAA day number, computed at UTC noon.
+    """
+    return _calc(lat_key, lon_key, day, 0.5, 0)
+
+
+def sun_times(lat, lon, when) -> SunTimes:
+    """
+    Sunrise, sunset and solar noon for a location on a day, from the memoized table.
+
+    when is a date (times are then UTC) or a datetime, whose UTC offset (if it has one)
+    gives the timezone of the returned times. This is pure and safe to call from any
+    thread.
+    """
+    return _sun_times(_table(*_table_key(lat, lon, when)), when)
+
+
+def sun_times_many(points: Iterable[Tuple[float, float, date]]) -> List[SunTimes]:
+    """
+    sun_times for a batch of (lat, lon, when) points, e.g. every day of a forecast.
+
+    Points that share a rounded location and day (rides from the same neighbourhood on
+    the same day) are only looked up once.
+    """
+    points = list(points)
+    keys = [_table_key(lat, lon, when) for lat, lon, when in points]
+    table = {key: _table(*key) for key in set(keys)}
+    return [_sun_times(table[key], when) for key, (_, _, when) in zip(keys, points)]
+
+
+def _table_key(lat, lon, when) -> Tuple[float, float, int]:
+    return (
+        round(float(lat), TABLE_PLACES),
+        round(float(lon), TABLE_PLACES),
+        _dayfromdate(when),
+    )
+
+
+def _sun_times(fractions, when) -> SunTimes:
+    """
+    The table's UTC day fractions as times in when's timezone.
+    """
+    offset = when.utcoffset() if isinstance(when, datetime) else None
+    timezone = offset.total_seconds() / 3600.0 if offset is not None else 0
+    solarnoon_t, sunrise_t, sunset_t = fractions
+    shift = timezone / 24
+    return SunTimes(
+        sunrise=_timefromdecimalday(sunrise_t + shift),
+        sunset=_timefromdecimalday(sunset_t + shift),
+        solarnoon=_timefromdecimalday(solarnoon_t + shift),
+    )
+
 
 class Sun:
     """
@@ -25,6 +175,10 @@ class Sun:
     import sunrise
     s = Sun(lat=49,lon=3)
     print('sunrise at ',s.sunrise(when=datetime.datetime.now())
+
+    This calculates exactly for the location and time given, and keeps no state between
+    calls, so one Sun can be shared between threads. For many rides, sun_times_many is
+    cheaper.
     """
 
     def __init__(self, lat, lon):
@@ -38,113 +192,38 @@ class Sun:
         a local time zone is assumed (including daylight saving
         if present)
         """
-        self._preptime(when)
-        self._calc()
-        return self._timefromdecimalday(self.sunrise_t)
+        return self._timefromdecimalday(self._calc(when)[1])
 
     def sunset(self, when):
-        self._preptime(when)
-        self._calc()
-        return self._timefromdecimalday(self.sunset_t)
+        return self._timefromdecimalday(self._calc(when)[2])
 
     def solarnoon(self, when):
-        self._preptime(when)
-        self._calc()
-        return self._timefromdecimalday(self.solarnoon_t)
+        return self._timefromdecimalday(self._calc(when)[0])
 
     @classmethod
     def _timefromdecimalday(cls, day):
-        """
-        returns a datetime.time object.
-
-        day is a decimal day between 0.0 and 1.0, e.g. noon = 0.5
-        """
-        hours = (24 * day) % 24
-        h = int(hours)
-        minutes = (hours - h) * 60
-        m = int(minutes)
-        seconds = (minutes - m) * 60
-        s = int(seconds)
-        return time(hour=h, minute=m, second=s)
+        return _timefromdecimalday(day)
 
     def _preptime(self, when):
         """
         Extract information in a suitable format from when,
         a datetime.datetime object.
+
+        Returns the (day, time, timezone) to calculate for.
         """
-        # datetime days are numbered in the Gregorian calendar
-        # while the calculations from NOAA are distibuted as
-        # OpenOffice spreadsheets with days numbered from
-        # 1/1/1900. The difference are those numbers taken for
-        # 18/12/2010
-        self.day = when.toordinal() - (734124 - 40529)
+        day = _dayfromdate(when)
         t = when.time()
-        self.time = (t.hour + t.minute / 60.0 + t.second / 3600.0) / 24.0
+        time = (t.hour + t.minute / 60.0 + t.second / 3600.0) / 24.0
 
-        self.timezone = 0
+        timezone = 0
         offset = when.utcoffset()
         if not offset is None:
-            self.timezone = offset.seconds / 3600.0
-
-    def _calc(self):
-        """
-        Perform the actual calculations for sunrise, sunset and
-        a number of related quantities.
-
-        The results are stored in the instance variables
-        sunrise_t, sunset_t and solarnoon_t
-        """
-        timezone = self.timezone  # in hours, east is positive
-        longitude = self.lon  # in decimal degrees, east is positive
-        latitude = self.lat  # in decimal degrees, north is positive
-
-        time = self.time  # percentage past midnight, i.e. noon  is 0.5
-        day = self.day  # daynumber 1=1/1/1900
-
-        Jday = day + 2415018.5 + time - timezone / 24  # Julian day
-        Jcent = (Jday - 2451545) / 36525  # Julian century
-
-        Manom = 357.52911 + Jcent * (35999.05029 - 0.0001537 * Jcent)
-        Mlong = 280.46646 + Jcent * (36000.76983 + Jcent * 0.0003032) % 360
-        Eccent = 0.016708634 - Jcent * (0.000042037 + 0.0001537 * Jcent)
-        Mobliq = (
-            23
-            + (
-                26
-                + ((21.448 - Jcent * (46.815 + Jcent * (0.00059 - Jcent * 0.001813))))
-                / 60
-            )
-            / 60
-        )
-        obliq = Mobliq + 0.00256 * cos(rad(125.04 - 1934.136 * Jcent))
-        vary = tan(rad(obliq / 2)) * tan(rad(obliq / 2))
-        Seqcent = (
-            sin(rad(Manom)) * (1.914602 - Jcent * (0.004817 + 0.000014 * Jcent))
-            + sin(rad(2 * Manom)) * (0.019993 - 0.000101 * Jcent)
-            + sin(rad(3 * Manom)) * 0.000289
-        )
-        Struelong = Mlong + Seqcent
-        Sapplong = Struelong - 0.00569 - 0.00478 * sin(rad(125.04 - 1934.136 * Jcent))
-        declination = deg(asin(sin(rad(obliq)) * sin(rad(Sapplong))))
-
-        eqtime = 4 * deg(
-            vary * sin(2 * rad(Mlong))
-            - 2 * Eccent * sin(rad(Manom))
-            + 4 * Eccent * vary * sin(rad(Manom)) * cos(2 * rad(Mlong))
-            - 0.5 * vary * vary * sin(4 * rad(Mlong))
-            - 1.25 * Eccent * Eccent * sin(2 * rad(Manom))
-        )
-
-        hourangle = deg(
-            acos(
-                cos(rad(90.833)) / (cos(rad(latitude)) * cos(rad(declination)))
-                - tan(rad(latitude)) * tan(rad(declination))
-            )
-        )
+            timezone = offset.total_seconds() / 3600.0
+        return day, time, timezone
 
-        self.solarnoon_t = (720 - 4 * longitude - eqtime + timezone * 60) / 1440
-        self.sunrise_t = self.solarnoon_t - hourangle * 4 / 1440
-        self.sunset_t = self.solarnoon_t + hourangle * 4 / 1440
+    def _calc(self, when):
+        day, time, timezone = self._preptime(when)
+        return _calc(self.lat, self.lon, day, time, timezone)
 
 
 if __name__ == "__main__":
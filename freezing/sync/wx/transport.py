@@ -0,0 +1,191 @@
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from logging import Logger, getLogger
+from typing import Dict, Optional
+
+from requests import Response, Session
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError, Timeout
+
+from freezing.sync.config import config, statsd
+
+# Statuses that mean "not now" rather than "no": worth backing off and trying again.
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class RateLimiter(object):
+    """
+    Adaptive pacing for requests to one provider, shared between threads.
+
+    Requests are spaced at least interval seconds apart. The interval starts at
+    min_interval, doubles (or jumps to the server's Retry-After) whenever the provider
+    pushes back, and eases back down towards min_interval as requests succeed.
+    """
+
+    def __init__(
+        self,
+        min_interval: float = 0.0,
+        max_interval: float = 60.0,
+        clock=time.monotonic,
+        sleep=time.sleep,
+    ):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.interval = min_interval
+        self.clock = clock
+        self.sleep = sleep
+        self.next_time = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        """
+        Block until it is this caller's turn to make a request.
+        """
+        with self.lock:
+            now = self.clock()
+            start = max(now, self.next_time)
+            self.next_time = start + self.interval
+        if start > now:
+            self.sleep(start - now)
+
+    def slow_down(self, retry_after: Optional[float] = None):
+        with self.lock:
+            interval = max(self.interval * 2, 1.0, retry_after or 0.0)
+            self.interval = min(interval, self.max_interval)
+            if retry_after:
+                self.next_time = max(
+                    self.next_time, self.clock() + min(retry_after, self.max_interval)
+                )
+
+    def speed_up(self):
+        with self.lock:
+            if self.interval > self.min_interval:
+                self.interval = max(self.min_interval, self.interval * 0.75)
+
+
+class Transport(object):
+    """
+    HTTP for a weather provider: one keep-alive session with gzip, paced by a
+    RateLimiter, which retries connection errors, 429s and 5xxs with exponential backoff
+    (or the Retry-After the server asked for, if that's longer). A Retry-After longer
+    than the limiter's max_interval isn't waited for: the error is returned instead.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        min_interval: float = 0.0,
+        max_retries: int = 3,
+        backoff: float = 1.0,
+        pool_size: int = 4,
+        timeout: float = 15,
+        logger: Logger = None,
+        sleep=time.sleep,
+    ):
+        self.name = name
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.logger = logger or getLogger(__name__)
+        self.sleep = sleep
+        self.limiter = RateLimiter(min_interval=min_interval, sleep=sleep)
+        self.session = Session()
+        self.session.headers.update({"Accept-Encoding": "gzip"})
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, pool_size))
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def get(self, url: str, params: dict = None, **kwargs) -> Response:
+        """
+        GET a URL, retrying anything that might work next time.
+
+        :return: The response, which may still be an error if the retries ran out or the
+                 error isn't one worth retrying.
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        for attempt in range(self.max_retries + 1):
+            self.limiter.wait()
+            delay = self.backoff * 2**attempt
+            start = time.perf_counter()
+            try:
+                response = self.session.get(url, params=params, **kwargs)
+            except (ConnectionError, Timeout) as x:
+                if attempt == self.max_retries:
+                    raise
+                self.logger.info(
+                    f"{self.name}: {x}, retrying in {delay}s "
+                    f"({attempt + 1}/{self.max_retries})"
+                )
+                self.sleep(delay)
+                continue
+
+            statsd.timing(
+                "weather.request",
+                (time.perf_counter() - start) * 1000,
+                tags=[f"provider:{self.name}", f"status:{response.status_code}"],
+            )
+            if response.status_code not in RETRY_STATUSES:
+                self.limiter.speed_up()
+                return response
+
+            retry_after = _retry_after(response)
+            self.limiter.slow_down(retry_after)
+            if attempt == self.max_retries:
+                return response
+            if retry_after and retry_after > self.limiter.max_interval:
+                # Not worth holding up the job (and the provider's thread) for.
+                self.logger.info(
+                    f"{self.name}: {response.status_code} {response.reason}, asked to "
+                    f"wait {retry_after}s, not retrying"
+                )
+                return response
+            delay = min(max(delay, retry_after or 0.0), self.limiter.max_interval)
+            self.logger.info(
+                f"{self.name}: {response.status_code} {response.reason}, retrying in "
+                f"{delay}s ({attempt + 1}/{self.max_retries})"
+            )
+            self.sleep(delay)
+
+
+def _retry_after(response: Response) -> Optional[float]:
+    """
+    :return: How many seconds the Retry-After header asks us to wait, if it's there.
+    """
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+_transports: Dict[str, Transport] = {}
+_transports_lock = threading.Lock()
+
+
+def shared_transport(name: str, **kwargs) -> Transport:
+    """
+    The Transport for a provider, shared by every client of that provider in the
+    process so that they share connections and pacing. The keyword arguments are only
+    used when the first client asks for it.
+
+    The provider's entry in WX_MIN_REQUEST_INTERVAL, if it has one, overrides the
+    min_interval the client asks for, and max_retries defaults to WX_MAX_RETRIES.
+    """
+    with _transports_lock:
+        if name not in _transports:
+            if name in config.WX_MIN_REQUEST_INTERVAL:
+                kwargs["min_interval"] = config.WX_MIN_REQUEST_INTERVAL[name]
+            kwargs.setdefault("max_retries", config.WX_MAX_RETRIES)
+            _transports[name] = Transport(name, **kwargs)
+        return _transports[name]
@@ -1,13 +1,19 @@
-import os
-from datetime import datetime
-from json import dumps, load, loads
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from json import loads
 from logging import Logger, getLogger
+from typing import Iterable, List, Tuple
 
-from requests import get
 from requests.exceptions import HTTPError
 
+from ..transport import Transport, shared_transport
+from .cache import DayCache
 from .model import Forecast
 
+# The most days we will ask for in one request when backfilling.
+MAX_RANGE_DAYS = 7
+
 
 class HistoVisualCrossing(object):
     """
@@ -20,74 +26,237 @@ class HistoVisualCrossing(object):
         cache_dir: str = None,
         cache_only: bool = False,
         logger: Logger = None,
+        max_workers: int = 4,
+        transport: Transport = None,
     ):
         self.api_key = api_key
         self.cache_dir = cache_dir
         self.cache_only = cache_only
         self.logger = logger or getLogger(__name__)
+        self.max_workers = max(1, max_workers)
         if cache_only and not cache_dir:
             raise RuntimeError("Cache only but no cache dir 8(")
+        self.cache = DayCache(cache_dir, logger=self.logger) if cache_dir else None
+        # One keep-alive session shared by all fetches (including the prefetch pool),
+        # with enough pooled connections that concurrent fetches don't block each other.
+        self.transport = transport or shared_transport(
+            "visualcrossing", pool_size=self.max_workers, logger=self.logger
+        )
 
     def histo_forecast(
         self, time: datetime, latitude: float, longitude: float
     ) -> Forecast:
-        json = self._get_cached(
-            path=self._cache_file(time=time, longitude=longitude, latitude=latitude),
-            fetch=lambda: self._forecast(
-                time=time, latitude=latitude, longitude=longitude
-            ),
+        return self.histo_forecast_range(
+            start=time, end=time, latitude=latitude, longitude=longitude
         )
-        return Forecast(json)
+
+    def histo_forecast_range(
+        self, start: datetime, end: datetime, latitude: float, longitude: float
+    ) -> Forecast:
+        """
+        Get the weather for every day from start to end, inclusive.
+
+        The end time is how recent the weather for the last day needs to be; the days
+        before it are over, so we want the whole day. Each day is cached on its own,
+        and any that are missing are fetched with a single request.
+        """
+        as_ofs = self._as_of_times(start=start, end=end)
+        if not self.cache_dir:
+            return Forecast(
+                self._forecast(
+                    time=start, latitude=latitude, longitude=longitude, end_time=end
+                )
+            )
+
+        days = {}
+        missing = []
+        for as_of in as_ofs:
+            cached = self.cache.read(
+                longitude=longitude,
+                latitude=latitude,
+                day=as_of.date(),
+                hour=as_of.hour,
+            )
+            if cached is None:
+                missing.append(as_of)
+            else:
+                days[as_of.date()] = cached
+
+        if missing:
+            if self.cache_only:
+                path = self.cache.path(
+                    longitude=longitude, latitude=latitude, day=missing[0].date()
+                )
+                raise RuntimeError(f"No cache entry for {path} and cache_only is true")
+            days.update(
+                self._fetch_range(
+                    start=missing[0],
+                    end=missing[-1],
+                    latitude=latitude,
+                    longitude=longitude,
+                )
+            )
+
+        for as_of in as_ofs:
+            if as_of.date() not in days:
+                raise RuntimeError(
+                    f"No weather returned for {as_of.date()} at {longitude}x{latitude}"
+                )
+        first = days[as_ofs[0].date()]
+        return Forecast.from_days(
+            first.timezone,
+            first.latitude,
+            first.longitude,
+            [days[as_of.date()].day for as_of in as_ofs],
+        )
+
+    def is_cached(self, time: datetime, latitude: float, longitude: float) -> bool:
+        return self.cache is not None and self.cache.has(
+            longitude=longitude, latitude=latitude, day=time.date(), hour=time.hour
+        )
+
+    def prefetch(
+        self, requests: Iterable[Tuple[datetime, datetime, float, float]]
+    ) -> int:
+        """
+        Warm the cache for a batch of (start, end, latitude, longitude) requests.
+
+        Requests are deduplicated by cache file and only the cache misses are fetched,
+        concurrently on a bounded pool. Consecutive missing days at a location are
+        fetched as one range request of up to MAX_RANGE_DAYS days. Failures are logged
+        and left for the caller to hit (and report) again when it asks for that forecast.
+
+        :return: The number of requests made.
+        """
+        if not self.cache_dir or self.cache_only:
+            return 0
+
+        misses = {}
+        for start, end, latitude, longitude in requests:
+            for as_of in self._as_of_times(start=start, end=end):
+                key = (longitude, latitude, as_of.date(), as_of.hour)
+                if key not in misses and not self.is_cached(
+                    time=as_of, latitude=latitude, longitude=longitude
+                ):
+                    misses[key] = (as_of, latitude, longitude)
+
+        if not misses:
+            return 0
+
+        by_location = defaultdict(list)
+        for as_of, latitude, longitude in misses.values():
+            by_location[(latitude, longitude)].append(as_of)
+
+        runs = []
+        for (latitude, longitude), as_ofs in by_location.items():
+            run = []
+            for as_of in sorted(as_ofs):
+                if (
+                    run
+                    and len(run) < MAX_RANGE_DAYS
+                    and run[-1].hour == 23
+                    and (as_of.date() - run[-1].date()).days == 1
+                ):
+                    run.append(as_of)
+                else:
+                    if run:
+                        runs.append((run[0], run[-1], latitude, longitude))
+                    run = [as_of]
+            runs.append((run[0], run[-1], latitude, longitude))
+
+        self.logger.info(
+            f"Prefetching {len(misses)} forecast days in {len(runs)} requests "
+            f"with {self.max_workers} workers"
+        )
+
+        fetched = 0
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = {
+                pool.submit(
+                    self.histo_forecast_range,
+                    start=start,
+                    end=end,
+                    latitude=lat,
+                    longitude=lon,
+                ): (start, end, lat, lon)
+                for (start, end, lat, lon) in runs
+            }
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                    fetched += 1
+                except Exception as x:
+                    self.logger.warning(f"Error prefetching {futures[future]}: {x}")
+        return fetched
 
     def forecast(self, time: datetime, latitude: float, longitude: float) -> Forecast:
         return Forecast(
             self._forecast(time=time, latitude=latitude, longitude=longitude)
         )
 
-    def _forecast(self, time: datetime, latitude: float, longitude: float):
-        response = get(
-            url=f"https://weather.visualcrossing.com/VisualCrossingWebServices/rest/services/timeline/{latitude},{longitude}/{time.strftime('%Y-%m-%d')}",
+    def _forecast(
+        self,
+        time: datetime,
+        latitude: float,
+        longitude: float,
+        end_time: datetime = None,
+    ):
+        dates = time.strftime("%Y-%m-%d")
+        if end_time and end_time.date() != time.date():
+            dates += f"/{end_time.strftime('%Y-%m-%d')}"
+        response = self.transport.get(
+            url=f"https://weather.visualcrossing.com/VisualCrossingWebServices/rest/services/timeline/{latitude},{longitude}/{dates}",
             params={"unitGroup": "us", "include": "hours", "key": self.api_key},
-            headers={"Accept-Encoding": "gzip"},
-            timeout=15,
         )
         if response.status_code != 200:
             raise HTTPError(
-                f"Bad response: {response.status_code} {response.reason}: {response.text}"
+                f"Bad response: {response.status_code} {response.reason}: {response.text}",
+                response=response,
             )
         return loads(response.text)
 
-    def _cache_file(self, time: datetime, longitude: float, latitude: float):
-        if not self.cache_dir:
-            return None  # where are all the monads
-        directory = os.path.join(self.cache_dir, f"{longitude}x{latitude}")
-        return os.path.join(directory, f'{time.strftime("%Y-%m-%dT%H")}.json')
-
-    def _get_cached(self, path: str, fetch):
-        if not path:
-            return fetch()
-
-        if os.path.exists(path):
-            self.logger.debug(f"Cache hit for {path}")
-            try:
-                with open(path, "r") as file:
-                    return load(file)
-            except:
-                self.logger.warning(f"Error reading cache file {path}")
-                os.remove(path)
-
-        if self.cache_only:
-            raise RuntimeError(f"No cache entry for {path} and cache_only is true")
-
-        self.logger.debug(f"Cache miss for {path}")
-
-        json = fetch()
-
-        directory = os.path.dirname(path)
-        if not os.path.exists(directory):
-            os.makedirs(directory)
+    def _fetch_range(
+        self, start: datetime, end: datetime, latitude: float, longitude: float
+    ):
+        """
+        Fetch a range of days in one request and cache each day separately.
 
-        with open(path, "w") as file:
-            file.write(dumps(json, indent=2))
+        :return: Single-day forecasts, keyed by date.
+        """
+        self.logger.debug(
+            f"Cache miss for {longitude}x{latitude} {start.date()} to {end.date()}"
+        )
+        forecast = Forecast(
+            self._forecast(
+                time=start, latitude=latitude, longitude=longitude, end_time=end
+            )
+        )
+        days = {}
+        for day in forecast.days:
+            # Days before the end of the range are over, so they are good until midnight.
+            hour = end.hour if day.date == end.date() else 23
+            self.cache.write(
+                longitude=longitude,
+                latitude=latitude,
+                as_of_hour=hour,
+                forecast=forecast,
+                day=day,
+            )
+            days[day.date] = Forecast.from_days(
+                forecast.timezone, forecast.latitude, forecast.longitude, [day]
+            )
+        return days
 
-        return json
+    @classmethod
+    def _as_of_times(cls, start: datetime, end: datetime) -> List[datetime]:
+        """
+        The cache time needed for each day from start to end: end-of-day for all but
+        the last day, and end itself for the last.
+        """
+        span = (end.date() - start.date()).days
+        return [
+            (end - timedelta(days=n)).replace(
+                hour=23, minute=59, second=0, microsecond=0
+            )
+            for n in range(span, 0, -1)
+        ] + [end]
@@ -0,0 +1,263 @@
+import os
+import struct
+from datetime import date, datetime, time
+from json import load
+from logging import Logger, getLogger
+from math import isnan
+from typing import Optional
+
+from pytz import timezone
+
+from freezing.sync.metrics import timed
+
+from .model import Day, Forecast, Hour
+
+# A day of weather for one location is stored as a fixed header followed by one
+# fixed-width record per hour, holding only the fields the model uses. Only the most
+# recent fetch of a day is kept, along with the hour it was fetched to cover.
+#
+#   header: magic, as-of hour, hour count, latitude, longitude, timezone name,
+#           date (ordinal), sunrise and sunset (seconds into the day), min/max temperature
+#   hour:   time (seconds into the day), temperature, apparent temperature,
+#           precipitation, wind gust, wind speed, precipitation type, source
+MAGIC = b"VCW1"
+HEADER = struct.Struct("<4sBBdd32sIIIdd")
+HOUR = struct.Struct("<IdddddB4s")
+
+PRECIP_TYPES = ["", "rain", "snow"]
+
+SUFFIX = ".wx"
+
+
+def _seconds(t: time) -> int:
+    return t.hour * 3600 + t.minute * 60 + t.second
+
+
+def _time(seconds: int, tz) -> time:
+    return time(seconds // 3600, seconds // 60 % 60, seconds % 60, tzinfo=tz)
+
+
+def _pack_float(value) -> float:
+    return float("nan") if value is None else value
+
+
+def _unpack_float(value: float):
+    return None if isnan(value) else value
+
+
+def pack_day(as_of_hour: int, forecast: Forecast, day: Day) -> bytes:
+    tz_name = forecast.timezone.zone.encode("utf-8")
+    if len(tz_name) > 32:
+        raise ValueError(f"Timezone name too long: {forecast.timezone.zone}")
+    header = HEADER.pack(
+        MAGIC,
+        as_of_hour,
+        len(day.hours),
+        forecast.latitude,
+        forecast.longitude,
+        tz_name,
+        day.date.toordinal(),
+        _seconds(day.sunrise.time()),
+        _seconds(day.sunset.time()),
+        _pack_float(day.temperature_min),
+        _pack_float(day.temperature_max),
+    )
+    hours = b"".join(
+        HOUR.pack(
+            _seconds(h.time.time()),
+            _pack_float(h.temperature),
+            _pack_float(h.apparent_temperature),
+            _pack_float(h.precip_accumulation),
+            _pack_float(h.wind_gust),
+            _pack_float(h.wind_speed),
+            PRECIP_TYPES.index(h.precip_type),
+            (h.source or "").encode("ascii")[:4],
+        )
+        for h in day.hours
+    )
+    return header + hours
+
+
+def unpack_as_of(data: bytes) -> Optional[int]:
+    if len(data) < HEADER.size or data[:4] != MAGIC:
+        return None
+    return data[4]
+
+
+def unpack_day(data: bytes) -> Forecast:
+    (
+        magic,
+        _,
+        num_hours,
+        latitude,
+        longitude,
+        tz_name,
+        ordinal,
+        sunrise,
+        sunset,
+        temperature_min,
+        temperature_max,
+    ) = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("Not a weather cache file")
+    tz = timezone(tz_name.rstrip(b"\0").decode("utf-8"))
+    day_date = date.fromordinal(ordinal)
+
+    hours = []
+    for (
+        seconds,
+        temp,
+        feels,
+        precip,
+        gust,
+        wind,
+        precip_type,
+        source,
+    ) in HOUR.iter_unpack(data[HEADER.size : HEADER.size + num_hours * HOUR.size]):
+        hours.append(
+            Hour.from_fields(
+                time=datetime.combine(day_date, _time(seconds, tz)),
+                temperature=_unpack_float(temp),
+                apparent_temperature=_unpack_float(feels),
+                precip_type=PRECIP_TYPES[precip_type],
+                precip_accumulation=_unpack_float(precip),
+                wind_gust=_unpack_float(gust),
+                wind_speed=_unpack_float(wind),
+                source=source.rstrip(b"\0").decode("ascii"),
+            )
+        )
+
+    day = Day.from_fields(
+        date=day_date,
+        sunrise=datetime.combine(day_date, _time(sunrise, tz)),
+        sunset=datetime.combine(day_date, _time(sunset, tz)),
+        temperature_min=_unpack_float(temperature_min),
+        temperature_max=_unpack_float(temperature_max),
+        hours=hours,
+    )
+    return Forecast.from_days(tz, latitude, longitude, [day])
+
+
+class DayCache(object):
+    """
+    Cache of Visual Crossing weather with one compact file per location and day.
+
+    Files live at <lon>x<lat>/<YYYY-MM-DD>.wx. A day is good for any request up to the
+    hour it was fetched to cover, and refetching a day replaces it. Days still cached in
+    the old <YYYY-MM-DD>T<HH>.json format are converted the first time they are read.
+    """
+
+    def __init__(self, cache_dir: str, logger: Logger = None):
+        self.cache_dir = cache_dir
+        self.logger = logger or getLogger(__name__)
+
+    def directory(self, longitude: float, latitude: float) -> str:
+        return os.path.join(self.cache_dir, f"{longitude}x{latitude}")
+
+    def path(self, longitude: float, latitude: float, day: date) -> str:
+        return os.path.join(
+            self.directory(longitude, latitude), f"{day.isoformat()}{SUFFIX}"
+        )
+
+    def _legacy_path(self, longitude: float, latitude: float, day: date, hour: int):
+        return os.path.join(
+            self.directory(longitude, latitude), f"{day.isoformat()}T{hour:02d}.json"
+        )
+
+    def _read_bytes(self, path: str) -> Optional[bytes]:
+        try:
+            with open(path, "rb") as file:
+                return file.read()
+        except FileNotFoundError:
+            return None
+
+    def as_of(self, longitude: float, latitude: float, day: date) -> Optional[int]:
+        """
+        :return: The hour the cached day covers up to, or None if it isn't cached.
+        """
+        path = self.path(longitude, latitude, day)
+        try:
+            with open(path, "rb") as file:
+                return unpack_as_of(file.read(HEADER.size))
+        except FileNotFoundError:
+            return None
+
+    def has(self, longitude: float, latitude: float, day: date, hour: int) -> bool:
+        as_of = self.as_of(longitude, latitude, day)
+        if as_of is not None and as_of >= hour:
+            return True
+        return any(
+            os.path.exists(self._legacy_path(longitude, latitude, day, h))
+            for h in range(hour, 24)
+        )
+
+    def read(
+        self, longitude: float, latitude: float, day: date, hour: int
+    ) -> Optional[Forecast]:
+        """
+        :return: A single-day forecast that covers at least up to hour, or None.
+        """
+        path = self.path(longitude, latitude, day)
+        with timed("cache.read", tags=["cache:weather"]):
+            data = self._read_bytes(path)
+        if data is not None:
+            try:
+                as_of = unpack_as_of(data)
+                if as_of is not None and as_of >= hour:
+                    self.logger.debug(f"Cache hit for {path}")
+                    return unpack_day(data)
+            except Exception:
+                self.logger.warning(f"Error reading cache file {path}")
+                os.remove(path)
+        return self._read_legacy(longitude, latitude, day, hour)
+
+    def _read_legacy(
+        self, longitude: float, latitude: float, day: date, hour: int
+    ) -> Optional[Forecast]:
+        legacy = [
+            (h, self._legacy_path(longitude, latitude, day, h)) for h in range(24)
+        ]
+        legacy = [(h, path) for (h, path) in legacy if os.path.exists(path)]
+        if not legacy or legacy[-1][0] < hour:
+            return None
+
+        as_of, path = legacy[-1]
+        try:
+            with open(path, "r") as file:
+                forecast = Forecast(load(file))
+        except Exception:
+            self.logger.warning(f"Error reading cache file {path}")
+            os.remove(path)
+            return None
+
+        self.logger.debug(f"Converting legacy cache file {path}")
+        self.write(longitude, latitude, as_of, forecast, forecast.day)
+        for _, old_path in legacy:
+            os.remove(old_path)
+        return Forecast.from_days(
+            forecast.timezone, forecast.latitude, forecast.longitude, [forecast.day]
+        )
+
+    def write(
+        self,
+        longitude: float,
+        latitude: float,
+        as_of_hour: int,
+        forecast: Forecast,
+        day: Day,
+    ):
+        """
+        Store one day of a forecast, replacing whatever was cached for that day.
+        """
+        path = self.path(longitude, latitude, day.date)
+        # What we just fetched is at least as current as what it replaces.
+        as_of_hour = max(as_of_hour, self.as_of(longitude, latitude, day.date) or 0)
+        data = pack_day(as_of_hour, forecast, day)
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write-then-rename so that concurrent readers never see a partial file.
+        tmp_path = f"{path}.{os.getpid()}.{id(data)}.tmp"
+        with timed("cache.write", tags=["cache:weather"]):
+            with open(tmp_path, "wb") as file:
+                file.write(data)
+            os.replace(tmp_path, path)
@@ -0,0 +1,103 @@
+from datetime import date, datetime, time, timedelta
+from logging import Logger, getLogger
+from typing import Optional
+
+from freezing.sync.wx.sunrise import SunTimes, sun_times_many
+
+from .cache import DayCache
+from .locations import LocationIndex
+from .model import Day, Forecast, Hour
+
+
+class NeighbourWeather(object):
+    """
+    Degraded weather for when Visual Crossing can't be asked (it is down, or we are
+    running cache only and missed): the cached day nearest to the ride, in distance and
+    then in date, within a tolerance.
+
+    A neighbouring day's hours are moved onto the ride's date, and sunrise and sunset
+    are calculated for the ride's own location and date rather than borrowed.
+    """
+
+    def __init__(
+        self,
+        cache: DayCache,
+        locations: LocationIndex,
+        radius_km: float,
+        max_days: int,
+        logger: Logger = None,
+    ):
+        self.cache = cache
+        self.locations = locations
+        self.radius_km = radius_km
+        self.max_days = max(0, max_days)
+        self.logger = logger or getLogger(__name__)
+
+    def histo_forecast_range(
+        self, start: datetime, end: datetime, latitude: float, longitude: float
+    ) -> Optional[Forecast]:
+        """
+        :return: A forecast covering every day from start to end, or None if any of the
+                 days has nothing cached close enough.
+        """
+        neighbours = []
+        tz = None
+        for n in range((end.date() - start.date()).days + 1):
+            day = start.date() + timedelta(days=n)
+            neighbour = self._nearest_day(latitude, longitude, day)
+            if neighbour is None:
+                self.logger.info(
+                    f"No cached weather within {self.radius_km}km and {self.max_days} "
+                    f"days of {longitude}x{latitude} on {day}"
+                )
+                return None
+            tz = tz or neighbour.timezone
+            neighbours.append((day, neighbour.day))
+
+        suns = sun_times_many(
+            (latitude, longitude, tz.localize(datetime.combine(day, time(12))))
+            for day, _ in neighbours
+        )
+        days = [
+            self._move(neighbour, day, sun, tz)
+            for (day, neighbour), sun in zip(neighbours, suns)
+        ]
+        return Forecast.from_days(tz, latitude, longitude, days)
+
+    def _nearest_day(
+        self, latitude: float, longitude: float, day: date
+    ) -> Optional[Forecast]:
+        # The ride's own location is in the index too, at a distance of zero, and
+        # within() gives the nearest first.
+        points = self.locations.within(latitude, longitude, self.radius_km)
+        offsets = [0]
+        for n in range(1, self.max_days + 1):
+            offsets += [-n, n]
+        for lat, lon in points:
+            for offset in offsets:
+                # Any as-of hour will do: a partial day beats no weather at all.
+                cached = self.cache.read(
+                    longitude=lon,
+                    latitude=lat,
+                    day=day + timedelta(days=offset),
+                    hour=0,
+                )
+                if cached is not None:
+                    return cached
+        return None
+
+    def _move(self, day: Day, to: date, sun: SunTimes, tz) -> Day:
+        hours = [
+            Hour.from_fields(
+                **dict(h.__dict__, time=datetime.combine(to, h.time.timetz()))
+            )
+            for h in day.hours
+        ]
+        return Day.from_fields(
+            date=to,
+            sunrise=datetime.combine(to, sun.sunrise.replace(tzinfo=tz)),
+            sunset=datetime.combine(to, sun.sunset.replace(tzinfo=tz)),
+            temperature_min=day.temperature_min,
+            temperature_max=day.temperature_max,
+            hours=hours,
+        )
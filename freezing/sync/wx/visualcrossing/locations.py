@@ -0,0 +1,134 @@
+import os
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation
+from math import asin, cos, floor, radians, sin, sqrt
+from typing import Iterator, List, Optional, Tuple
+
+# Mean radius of the earth.
+EARTH_RADIUS_KM = 6371.0
+
+# Size of the (degree) cells that points are bucketed into.
+CELL_DEGREES = 0.5
+
+
+def distance_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """
+    Great circle (haversine) distance between two points.
+    """
+    dlat = radians(lat2 - lat1)
+    dlon = radians(lon2 - lon1)
+    a = (
+        sin(dlat / 2) ** 2
+        + cos(radians(lat1)) * cos(radians(lat2)) * sin(dlon / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * asin(sqrt(a))
+
+
+class LocationIndex(object):
+    """
+    Index of the locations we have cached weather for, so that a ride can use weather
+    that is already cached nearby rather than paying for a new location.
+
+    Points are bucketed into fixed-size cells, so a lookup only looks at the cells that
+    overlap the search radius.
+    """
+
+    def __init__(self, radius_km: float):
+        self.radius_km = radius_km
+        self.cells = defaultdict(list)
+
+    @classmethod
+    def from_cache_dir(cls, cache_dir: str, radius_km: float) -> "LocationIndex":
+        """
+        Index the <lon>x<lat> location directories in a weather cache.
+        """
+        index = cls(radius_km=radius_km)
+        if cache_dir and os.path.isdir(cache_dir):
+            for name in os.listdir(cache_dir):
+                lon, sep, lat = name.partition("x")
+                if not sep:
+                    continue
+                try:
+                    index.add(latitude=Decimal(lat), longitude=Decimal(lon))
+                except InvalidOperation:
+                    continue
+        return index
+
+    def __len__(self):
+        return sum(len(points) for points in self.cells.values())
+
+    def _cell(self, latitude: float, longitude: float) -> Tuple[int, int]:
+        return (
+            floor(float(latitude) / CELL_DEGREES),
+            floor(float(longitude) / CELL_DEGREES),
+        )
+
+    def add(self, latitude: Decimal, longitude: Decimal):
+        points = self.cells[self._cell(latitude, longitude)]
+        if (latitude, longitude) not in points:
+            points.append((latitude, longitude))
+
+    def _candidates(
+        self, latitude: float, longitude: float, radius_km: float
+    ) -> Iterator[Tuple[float, Tuple[Decimal, Decimal]]]:
+        """
+        The indexed points within radius_km of a point, with their distances.
+        """
+        lat, lon = float(latitude), float(longitude)
+        # How far the radius reaches in degrees, which for longitude depends on latitude.
+        dlat = radius_km / (EARTH_RADIUS_KM * radians(1))
+        dlon = dlat / max(cos(radians(lat)), 0.01)
+        lat_lo, lon_lo = self._cell(lat - dlat, lon - dlon)
+        lat_hi, lon_hi = self._cell(lat + dlat, lon + dlon)
+
+        for cell_lat in range(lat_lo, lat_hi + 1):
+            for cell_lon in range(lon_lo, lon_hi + 1):
+                for point in self.cells.get((cell_lat, cell_lon), ()):
+                    km = distance_km(lat, lon, float(point[0]), float(point[1]))
+                    if km <= radius_km:
+                        yield km, point
+
+    def nearest(
+        self, latitude: float, longitude: float
+    ) -> Optional[Tuple[Decimal, Decimal]]:
+        """
+        :return: The nearest indexed (latitude, longitude) within the radius, if any.
+        """
+        if self.radius_km <= 0:
+            return None
+
+        best, best_km = None, self.radius_km
+        for km, point in self._candidates(latitude, longitude, self.radius_km):
+            if km <= best_km:
+                best, best_km = point, km
+        return best
+
+    def within(
+        self, latitude: float, longitude: float, radius_km: float
+    ) -> List[Tuple[Decimal, Decimal]]:
+        """
+        :return: Every indexed (latitude, longitude) within radius_km, nearest first.
+        """
+        if radius_km < 0:
+            return []
+        candidates = sorted(
+            self._candidates(latitude, longitude, radius_km), key=lambda c: c[0]
+        )
+        return [point for _, point in candidates]
+
+    def snap(
+        self, latitude: float, longitude: float, places: int = 1
+    ) -> Tuple[Decimal, Decimal]:
+        """
+        Choose the location to fetch weather for: the nearest location already in the
+        index if there is one within the radius, otherwise the point rounded to a grid
+        (which then goes in the index for the rides that follow).
+        """
+        point = self.nearest(latitude, longitude)
+        if point is None:
+            point = (
+                round(Decimal(latitude), places),
+                round(Decimal(longitude), places),
+            )
+            self.add(latitude=point[0], longitude=point[1])
+        return point
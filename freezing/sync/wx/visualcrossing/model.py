@@ -40,6 +40,15 @@ class Hour(object):
         self.wind_speed = json.get("windspeed", 0.0)
         self.source = json["source"]
 
+    @classmethod
+    def from_fields(cls, **fields) -> "Hour":
+        """
+        Build an hour from already-parsed values (e.g. from the compact cache).
+        """
+        hour = cls.__new__(cls)
+        hour.__dict__.update(fields)
+        return hour
+
 
 class Day(object):
     date: date
@@ -61,15 +70,46 @@ class Day(object):
         self.temperature_max = json["tempmax"]
         self.hours = [Hour(d, self.date, tz) for d in json["hours"]]
 
+    @classmethod
+    def from_fields(cls, **fields) -> "Day":
+        """
+        Build a day from already-parsed values (e.g. from the compact cache).
+        """
+        day = cls.__new__(cls)
+        day.__dict__.update(fields)
+        return day
+
 
 class Forecast(object):
     timezone: str
     latitude: float
     longitude: float
-    day: Day
+    days: [Day]
+    day: Day  # the first day
 
     def __init__(self, json):
         self.timezone = timezone(json["timezone"])
         self.latitude = json["latitude"]
         self.longitude = json["longitude"]
-        self.day = Day(json["days"][0], self.timezone)
+        self.days = [Day(d, self.timezone) for d in json["days"]]
+        self.day = self.days[0]
+
+    @classmethod
+    def from_days(cls, tz, latitude: float, longitude: float, days: [Day]):
+        """
+        Build a forecast from days that have already been parsed.
+        """
+        forecast = cls.__new__(cls)
+        forecast.timezone = tz
+        forecast.latitude = latitude
+        forecast.longitude = longitude
+        forecast.days = days
+        forecast.day = days[0]
+        return forecast
+
+    @property
+    def hours(self) -> [Hour]:
+        """
+        The hours of every day in the forecast, in order.
+        """
+        return [h for d in self.days for h in d.hours]
@@ -7,11 +7,9 @@ Created on Feb 27, 2013
 import json
 import logging
 import os
-import time
 from urllib.parse import urlparse, urlunsplit
 
-import requests
-
+from ..transport import Transport, shared_transport
 from .model import HistoryDay
 
 state_name_to_abbrev_map = {
@@ -111,12 +109,20 @@ class Client(object):
     # http://api.wunderground.com/api/{api_key}/history_20130101/q/VA/Mc_Lean.json')
     base_url = urlparse("http://api.wunderground.com/api/")
 
-    def __init__(self, api_key, cache_dir=None, pause=1.0, cache_only=False):
+    def __init__(
+        self,
+        api_key,
+        cache_dir=None,
+        pause=1.0,
+        cache_only=False,
+        transport: Transport = None,
+    ):
         """
         :param api_key: The wunderground api key.
         :param cache_dir: The base directory for cache files.
-        :param pause: How long to pause between requests (wunderground rate limit is 10 req/minute for developer accounts)
+        :param pause: The least time between requests (wunderground rate limit is 10 req/minute for developer accounts), unless WX_MIN_REQUEST_INTERVAL sets one for wunder
         :param cache_only: Whether to only use cached data (to avoid any further hits on server)
+        :param transport: The HTTP transport (by default, one shared by all wunderground clients)
         """
         self.log = logging.getLogger(
             "{0.__module__}.{0.__name__}".format(self.__class__)
@@ -125,6 +131,9 @@ class Client(object):
         self.cache_dir = cache_dir
         self.pause = pause
         self.cache_only = cache_only
+        self.transport = transport or shared_transport(
+            "wunder", min_interval=pause or 0.0, logger=self.log
+        )
         if self.cache_dir and not os.path.exists(self.cache_dir):
             os.makedirs(self.cache_dir)
 
@@ -176,14 +185,10 @@ class Client(object):
 
         self.log.debug("GET {0!r} with params {1!r}".format(url, params))
 
-        try:
-            raw = requests.get(url, params=params)
-            raw.raise_for_status()
-            self._handle_protocol_error(raw.json())
-            return raw
-        finally:
-            if self.pause:
-                time.sleep(self.pause)
+        raw = self.transport.get(url, params=params)
+        raw.raise_for_status()
+        self._handle_protocol_error(raw.json())
+        return raw
 
     def history(self, date, lat=None, lon=None, us_city=None):
         latlon_location_param = None
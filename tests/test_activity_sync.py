@@ -1,4 +1,5 @@
-from datetime import datetime, timedelta
+import random
+from datetime import datetime, timedelta, timezone
 from types import SimpleNamespace
 from unittest.mock import MagicMock, patch
 
@@ -64,6 +65,7 @@ def ride():
 
     r = DummyRide()
     r.id = 999
+    r.athlete_id = 1
     r.resync_count = 0
     r.photos_fetched = None
     r.athlete = SimpleNamespace(name="Test Athlete")
@@ -140,3 +142,109 @@ def test_update_ride_complete(activity_sync, detailed_activity, ride):
         activity_sync.update_ride_complete(detailed_activity, ride)
         assert getattr(ride, "detail_fetched", False) is True
         assert ride.distance == pytest.approx(0.621, rel=1e-3)
+
+
+def test_photos_requeued_only_when_changed(
+    activity_sync, detailed_activity, ride, tmpdir
+):
+    from freezing.sync.utils.state import PartitionedState
+
+    fingerprints = PartitionedState(str(tmpdir.join("photo-fingerprints.json")))
+    detailed_activity.photos = SimpleNamespace(primary=SimpleNamespace(unique_id="p1"))
+
+    def changed():
+        return activity_sync._photos_changed(detailed_activity, ride, fingerprints)
+
+    with patch("freezing.sync.data.activity.config") as config:
+        config.PHOTO_REFRESH_MAX_AGE = timedelta(hours=24)
+
+        # Never queued, then an effort resync with the same photos.
+        assert changed()
+        assert not changed()
+
+        detailed_activity.total_photo_count = 2
+        assert changed()
+
+        detailed_activity.photos = SimpleNamespace(primary=None)
+        assert changed()
+        assert not changed()
+
+        # Unchanged, but long enough ago that captions may have been edited.
+        fingerprints.for_athlete(ride.athlete_id)[str(ride.id)]["queued"] = (
+            datetime.utcnow() - timedelta(hours=25)
+        ).isoformat()
+        assert changed()
+
+
+def _overlaps_larger(activity, activities):
+    # The quadratic overlap check that exclude_overlapping_rides replaced.
+    overlap_ignore = timedelta(minutes=3)
+    overlaps = [
+        a
+        for a in activities
+        if a.id != activity.id
+        and "#nooverlap" not in a.name.lower()
+        and a.distance > activity.distance
+        and (
+            a.start_date + overlap_ignore
+            <= activity.start_date + activity.elapsed_time.timedelta()
+        )
+        and (
+            a.start_date + a.elapsed_time.timedelta()
+            >= activity.start_date + overlap_ignore
+        )
+    ]
+    return overlaps and "#nooverlap" not in activity.name.lower()
+
+
+def _random_rides(rng):
+    start = datetime(2025, 1, 15, 7, tzinfo=timezone.utc)
+    rides = []
+    for n in range(rng.randint(0, 40)):
+        # Whole minutes, clustered, so that rides often meet exactly at the 3 minute
+        # slack; the odd ride runs for many hours.
+        elapsed = timedelta(minutes=rng.choice([0, 3, 6, rng.randint(1, 120), 900]))
+        rides.append(
+            SimpleNamespace(
+                id=rng.choice([n, n, n, n, 0]),
+                name=(
+                    rng.choice(["Commute", "Ride #NoOverlap", "Lunch #nooverlap"])
+                    if rng.random() < 0.3
+                    else "Commute"
+                ),
+                distance=float(rng.randint(1, 5)),
+                start_date=start + timedelta(minutes=rng.randint(0, 600)),
+                elapsed_time=SimpleNamespace(timedelta=lambda e=elapsed: e),
+            )
+        )
+    return rides
+
+
+def test_exclude_overlapping_rides_matches_pairwise_check(activity_sync):
+    rng = random.Random(2025)
+    for _ in range(500):
+        rides = _random_rides(rng)
+        expected = [a for a in rides if not _overlaps_larger(a, rides)]
+        assert activity_sync.exclude_overlapping_rides(rides) == expected
+
+
+def test_exclude_overlapping_rides_keeps_larger(activity_sync):
+    start = datetime(2025, 1, 15, 7, tzinfo=timezone.utc)
+
+    def ride(id, minutes, duration, distance, name="Commute"):
+        return SimpleNamespace(
+            id=id,
+            name=name,
+            distance=distance,
+            start_date=start + timedelta(minutes=minutes),
+            elapsed_time=SimpleNamespace(timedelta=lambda: timedelta(minutes=duration)),
+        )
+
+    small, large = ride(1, 0, 60, 10.0), ride(2, 10, 60, 20.0)
+    # Overlapping by less than three minutes is fine.
+    touching = ride(3, 68, 30, 5.0)
+    marked = ride(4, 20, 10, 1.0, name="Warm up #NoOverlap")
+
+    assert activity_sync.exclude_overlapping_rides(
+        [small, large, touching, marked]
+    ) == [large, touching, marked]
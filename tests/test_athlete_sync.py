@@ -0,0 +1,174 @@
+import os
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from freezing.sync.data.athlete import AthleteSync
+from freezing.sync.utils.state import PartitionedState
+
+
+def _strava_athlete(athlete_id, firstname="Pat", lastname="Smith", clubs=()):
+    return SimpleNamespace(
+        id=athlete_id,
+        firstname=firstname,
+        lastname=lastname,
+        profile=f"https://example.com/{athlete_id}.jpg",
+        clubs=[
+            SimpleNamespace(id=c, name=f"Club {c}", profile=None, cover_photo=None)
+            for c in clubs
+        ],
+    )
+
+
+@pytest.fixture
+def athletes():
+    return [
+        SimpleNamespace(id=1, access_token="a", display_name="Pat S", name="Pat Smith"),
+        SimpleNamespace(id=2, access_token="b", display_name=None, name=None),
+    ]
+
+
+class _Savepoint(object):
+    """
+    Stands in for Session.begin_nested(): flushes when it's released, and rolls back
+    on an error, keeping a log of which.
+    """
+
+    def __init__(self, session):
+        self.session = session
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, error_type, error, traceback):
+        if error_type is not None:
+            self.session.savepoints.append("rolled back")
+            return False
+        try:
+            self.session.flush()
+        except Exception:
+            self.session.savepoints.append("rolled back")
+            raise
+        self.session.savepoints.append("released")
+        return False
+
+
+def _sync(tmpdir, athletes, strava_athletes, flush=None):
+    sync = AthleteSync()
+    session = MagicMock()
+    session.savepoints = []
+    session.begin_nested.side_effect = lambda: _Savepoint(session)
+    session.flush.side_effect = flush
+    session.query.return_value.filter.return_value.all.return_value = athletes
+    session.query.return_value.__iter__.return_value = iter(
+        [(a.id, a.display_name) for a in athletes]
+    )
+    session.get.side_effect = lambda model, athlete_id: next(
+        (a for a in athletes if a.id == athlete_id), None
+    )
+
+    @contextmanager
+    def transaction_context():
+        yield session
+
+    clients = {
+        a.id: MagicMock(get_athlete=MagicMock(return_value=strava_athletes[a.id]))
+        for a in athletes
+    }
+    with patch("freezing.sync.data.athlete.meta") as meta, patch(
+        "freezing.sync.data.athlete.StravaClientForAthlete",
+        side_effect=lambda athlete: clients[athlete.id],
+    ), patch("freezing.sync.data.athlete.config") as config, patch.object(
+        AthleteSync, "register_athlete_team"
+    ) as register_athlete_team:
+        meta.transaction_context = transaction_context
+        meta.scoped_session.return_value = session
+        config.SYNC_STATE_DIR = str(tmpdir)
+        config.COMPETITION_TEAMS = [10]
+        config.OBSERVER_TEAMS = []
+        config.MAIN_TEAM = 10
+        config.END_DATE = None
+        with patch.object(AthleteSync, "all_done", return_value=False):
+            sync.sync_athletes()
+    return session, register_athlete_team
+
+
+def test_unchanged_athletes_are_skipped(tmpdir, athletes):
+    strava_athletes = {
+        1: _strava_athlete(1, clubs=[10]),
+        2: _strava_athlete(2, firstname="Sam", clubs=[10]),
+    }
+    session, register_team = _sync(tmpdir, athletes, strava_athletes)
+    assert register_team.call_count == 2
+    assert session.add.call_count == 2
+
+    session, register_team = _sync(tmpdir, athletes, strava_athletes)
+    assert register_team.call_count == 0
+    assert session.add.call_count == 0
+
+    strava_athletes[2] = _strava_athlete(2, firstname="Sam", clubs=[10, 11])
+    session, register_team = _sync(tmpdir, athletes, strava_athletes)
+    assert register_team.call_count == 1
+
+
+def test_display_names_are_checked_without_querying(tmpdir, athletes):
+    # Athlete 2 would be "Pat S" too, which athlete 1 already has.
+    strava_athletes = {
+        1: _strava_athlete(1, clubs=[10]),
+        2: _strava_athlete(2, lastname="Sanchez", clubs=[10]),
+    }
+    session, _ = _sync(tmpdir, athletes, strava_athletes)
+    assert athletes[1].display_name == "Pat Sanchez"
+    assert athletes[0].display_name == "Pat S"
+    session.query.return_value.filter.return_value.filter.assert_not_called()
+
+
+def test_failed_athlete_is_rolled_back_alone(tmpdir, athletes):
+    strava_athletes = {
+        1: _strava_athlete(1, clubs=[10]),
+        2: _strava_athlete(2, firstname="Sam", clubs=[10]),
+    }
+
+    def flush():
+        if athletes[1].name == "Sam Smith":
+            raise Exception("Duplicate entry 'Sam S' for key 'display_name'")
+
+    session, _ = _sync(tmpdir, athletes, strava_athletes, flush=flush)
+    assert session.savepoints == ["released", "rolled back"]
+    # Athlete 1 is still committed, and athlete 2 is tried again next time.
+    session.commit.assert_called_once()
+    session, register_team = _sync(tmpdir, athletes, strava_athletes)
+    assert register_team.call_count == 1
+    assert session.savepoints == ["released"]
+
+
+def test_due_athletes_are_prioritized(tmpdir):
+    now = datetime.utcnow()
+
+    def refreshed(hours_ago, unresolved=False):
+        return {
+            "last_refreshed": (now - timedelta(hours=hours_ago)).isoformat(),
+            "unresolved": unresolved,
+        }
+
+    schedule = PartitionedState(os.path.join(str(tmpdir), "refresh.json"))
+    for athlete_id, entry in [
+        (1, refreshed(30)),
+        (2, refreshed(2, unresolved=True)),
+        (3, refreshed(0.5, unresolved=True)),
+        (4, refreshed(1)),
+        (6, refreshed(48)),
+    ]:
+        schedule.for_athlete(athlete_id)[str(athlete_id)] = entry
+    athletes = [SimpleNamespace(id=i) for i in range(1, 7)]
+
+    with patch("freezing.sync.data.athlete.config") as config:
+        config.ATHLETE_REFRESH_INTERVAL = timedelta(hours=24)
+        config.ATHLETE_UNRESOLVED_REFRESH_INTERVAL = timedelta(hours=1)
+        due = AthleteSync().due_athletes(athletes, schedule, limit=10)
+        assert [a.id for a in due] == [5, 2, 6, 1]
+        due = AthleteSync().due_athletes(athletes, schedule, limit=2)
+        assert [a.id for a in due] == [5, 2]
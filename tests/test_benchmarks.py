@@ -0,0 +1,148 @@
+import argparse
+import json
+import random
+import time
+import urllib.error
+import urllib.request
+from datetime import date, datetime, timezone
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from benchmarks import fixtures, harness, loadgen
+from benchmarks.fakeserver import FakeServer
+from freezing.sync.config import config
+
+
+def _results(**medians):
+    return {"benchmarks": {name: {"median": m} for name, m in medians.items()}}
+
+
+def test_compare_flags_regressions():
+    comparison = harness.compare(
+        _results(a=1.0, b=1.0, gone=1.0),
+        _results(a=1.05, b=1.5, new=2.0),
+        threshold=0.1,
+    )
+
+    assert [(c["name"], c["regression"]) for c in comparison] == [
+        ("a", False),
+        ("b", True),
+    ]
+    assert round(comparison[1]["change"], 3) == 0.5
+
+
+def test_run_reports_throughput():
+    bench = harness.Benchmark(
+        name="sleep",
+        func=lambda items: time.sleep(0.01) or items,
+        setup=lambda: 10,
+        repeat=3,
+        mysql_only=False,
+        description="",
+    )
+
+    result = harness.run(bench)
+
+    assert len(result["times"]) == 3
+    assert result["min"] >= 0.01
+    assert 0 < result["per_second"] <= 1000
+
+
+def test_fake_strava_lists_athletes_rides():
+    strava = fixtures.StravaData()
+    start = datetime(2025, 1, 2, 12, tzinfo=timezone.utc)
+    ids = strava.add_rides(42, 3, start=start)
+    strava.add_rides(43, 2, start=start)
+
+    with FakeServer(strava.routes(), latency=0.01) as server:
+        request = urllib.request.Request(
+            f"{server.url}/api/v3/athlete/activities?page=1&per_page=2",
+            headers={"Authorization": "Bearer athlete-42"},
+        )
+        begun = time.perf_counter()
+        with urllib.request.urlopen(request) as response:
+            listed = json.load(response)
+        assert time.perf_counter() - begun >= 0.01
+
+        with urllib.request.urlopen(f"{server.url}/api/v3/activities/{ids[2]}") as r:
+            detail = json.load(r)
+
+    assert [a["id"] for a in listed] == ids[:2]
+    assert "segment_efforts" not in listed[0]
+    assert detail["athlete"]["id"] == 42
+    assert detail["start_date"] == "2025-01-03T04:00:00Z"
+    assert len(detail["segment_efforts"]) == strava.efforts
+
+
+def test_fake_server_throttles():
+    with FakeServer([], throttle_rate=1.0) as server:
+        try:
+            urllib.request.urlopen(f"{server.url}/api/v3/athlete")
+        except urllib.error.HTTPError as e:
+            assert e.code == 429
+            assert e.headers["Retry-After"] == "1"
+        else:
+            raise AssertionError("Expected a 429")
+        assert server.throttled == 1
+
+
+def test_fixtures_scale():
+    streams = {s["type"]: s["data"] for s in fixtures.streams(100)}
+    assert all(len(data) == 100 for data in streams.values())
+    assert streams["time"] == sorted(streams["time"])
+
+    forecast = fixtures.timeline([date(2025, 2, 1), date(2025, 2, 2)], 38.9, -77.0)
+    assert [d["datetime"] for d in forecast["days"]] == ["2025-02-01", "2025-02-02"]
+    assert len(forecast["days"][1]["hours"]) == 24
+
+
+def test_percentiles():
+    summary = harness.percentiles([float(n) for n in range(100, 0, -1)])
+
+    assert summary == {"p50": 50.0, "p90": 90.0, "p95": 95.0, "p99": 99.0, "max": 100.0}
+    assert harness.percentiles([]) == {}
+
+
+def test_parse_load_options():
+    assert loadgen.parse_mix("create=3, update=1") == {"create": 3.0, "update": 1.0}
+    with pytest.raises(argparse.ArgumentTypeError):
+        loadgen.parse_mix("rename=1")
+    assert loadgen.parse_latency("50") == 0.05
+    assert loadgen.parse_latency("20-200") == (0.02, 0.2)
+
+
+def test_tracker_times_messages_until_all_handled():
+    tracker = loadgen.Tracker()
+    client = MagicMock()
+    client.put.side_effect = [1, 2]
+
+    tracker.put(client, "create", "create")
+    tracker.put(client, "delete", "delete")
+    tracker.finished_queueing()
+    tracker.handled(1)
+    tracker.handled(99)
+    assert not tracker.done.is_set()
+    tracker.handled(2)
+
+    assert tracker.done.is_set()
+    assert sorted(tracker.latencies) == ["create", "delete"]
+
+
+def test_plan_only_changes_created_rides():
+    strava = fixtures.StravaData()
+    with patch.object(
+        config, "START_DATE", datetime(2025, 1, 1, tzinfo=timezone.utc)
+    ), patch.object(config, "END_DATE", datetime(2025, 3, 20, tzinfo=timezone.utc)):
+        planned = loadgen.plan(
+            strava,
+            [1, 2],
+            {"create": 1, "update": 1, "delete": 1},
+            60,
+            random.Random(1),
+        )
+
+    assert len(planned) == 60
+    assert planned[0][0] == "create"
+    assert {op for op, _ in planned} == {"create", "update", "delete"}
+    assert len(strava.rides) == 60
@@ -0,0 +1,79 @@
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from freezing.sync import jobs
+
+
+@pytest.fixture
+def engine():
+    engine = MagicMock()
+    engine.dialect.name = "mysql"
+    with patch("freezing.sync.jobs.meta") as meta, patch(
+        "freezing.sync.jobs.config"
+    ) as config:
+        config.JOB_LOCKS = True
+        meta.scoped_session.return_value.get_bind.return_value = engine
+        yield engine
+
+
+def _statements(conn):
+    return [(str(c.args[0]), c.args[1]) for c in conn.execute.call_args_list]
+
+
+def test_advisory_lock_acquired_and_released(engine):
+    conn = engine.connect.return_value.__enter__.return_value
+    conn.execute.return_value.scalar.return_value = 1
+
+    with patch("freezing.sync.jobs.text", side_effect=str):
+        with jobs.advisory_lock("sync-photos") as acquired:
+            assert acquired
+
+    assert _statements(conn) == [
+        (
+            "SELECT GET_LOCK(:name, :timeout)",
+            {"name": "freezing-sync:sync-photos", "timeout": 0},
+        ),
+        ("SELECT RELEASE_LOCK(:name)", {"name": "freezing-sync:sync-photos"}),
+    ]
+
+
+def test_exclusive_job_skipped_when_locked_elsewhere(engine):
+    conn = engine.connect.return_value.__enter__.return_value
+    conn.execute.return_value.scalar.return_value = 0
+    job = MagicMock(__name__="sync_photos")
+
+    with patch("freezing.sync.jobs.text", side_effect=str):
+        jobs.exclusive("sync-photos")(job)()
+
+    job.assert_not_called()
+    # Only the GET_LOCK: there's nothing to release.
+    assert conn.execute.call_count == 1
+
+
+def test_no_lock_without_mysql(engine):
+    engine.dialect.name = "sqlite"
+    job = MagicMock(__name__="sync_photos", return_value=3)
+
+    assert jobs.exclusive("sync-photos")(job)(max_workers=2) == 3
+
+    job.assert_called_once_with(max_workers=2)
+    engine.connect.assert_not_called()
+
+
+def test_build_scheduler():
+    with patch("freezing.sync.jobs.BackgroundScheduler") as scheduler, patch(
+        "freezing.sync.jobs.ThreadPoolExecutor", side_effect=lambda n: n
+    ), patch("freezing.sync.jobs.config") as config:
+        config.JOB_THREADS = {"weather": 2, "reports": 0}
+        jobs.build_scheduler()
+
+    _, kwargs = scheduler.call_args
+    assert kwargs["executors"] == {
+        "strava": 3,
+        "weather": 2,
+        "reports": 1,
+        "default": 1,
+    }
+    assert kwargs["job_defaults"]["max_instances"] == 1
+    assert kwargs["job_defaults"]["coalesce"]
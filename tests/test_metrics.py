@@ -0,0 +1,53 @@
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest.mock import MagicMock, call, patch
+
+from freezing.sync import metrics
+from freezing.sync.data import SharedRateLimiter
+
+
+def test_strava_response_hook_tags_endpoint_without_ids():
+    response = SimpleNamespace(
+        url="https://www.strava.com/api/v3/activities/12345/photos?size=1000",
+        elapsed=timedelta(milliseconds=250),
+        request=SimpleNamespace(method="GET"),
+        status_code=200,
+    )
+    with patch("freezing.sync.metrics.statsd") as statsd:
+        assert metrics.strava_response_hook(response) is response
+
+    statsd.timing.assert_called_once_with(
+        "strava.request",
+        250.0,
+        tags=["endpoint:/api/v3/activities/:id/photos", "method:GET", "status:200"],
+    )
+
+
+def test_rate_limit_headroom_is_reported():
+    rates = SimpleNamespace(
+        short_usage=150, long_usage=900, short_limit=200, long_limit=2000
+    )
+    limiter = MagicMock()
+    with patch("freezing.sync.metrics.statsd") as statsd, patch(
+        "freezing.sync.metrics.get_rates_from_response_headers", return_value=rates
+    ):
+        SharedRateLimiter(limiter)({"X-RateLimit-Usage": "150,900"}, "GET")
+
+    limiter.assert_called_once_with({"X-RateLimit-Usage": "150,900"}, "GET")
+    assert statsd.gauge.call_args_list == [
+        call("strava.ratelimit.short.remaining", 50),
+        call("strava.ratelimit.long.remaining", 1100),
+    ]
+
+
+def test_timed_reports_even_on_error():
+    with patch("freezing.sync.metrics.statsd") as statsd:
+        try:
+            with metrics.timed("cache.read", tags=["cache:weather"]):
+                raise OSError("disk full")
+        except OSError:
+            pass
+
+    (metric, ms), kwargs = statsd.timing.call_args
+    assert metric == "cache.read" and ms >= 0
+    assert kwargs == {"tags": ["cache:weather"]}
@@ -0,0 +1,99 @@
+import zlib
+from unittest.mock import MagicMock, patch
+
+from freezing.sync.partitions import MEMBER_LOCK, PARTITION_LOCK, PartitionLeases
+
+
+class FakeMySQL(object):
+    """
+    Named locks shared between connections, like MySQL's GET_LOCK.
+    """
+
+    def __init__(self):
+        self.locks = {}
+        self.next_id = 1
+
+    def connect(self):
+        conn_id = self.next_id
+        self.next_id += 1
+        return FakeConnection(self, conn_id)
+
+
+class FakeConnection(object):
+    def __init__(self, db: FakeMySQL, conn_id: int):
+        self.db = db
+        self.id = conn_id
+
+    def execute(self, sql, params=None):
+        sql = str(sql)
+        name = (params or {}).get("name")
+        locks = self.db.locks
+        if sql.startswith("SELECT GET_LOCK"):
+            value = int(locks.setdefault(name, self.id) == self.id)
+        elif sql.startswith("SELECT RELEASE_LOCK"):
+            value = int(locks.pop(name, None) == self.id)
+        elif "= CONNECTION_ID()" in sql:
+            value = locks.get(name) == self.id
+        elif sql.startswith("SELECT IS_USED_LOCK"):
+            value = locks.get(name)
+        else:
+            value = 1
+        return MagicMock(scalar=MagicMock(return_value=value))
+
+    def commit(self):
+        pass
+
+    def close(self):
+        # Closing (or losing) the connection gives up its locks.
+        for name, owner in list(self.db.locks.items()):
+            if owner == self.id:
+                del self.db.locks[name]
+
+
+def _leases(db: FakeMySQL, partitions: int) -> PartitionLeases:
+    leases = PartitionLeases(partitions)
+    leases.engine = db
+    leases.owned_partitions = set()
+    return leases
+
+
+def test_unpartitioned_owns_everything():
+    leases = PartitionLeases()
+    assert not leases.partitioned
+    assert leases.owns(12345)
+    assert leases.owned() == [0]
+
+
+def test_partition_of_matches_mysql_crc32():
+    leases = PartitionLeases(7)
+    assert leases.partition_of(1234567) == zlib.crc32(b"1234567") % 7
+
+
+def test_partitions_shared_and_taken_over():
+    db = FakeMySQL()
+    with patch("freezing.sync.partitions.text", side_effect=str):
+        first = _leases(db, 4)
+        first.heartbeat()
+        assert first.owned() == [0, 1, 2, 3]
+
+        # A second process joins: the first gives back half for it to take.
+        second = _leases(db, 4)
+        second.heartbeat()
+        assert second.owned() == []
+        first.heartbeat()
+        second.heartbeat()
+        assert first.owned() == [0, 1]
+        assert second.owned() == [2, 3]
+
+        # Then the first one dies, and the second takes over its partitions.
+        first.conn.close()
+        second.heartbeat()
+        assert second.owned() == [0, 1, 2, 3]
+        for partition in range(4):
+            assert db.locks[PARTITION_LOCK.format(partition)] == second.conn.id
+
+        # And a dead connection means owning nothing until the leases are retaken.
+        second.conn.close()
+        second.heartbeat()
+        assert second.owned() == [0, 1, 2, 3]
+        assert MEMBER_LOCK.format(second.member) in db.locks
@@ -0,0 +1,59 @@
+import logging
+import os
+import pstats
+import time
+from unittest.mock import patch
+
+from freezing.sync import profiling
+
+THIS_FILE = "tests/test_profiling.py"
+
+
+def do_execute():
+    pass
+
+
+def send():
+    time.sleep(0.02)
+
+
+def job():
+    for _ in range(3):
+        do_execute()
+    send()
+    return "done"
+
+
+@patch.object(profiling, "SQL_FUNCTIONS", [(THIS_FILE, "do_execute")])
+@patch.object(profiling, "HTTP_FUNCTIONS", [(THIS_FILE, "send")])
+def test_profiled_logs_summary(caplog):
+    with caplog.at_level(logging.INFO):
+        with profiling.profiled("test-job", logging.getLogger("test")):
+            job()
+
+    summary = caplog.records[0].getMessage()
+    assert summary.startswith("Profile of test-job:")
+    assert "3 SQL statements" in summary
+    http_time = float(summary.split("s waiting on HTTP")[0].split(", ")[-1])
+    assert http_time >= 0.02
+    # The top functions.
+    assert "(job)" in summary
+
+
+def test_profiled_job_saves_profile(tmp_path):
+    wrapped = profiling.profiled_job("test-job", output=str(tmp_path))(job)
+
+    assert wrapped() == "done"
+    assert wrapped.__name__ == "job"
+
+    (saved,) = os.listdir(tmp_path)
+    assert saved.startswith("test-job-") and saved.endswith(".prof")
+    stats = pstats.Stats(str(tmp_path / saved))
+    assert any(function == "job" for (_, _, function) in stats.stats)
+
+
+def test_profiled_saves_to_file(tmp_path):
+    path = tmp_path / "run.prof"
+    with profiling.profiled("test-job", output=str(path)):
+        job()
+    assert path.exists()
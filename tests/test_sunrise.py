@@ -0,0 +1,73 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta, timezone
+
+from freezing.sync.wx.sunrise import (
+    Sun,
+    _calc,
+    _dayfromdate,
+    _timefromdecimalday,
+    sun_times,
+    sun_times_many,
+)
+
+EST = timezone(timedelta(hours=-5))
+CET = timezone(timedelta(hours=1))
+AEST = timezone(timedelta(hours=10))
+
+
+def _seconds(t):
+    return t.hour * 3600 + t.minute * 60 + t.second
+
+
+def test_table_matches_exact_calculation():
+    for lat, lon, tz in [(38.9, -77.0, EST), (52.5, 13.4, CET), (-33.9, 151.2, AEST)]:
+        hours = tz.utcoffset(None).total_seconds() / 3600
+        # Every day of a leap year and the years either side.
+        for day in range(0, 3 * 366, 5):
+            noon = datetime(2023, 1, 1, 12, tzinfo=tz) + timedelta(days=day)
+            # As far from the table's rounded location as it gets.
+            exact = _calc(lat + 0.049, lon - 0.049, _dayfromdate(noon), 0.5, hours)
+            times = sun_times(lat + 0.049, lon - 0.049, noon)
+            sunrise, sunset = (_timefromdecimalday(t) for t in exact[1:])
+            assert abs(_seconds(times.sunrise) - _seconds(sunrise)) < 60
+            assert abs(_seconds(times.sunset) - _seconds(sunset)) < 60
+            assert times.sunrise < times.solarnoon < times.sunset
+
+
+def test_dates_are_utc():
+    utc = sun_times(38.9, -77.0, datetime(2025, 6, 21, 12, tzinfo=timezone.utc))
+    assert sun_times(38.9, -77.0, date(2025, 6, 21)) == utc
+
+
+def test_many_matches_one_at_a_time():
+    points = [
+        (lat, lon, datetime(2025, 1, 1, 12, tzinfo=tz) + timedelta(days=day))
+        for lat, lon, tz in [
+            (38.9, -77.0, EST),
+            (38.91, -77.01, EST),
+            (52.5, 13.4, CET),
+        ]
+        for day in range(0, 365, 7)
+    ]
+    assert sun_times_many(points) == [sun_times(*point) for point in points]
+    assert sun_times_many([]) == []
+
+
+def test_sun_west_of_utc():
+    # A negative offset is a day minus some seconds, so it must not be read as seconds.
+    for lat, lon, tz in [(38.9, -77.0, EST), (52.5, 13.4, CET)]:
+        sun = Sun(lat=lat, lon=lon)
+        noon = datetime(2025, 3, 20, 12, tzinfo=tz)
+        times = sun_times(lat, lon, noon)
+        assert abs(_seconds(sun.sunrise(noon)) - _seconds(times.sunrise)) < 60
+        assert abs(_seconds(sun.sunset(noon)) - _seconds(times.sunset)) < 60
+
+
+def test_sun_is_reentrant():
+    sun = Sun(lat=38.9, lon=-77.0)
+    start = datetime(2025, 1, 1, 12, tzinfo=EST)
+    whens = [start + timedelta(days=d) for d in range(365)]
+    expected = [(sun.sunrise(w), sun.sunset(w)) for w in whens]
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        actual = list(pool.map(lambda w: (sun.sunrise(w), sun.sunset(w)), whens))
+    assert actual == expected
@@ -4,9 +4,147 @@ This services Instagram sync, which is likely obsolete, but running
 freezing-sync-photos was bombing so this test makes sure that
 the libraries needed are all in place."""
 
-from freezing.sync.data.photos import PhotoSync
+import threading
+from contextlib import contextmanager
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+from freezing.sync.data.photos import BigSize, PhotoSync
 
 
 def test_phtosync_instantiation():
     ps = PhotoSync()
     assert ps is not None
+
+
+def _photo(unique_id, caption="", url=None):
+    return SimpleNamespace(
+        unique_id=unique_id,
+        caption=caption,
+        urls={"1000": url or f"https://example.com/{unique_id}.jpg"},
+        ref=None,
+        source=1,
+    )
+
+
+def _row(photo_id, primary=False, caption=""):
+    return SimpleNamespace(
+        id=photo_id,
+        primary=primary,
+        img_l=f"https://example.com/{photo_id}.jpg",
+        img_t=None,
+        caption=caption,
+    )
+
+
+def test_write_photos_applies_one_diff():
+    session = MagicMock()
+    existing = MagicMock()
+    existing.filter.return_value = [
+        _row("kept"),
+        _row("recaptioned"),
+        _row("removed"),
+        _row("hidden"),
+    ]
+    deleting = MagicMock()
+    session.query.side_effect = [existing, deleting]
+    ride = SimpleNamespace(id=1, photos_fetched=False, detail_fetched=True)
+    photos = [
+        _photo("kept"),
+        _photo("recaptioned", caption="New caption"),
+        _photo("hidden", caption="#NoBafs please"),
+        _photo("added"),
+    ]
+
+    with patch("freezing.sync.data.photos.meta") as meta, patch(
+        "freezing.sync.data.photos.RidePhoto"
+    ) as ride_photo:
+        meta.scoped_session.return_value = session
+        PhotoSync().write_ride_photos_nonprimary(photos, ride, BigSize)
+
+    session.flush.assert_not_called()
+    session.delete.assert_not_called()
+    (_, inserted), _ = session.bulk_insert_mappings.call_args
+    assert [p["id"] for p in inserted] == ["added"]
+    assert inserted[0]["img_l"] == "https://example.com/added.jpg"
+    (_, updates), _ = session.bulk_update_mappings.call_args
+    assert updates == [
+        {
+            "id": "recaptioned",
+            "img_l": "https://example.com/recaptioned.jpg",
+            "caption": "New caption",
+        }
+    ]
+    ride_photo.id.in_.assert_called_once_with(["removed", "hidden"])
+    deleting.filter.return_value.delete.assert_called_once_with(
+        synchronize_session=False
+    )
+    assert ride.photos_fetched
+    # None of the photos is primary, so the ride needs its details refetched.
+    assert not ride.detail_fetched
+
+
+def test_sync_photos_fetches_concurrently_and_writes_on_main_thread():
+    rides = [
+        SimpleNamespace(id=ride_id, athlete_id=athlete_id, athlete=athlete_id)
+        for ride_id, athlete_id in [(10, 1), (11, 1), (20, 2), (30, 3)]
+    ]
+    session = MagicMock()
+    q = session.query.return_value.filter_by.return_value.filter_by.return_value
+    q.filter.return_value = rides
+    main_thread = threading.get_ident()
+    fetched_on = set()
+    written = {}
+
+    @contextmanager
+    def transaction_context():
+        yield session
+
+    def client_for(athlete):
+        if athlete == 3:
+            raise ValueError("athlete 3 had no access or refresh token")
+
+        def get_activity_photos(ride_id, size):
+            fetched_on.add(threading.get_ident())
+            if ride_id == 11:
+                raise Exception("Not Found")
+            return iter([_photo(f"{ride_id}-a")])
+
+        return MagicMock(get_activity_photos=get_activity_photos)
+
+    def write(photos, ride, size):
+        assert threading.get_ident() == main_thread
+        written[ride.id] = [p.unique_id for p in photos]
+
+    with patch("freezing.sync.data.photos.meta") as meta, patch(
+        "freezing.sync.data.photos.StravaClientForAthlete", side_effect=client_for
+    ) as client_cls, patch.object(
+        PhotoSync, "write_ride_photos_nonprimary", side_effect=write
+    ):
+        meta.transaction_context = transaction_context
+        PhotoSync().sync_photos(max_workers=2)
+
+    # One client per athlete, and nothing fetched for the one without a client.
+    assert client_cls.call_count == 3
+    assert written == {10: ["10-a"], 20: ["20-a"]}
+    assert main_thread not in fetched_on
+
+
+def test_sync_photos_stops_starting_rides_when_out_of_time():
+    rides = [SimpleNamespace(id=ride_id, athlete_id=1, athlete=1) for ride_id in (1, 2)]
+    session = MagicMock()
+    q = session.query.return_value.filter_by.return_value.filter_by.return_value
+    q.filter.return_value = rides
+
+    @contextmanager
+    def transaction_context():
+        yield session
+
+    with patch("freezing.sync.data.photos.meta") as meta, patch(
+        "freezing.sync.data.photos.StravaClientForAthlete"
+    ), patch.object(PhotoSync, "write_ride_photos_nonprimary") as write:
+        meta.transaction_context = transaction_context
+        PhotoSync().sync_photos(max_workers=2, time_budget=timedelta(seconds=-1))
+
+    write.assert_not_called()
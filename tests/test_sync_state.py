@@ -0,0 +1,115 @@
+import os
+from datetime import datetime, timedelta
+
+from freezing.sync.partitions import partition_of
+from freezing.sync.utils.failures import FailureLog
+from freezing.sync.utils.state import PartitionedState, StateFile
+
+
+def test_state_file_round_trip(tmpdir):
+    path = os.path.join(str(tmpdir), "state", "test.json")
+    state = StateFile(path)
+    assert len(state) == 0
+    state["123"] = {"attempts": 2}
+    state.save()
+
+    state = StateFile(path)
+    assert state["123"] == {"attempts": 2}
+    assert state.pop("123") == {"attempts": 2}
+    assert "123" not in state
+
+
+def test_state_file_save_keeps_other_writers_entries(tmpdir):
+    path = os.path.join(str(tmpdir), "test.json")
+    first, second = StateFile(path), StateFile(path)
+    first["1"] = "one"
+    first["2"] = "two"
+    first.save()
+    second["3"] = "three"
+    second.save()
+    first.pop("2")
+    first.save()
+
+    assert StateFile(path).items() == [("1", "one"), ("3", "three")]
+
+
+def test_partitioned_state_keeps_a_file_per_partition(tmpdir):
+    path = os.path.join(str(tmpdir), "test.json")
+    athletes = {partition: [] for partition in range(4)}
+    for athlete_id in range(1, 40):
+        athletes[partition_of(athlete_id, 4)].append(athlete_id)
+
+    # Two processes, each with two of the partitions.
+    mine = PartitionedState(path, partitions=4, held=[0, 1])
+    theirs = PartitionedState(path, partitions=4, held=[2, 3])
+    for partition, athlete_ids in athletes.items():
+        state = mine if partition in (0, 1) else theirs
+        state.for_athlete(athlete_ids[0])[str(athlete_ids[0])] = partition
+    mine.save()
+    theirs.save()
+
+    assert sorted(os.listdir(str(tmpdir))) == [
+        f"test.{partition}-of-4.json" for partition in range(4)
+    ]
+    mine = PartitionedState(path, partitions=4, held=[0, 1])
+    assert sorted(value for _, value in mine.items()) == [0, 1]
+    assert mine.for_athlete(athletes[3][0]).get(str(athletes[3][0])) == 3
+
+    # With one partition, it's the one file.
+    single = PartitionedState(path, partitions=1)
+    single.for_athlete(1)["1"] = "unpartitioned"
+    single.save()
+    assert StateFile(path)["1"] == "unpartitioned"
+
+
+def test_unreadable_state_file_is_empty(tmpdir):
+    path = os.path.join(str(tmpdir), "test.json")
+    with open(path, "w") as fp:
+        fp.write("{not json")
+    assert len(StateFile(path)) == 0
+
+
+def _failures(tmpdir):
+    return FailureLog(
+        os.path.join(str(tmpdir), "failures.json"),
+        base_delay=timedelta(hours=1),
+        max_delay=timedelta(days=1),
+    )
+
+
+def test_failure_backoff_doubles_up_to_max(tmpdir):
+    failures = _failures(tmpdir)
+    now = datetime.utcnow()
+    delays = [failures.record(123, 1, "400 Bad Request") - now for _ in range(7)]
+    hours = [round(d.total_seconds() / 3600) for d in delays]
+    assert hours == [1, 2, 4, 8, 16, 24, 24]
+    assert failures.state.for_athlete(1)["123"]["attempts"] == 7
+    assert failures.backing_off() == [123]
+
+
+def test_failures_persist_and_clear(tmpdir):
+    failures = _failures(tmpdir)
+    failures.record(123, 1, "bad geo")
+    failures.record(456, 2, "bad geo")
+    failures.clear(456, 2)
+    failures.save()
+
+    failures = _failures(tmpdir)
+    assert failures.backing_off() == [123]
+
+
+def test_expired_failures_are_retried_then_forgotten(tmpdir):
+    failures = _failures(tmpdir)
+    failures.record(123, 1, "bad geo")
+    failures.record(456, 2, "bad geo")
+    now = datetime.utcnow()
+    failures.state.for_athlete(1)["123"]["next_retry"] = (
+        now - timedelta(minutes=1)
+    ).isoformat()
+    failures.state.for_athlete(2)["456"]["next_retry"] = (
+        now - timedelta(days=2)
+    ).isoformat()
+    assert failures.backing_off() == []
+    assert failures.retrying() == [123]
+    assert "123" in failures.state.for_athlete(1)
+    assert "456" not in failures.state.for_athlete(2)
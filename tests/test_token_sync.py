@@ -0,0 +1,129 @@
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+from freezing.sync.data import (
+    STRAVA_REFRESH_HORIZON,
+    Token,
+    TokenCache,
+    inline_refresh_margin,
+)
+from freezing.sync.data.tokens import TokenSync
+
+
+def _athlete(athlete_id, expires_in):
+    return SimpleNamespace(
+        id=athlete_id,
+        access_token=f"access-{athlete_id}",
+        refresh_token=f"refresh-{athlete_id}",
+        expires_at=int(time.time() + expires_in),
+    )
+
+
+def test_token_cache_keeps_freshest():
+    cache = TokenCache()
+    cache.put(1, Token("new", "r", 200))
+    cache.put(1, Token("old", "r", 100))
+    assert cache.get(1).access_token == "new"
+
+    athlete = SimpleNamespace(id=1, access_token="a", refresh_token="r", expires_at=150)
+    assert cache.apply(athlete)
+    assert (athlete.access_token, athlete.expires_at) == ("new", 200)
+
+    # Nothing fresher to give it now.
+    assert not cache.apply(athlete)
+    assert not cache.apply(SimpleNamespace(id=2, expires_at=0))
+
+
+def test_refresh_tokens_commits_each_athlete():
+    athletes = [_athlete(1, 60), _athlete(2, 120), _athlete(3, 180)]
+    committed = []
+    session = MagicMock()
+    q = session.query.return_value.filter.return_value.filter.return_value
+    q.order_by.return_value.all.return_value = athletes
+
+    @contextmanager
+    def transaction_context():
+        yield session
+
+    def commit():
+        if athletes[2].refresh_token == "new-refresh-3":
+            raise Exception("Lost connection")
+        committed.append([a.refresh_token for a in athletes])
+
+    def refresh_access_token(client_id, client_secret, refresh_token):
+        if refresh_token == "refresh-2":
+            raise Exception("Authorization Error")
+        athlete_id = refresh_token.split("-")[1]
+        return {
+            "access_token": f"new-access-{athlete_id}",
+            "refresh_token": f"new-refresh-{athlete_id}",
+            "expires_at": int(time.time() + 6 * 60 * 60),
+        }
+
+    session.commit.side_effect = commit
+    cache = TokenCache()
+    with patch("freezing.sync.data.tokens.meta") as meta, patch(
+        "freezing.sync.data.tokens.Client"
+    ) as client, patch("freezing.sync.data.tokens.token_cache", cache), patch(
+        "freezing.sync.data.tokens.config"
+    ), patch(
+        "freezing.sync.data.tokens.Athlete", MagicMock(expires_at=0)
+    ):
+        meta.transaction_context = transaction_context
+        client.return_value.refresh_access_token.side_effect = refresh_access_token
+        refreshed = TokenSync().refresh_tokens(window=timedelta(minutes=90))
+
+    assert refreshed == 1
+    # Athlete 1's new tokens were committed before anyone else was refreshed.
+    assert committed == [["new-refresh-1", "refresh-2", "refresh-3"]]
+    assert session.rollback.call_count == 1
+    # A token that couldn't be refreshed is left alone for the inline refresh to report.
+    assert athletes[1].access_token == "access-2"
+    assert cache.get(1).access_token == "new-access-1"
+    assert cache.get(2) is None
+    assert cache.get(3) is None
+
+
+class _ExpiresAt(object):
+    # Stands in for the column, to see what the query compares it to.
+    def __init__(self):
+        self.cutoffs = []
+
+    def __lt__(self, other):
+        self.cutoffs.append(other)
+        return True
+
+
+def test_token_with_70_minutes_left_is_left_alone():
+    seventy_minutes = _athlete(1, 70 * 60)
+    session = MagicMock()
+
+    @contextmanager
+    def transaction_context():
+        yield session
+
+    expires_at = _ExpiresAt()
+    with patch("freezing.sync.data.tokens.meta") as meta, patch(
+        "freezing.sync.data.tokens.Client"
+    ), patch("freezing.sync.data.tokens.config") as config, patch(
+        "freezing.sync.data.tokens.Athlete", MagicMock(expires_at=expires_at)
+    ):
+        meta.transaction_context = transaction_context
+        config.STRAVA_TOKEN_REFRESH_WINDOW = timedelta(minutes=90)
+        TokenSync().refresh_tokens()
+
+    # Strava would hand the same token back, so the background refresh doesn't ask...
+    [cutoff] = expires_at.cutoffs
+    assert cutoff <= time.time() + STRAVA_REFRESH_HORIZON.total_seconds()
+    assert seventy_minutes.expires_at > cutoff
+
+    # ...and nor does a client, even once the token has crossed the hour and the next
+    # background refresh is still to come.
+    with patch("freezing.sync.data.Config") as config:
+        config.STRAVA_TOKEN_REFRESH_INTERVAL = timedelta(minutes=15)
+        margin = inline_refresh_margin()
+    assert margin <= STRAVA_REFRESH_HORIZON - timedelta(minutes=2 * 15)
+    assert seventy_minutes.expires_at - 25 * 60 > time.time() + margin.total_seconds()
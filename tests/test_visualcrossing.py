@@ -0,0 +1,246 @@
+import json
+import os
+from datetime import date, datetime
+from decimal import Decimal
+from unittest.mock import patch
+
+import pytest
+from pytz import timezone
+
+from freezing.sync.wx.visualcrossing.api import HistoVisualCrossing
+from freezing.sync.wx.visualcrossing.cache import DayCache, pack_day, unpack_day
+from freezing.sync.wx.visualcrossing.fallback import NeighbourWeather
+from freezing.sync.wx.visualcrossing.locations import LocationIndex
+from freezing.sync.wx.visualcrossing.model import Forecast
+
+
+def _hour(hh):
+    return {
+        "datetime": f"{hh:02d}:00:00",
+        "temp": 30.0 + hh,
+        "feelslike": 25.0 + hh,
+        "preciptype": None,
+        "precip": 0.0,
+        "windgust": 10.0,
+        "windspeed": 5.0,
+        "source": "obs",
+    }
+
+
+def _day(iso):
+    return {
+        "datetime": iso,
+        "sunrise": "07:10:00",
+        "sunset": "17:20:00",
+        "tempmin": 30.0,
+        "tempmax": 53.0,
+        "hours": [_hour(hh) for hh in range(24)],
+    }
+
+
+def _response(*isos):
+    return {
+        "timezone": "America/New_York",
+        "latitude": 38.9,
+        "longitude": -77.0,
+        "days": [_day(iso) for iso in isos],
+    }
+
+
+@pytest.fixture
+def vc(tmpdir):
+    return HistoVisualCrossing(api_key="key", cache_dir=str(tmpdir))
+
+
+def test_as_of_times():
+    tz = timezone("America/New_York")
+    start = tz.localize(datetime(2025, 1, 1, 22, 30))
+    end = tz.localize(datetime(2025, 1, 3, 1, 15))
+    as_ofs = HistoVisualCrossing._as_of_times(start=start, end=end)
+    assert [(a.date().day, a.hour) for a in as_ofs] == [(1, 23), (2, 23), (3, 1)]
+
+
+def test_range_is_fetched_once_and_cached_per_day(vc, tmpdir):
+    start = datetime(2025, 1, 1, 22, 30)
+    end = datetime(2025, 1, 2, 1, 15)
+    with patch.object(
+        HistoVisualCrossing,
+        "_forecast",
+        return_value=_response("2025-01-01", "2025-01-02"),
+    ) as forecast:
+        hist = vc.histo_forecast_range(
+            start=start, end=end, latitude=38.9, longitude=-77.0
+        )
+        assert forecast.call_count == 1
+
+        assert [d.date.day for d in hist.days] == [1, 2]
+        assert len(hist.hours) == 48
+        assert hist.hours[24].time.day == 2
+
+        directory = os.path.join(str(tmpdir), "-77.0x38.9")
+        assert sorted(os.listdir(directory)) == ["2025-01-01.wx", "2025-01-02.wx"]
+        assert vc.cache.as_of(-77.0, 38.9, date(2025, 1, 2)) == 1
+
+        # Both days now come from the cache, including as a single day.
+        vc.histo_forecast_range(start=start, end=end, latitude=38.9, longitude=-77.0)
+        vc.histo_forecast(
+            time=datetime(2025, 1, 1, 23, 59), latitude=38.9, longitude=-77.0
+        )
+        assert forecast.call_count == 1
+
+
+def test_prefetch_backfills_consecutive_days_in_one_request(vc):
+    requests = [
+        (datetime(2025, 1, d, 8), datetime(2025, 1, d, 23, 59), 38.9, -77.0)
+        for d in range(1, 4)
+    ]
+    with patch.object(
+        HistoVisualCrossing,
+        "_forecast",
+        return_value=_response("2025-01-01", "2025-01-02", "2025-01-03"),
+    ) as forecast:
+        assert vc.prefetch(requests) == 1
+        assert forecast.call_count == 1
+        assert forecast.call_args.kwargs["end_time"].day == 3
+        assert vc.prefetch(requests) == 0
+
+
+def test_compact_cache_round_trip():
+    response = _response("2025-01-01")
+    response["days"][0]["hours"][5].update(
+        {"preciptype": ["snow"], "snow": 1.5, "windgust": None}
+    )
+    forecast = Forecast(response)
+    loaded = unpack_day(pack_day(23, forecast, forecast.day))
+
+    assert loaded.timezone.zone == "America/New_York"
+    assert (loaded.latitude, loaded.longitude) == (38.9, -77.0)
+    assert loaded.day.date == forecast.day.date
+    assert loaded.day.sunrise == forecast.day.sunrise
+    assert loaded.day.sunset == forecast.day.sunset
+    assert loaded.day.temperature_max == forecast.day.temperature_max
+    assert [h.__dict__ for h in loaded.day.hours] == [
+        h.__dict__ for h in forecast.day.hours
+    ]
+    assert loaded.day.hours[5].precip_type == "snow"
+    assert loaded.day.hours[5].wind_gust is None
+
+
+def test_compact_cache_converts_and_dedupes_legacy_json(tmpdir):
+    directory = os.path.join(str(tmpdir), "-77.0x38.9")
+    os.makedirs(directory)
+    for hour in (9, 23):
+        with open(os.path.join(directory, f"2025-01-01T{hour:02d}.json"), "w") as f:
+            json.dump(_response("2025-01-01"), f)
+
+    cache = DayCache(str(tmpdir))
+    assert cache.has(-77.0, 38.9, date(2025, 1, 1), 12)
+    forecast = cache.read(-77.0, 38.9, date(2025, 1, 1), 12)
+    assert len(forecast.day.hours) == 24
+    assert os.listdir(directory) == ["2025-01-01.wx"]
+    assert cache.as_of(-77.0, 38.9, date(2025, 1, 1)) == 23
+
+
+def test_cache_only_miss_raises(tmpdir):
+    vc = HistoVisualCrossing(api_key="key", cache_dir=str(tmpdir), cache_only=True)
+    with pytest.raises(RuntimeError):
+        vc.histo_forecast(
+            time=datetime(2025, 1, 1, 23, 59), latitude=38.9, longitude=-77.0
+        )
+
+
+def test_location_index_snaps_to_nearby_cached_point(tmpdir):
+    os.makedirs(os.path.join(str(tmpdir), "-77.0x38.9"))
+    os.makedirs(os.path.join(str(tmpdir), "not-a-location"))
+    index = LocationIndex.from_cache_dir(str(tmpdir), radius_km=8.0)
+    assert len(index) == 1
+
+    # Rounds to 38.9/-77.1, but is ~4km from the cached point.
+    assert index.snap(latitude="38.93", longitude="-77.046") == (
+        Decimal("38.9"),
+        Decimal("-77.0"),
+    )
+
+
+def test_location_index_adds_rounded_point_when_nothing_is_close():
+    index = LocationIndex(radius_km=8.0)
+    point = index.snap(latitude="39.46", longitude="-77.41")
+    assert point == (Decimal("39.5"), Decimal("-77.4"))
+    assert index.snap(latitude="39.47", longitude="-77.43") == point
+    assert len(index) == 1
+
+
+def test_location_index_disabled_with_zero_radius():
+    index = LocationIndex(radius_km=0)
+    index.add(latitude=Decimal("38.9"), longitude=Decimal("-77.0"))
+    assert index.snap(latitude="38.93", longitude="-77.046") == (
+        Decimal("38.9"),
+        Decimal("-77.0"),
+    )
+    assert index.snap(latitude="38.93", longitude="-77.06") == (
+        Decimal("38.9"),
+        Decimal("-77.1"),
+    )
+
+
+def _stand_in(tmpdir, radius_km=50.0, max_days=1):
+    cache = DayCache(str(tmpdir))
+    forecast = Forecast(_response("2025-01-01"))
+    cache.write(-77.0, 38.9, 12, forecast, forecast.day)
+    locations = LocationIndex.from_cache_dir(str(tmpdir), radius_km=8.0)
+    locations.snap(latitude="39.2", longitude="-77.2")
+    return NeighbourWeather(
+        cache=cache, locations=locations, radius_km=radius_km, max_days=max_days
+    )
+
+
+def test_stand_in_weather_from_nearby_day(tmpdir):
+    fallback = _stand_in(tmpdir)
+    start = datetime(2025, 1, 2, 8, 0)
+    hist = fallback.histo_forecast_range(
+        start=start, end=start, latitude=Decimal("39.2"), longitude=Decimal("-77.2")
+    )
+
+    assert hist.day.date == date(2025, 1, 2)
+    assert len(hist.hours) == 24
+    assert {h.time.date() for h in hist.hours} == {date(2025, 1, 2)}
+    assert hist.hours[8].temperature == 38.0
+    # Sunrise and sunset are worked out for the ride, not copied from the neighbour.
+    assert hist.day.sunrise.date() == date(2025, 1, 2)
+    assert 7 <= hist.day.sunrise.hour < 8
+    assert 16 <= hist.day.sunset.hour < 18
+
+
+def test_stand_in_weather_within_tolerance_only(tmpdir):
+    start = datetime(2025, 1, 3, 8, 0)
+    assert (
+        _stand_in(tmpdir).histo_forecast_range(
+            start=start, end=start, latitude=Decimal("39.2"), longitude=Decimal("-77.2")
+        )
+        is None
+    )
+    start = datetime(2025, 1, 1, 8, 0)
+    assert (
+        _stand_in(tmpdir, radius_km=20.0).histo_forecast_range(
+            start=start, end=start, latitude=Decimal("39.2"), longitude=Decimal("-77.2")
+        )
+        is None
+    )
+
+
+def test_stand_in_weather_prefers_nearer_location_to_nearer_day(tmpdir):
+    fallback = _stand_in(tmpdir)
+    # The ride's own location has the day before cached, and the neighbour the day.
+    own = _response("2025-01-01")
+    own["days"][0]["tempmin"] = 10.0
+    forecast = Forecast(own)
+    fallback.cache.write(-77.2, 39.2, 12, forecast, forecast.day)
+    neighbour = Forecast(_response("2025-01-02"))
+    fallback.cache.write(-77.0, 38.9, 12, neighbour, neighbour.day)
+
+    start = datetime(2025, 1, 2, 8, 0)
+    hist = fallback.histo_forecast_range(
+        start=start, end=start, latitude=Decimal("39.2"), longitude=Decimal("-77.2")
+    )
+    assert hist.day.date == date(2025, 1, 2)
+    assert hist.day.temperature_min == 10.0
@@ -0,0 +1,75 @@
+import random
+from datetime import datetime, timedelta, timezone
+from statistics import mean
+from types import SimpleNamespace
+
+import pytest
+
+from freezing.sync.wx.aggregate import RideWeatherAggregator
+
+EST = timezone(timedelta(hours=-5))
+
+
+def _hours(num_hours, rng):
+    midnight = datetime(2025, 1, 1, tzinfo=EST)
+    return [
+        SimpleNamespace(
+            time=midnight + timedelta(hours=h),
+            temperature=rng.uniform(10, 50),
+            apparent_temperature=rng.uniform(0, 50),
+            precip_accumulation=rng.choice([0.0, 0.0, 0.1, 0.25]),
+            precip_type=rng.choice(["", "", "rain", "snow"]),
+            wind_speed=rng.uniform(0, 20),
+            wind_gust=rng.uniform(0, 40),
+        )
+        for h in range(num_hours)
+    ]
+
+
+def _reference(hours, ride_start, ride_end, moving_time):
+    """The per-ride scan that the aggregator replaces."""
+    ride_observations = [d for d in hours if ride_start <= d.time <= ride_end]
+    start_obs = min(hours, key=lambda d: abs((d.time - ride_start).total_seconds()))
+    end_obs = min(hours, key=lambda d: abs((d.time - ride_end).total_seconds()))
+    if len(ride_observations) <= 2:
+        ride_observations = (
+            [start_obs]
+            + [o for o in ride_observations if o is not start_obs and o is not end_obs]
+            + [end_obs]
+        )
+    scale = moving_time / timedelta(hours=len(ride_observations)).total_seconds()
+    return {
+        "ride_temp_start": start_obs.temperature,
+        "ride_temp_end": end_obs.temperature,
+        "ride_temp_avg": mean([o.temperature for o in ride_observations]),
+        "ride_windchill_start": start_obs.apparent_temperature,
+        "ride_windchill_end": end_obs.apparent_temperature,
+        "ride_windchill_avg": mean([o.apparent_temperature for o in ride_observations]),
+        "ride_precip": sum([o.precip_accumulation for o in ride_observations]) * scale,
+        "ride_rain": any([o.precip_type == "rain" for o in ride_observations]),
+        "ride_snow": any([o.precip_type == "snow" for o in ride_observations]),
+        "wind_speed": mean([o.wind_speed for o in ride_observations]),
+        "wind_gust": max([o.wind_gust for o in ride_observations]),
+    }
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_aggregate_matches_per_ride_scan(seed):
+    rng = random.Random(seed)
+    hours = _hours(rng.choice([24, 48]), rng)
+    aggregator = RideWeatherAggregator(hours)
+    for _ in range(50):
+        # Include exact-hour and half-hour starts to exercise ties.
+        start = hours[0].time + timedelta(
+            minutes=rng.choice([0, 30, 17]) + 60 * rng.randrange(30)
+        )
+        elapsed = timedelta(minutes=rng.randrange(5, 600))
+        moving_time = elapsed.total_seconds() * rng.uniform(0.5, 1.0)
+        actual = aggregator.aggregate(start, start + elapsed, moving_time)
+        expected = _reference(hours, start, start + elapsed, moving_time)
+        assert actual == pytest.approx(expected)
+
+
+def test_aggregate_requires_observations():
+    with pytest.raises(ValueError):
+        RideWeatherAggregator([])
@@ -0,0 +1,93 @@
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+from freezing.sync.data.weather import WeatherSync
+
+
+def _row(start_geo, timezone="America/New_York"):
+    return SimpleNamespace(_mapping={"start_geo": start_geo, "timezone": timezone})
+
+
+def test_prefetch_weather_warms_each_snapped_location_once(tmpdir):
+    session = MagicMock()
+    session.execute.return_value.fetchall.return_value = [
+        _row("POINT(-77.01 38.91)"),
+        _row("POINT(-77.04 38.93)"),
+        _row("POINT(-122.41 37.77)", timezone="America/Los_Angeles"),
+        _row("not a point"),
+    ]
+    visual_crossing = MagicMock()
+    visual_crossing.prefetch.return_value = 2
+    sync = WeatherSync()
+
+    with patch(
+        "freezing.sync.data.weather.meta.scoped_session", return_value=session
+    ), patch.object(
+        WeatherSync, "_visual_crossing", return_value=visual_crossing
+    ), patch(
+        "freezing.sync.data.weather.config",
+        VISUAL_CROSSING_CACHE_DIR=str(tmpdir),
+        VISUAL_CROSSING_SNAP_RADIUS_KM=8.0,
+        WEATHER_PREFETCH_DAYS=7,
+        WEATHER_PREFETCH_CONCURRENCY=1,
+    ):
+        sync.prefetch_weather()
+
+    requests = list(visual_crossing.prefetch.call_args.args[0])
+    assert [(str(lat), str(lon)) for _, _, lat, lon in requests] == [
+        ("38.9", "-77.0"),
+        ("37.8", "-122.4"),
+    ]
+    # Only yesterday, which is over, as of the end of the day.
+    for start, end, _, _ in requests:
+        assert (start.hour, start.minute) == (0, 0)
+        assert (end.hour, end.minute) == (23, 59)
+        assert start.date() == end.date() < datetime.now(start.tzinfo).date()
+
+
+def test_upgrade_rows_only_takes_this_processes_athletes(tmpdir):
+    from freezing.sync.partitions import partition_of
+    from freezing.sync.utils.state import PartitionedState
+
+    mine = next(a for a in range(1, 100) if partition_of(a, 4) == 1)
+    path = str(tmpdir.join("weather-degraded.json"))
+    degraded = PartitionedState(path, partitions=4, held=[1])
+    tried = (datetime.utcnow() - timedelta(hours=7)).isoformat()
+    degraded.for_athlete(mine)["10"] = tried
+    degraded.for_athlete(mine)["11"] = tried
+
+    # Ride 11 has since been deleted.
+    session = MagicMock()
+    session.execute.return_value.fetchall.return_value = [
+        SimpleNamespace(
+            _mapping={"id": 10, "athlete_id": mine, "start_geo": "POINT(1 2)"}
+        )
+    ]
+    leases = MagicMock(partitioned=True, partitions=4)
+    leases.owned.return_value = [1]
+    with patch("freezing.sync.data.weather.leases", leases), patch(
+        "freezing.sync.data.weather.text"
+    ) as text:
+        rows = WeatherSync()._upgrade_rows(session, degraded)
+
+    assert [r._mapping["id"] for r in rows] == [10]
+    query = text.call_args.args[0]
+    assert "mod(crc32(R.athlete_id), :partition_count) in :partitions" in query
+    assert [key for key, _ in degraded.items()] == ["10"]
+    assert degraded.for_athlete(mine)["10"] > tried
+
+
+def test_backlog_window_only_covers_recent_rides_unless_full():
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    with patch(
+        "freezing.sync.data.weather.config", START_DATE=start, WEATHER_BACKLOG_DAYS=3
+    ):
+        window_start, window_end = WeatherSync()._backlog_window()
+        full_start, full_end = WeatherSync()._backlog_window(full=True)
+
+    now = datetime.utcnow()
+    assert timedelta(days=3) < now - window_start < timedelta(days=4)
+    assert full_start == datetime(2024, 12, 31)
+    for end in (window_end, full_end):
+        assert timedelta(hours=12) < end - now <= timedelta(hours=13)
@@ -0,0 +1,90 @@
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+from requests.exceptions import ConnectionError, HTTPError
+
+from freezing.sync.wx.providers import WeatherProvider, WeatherRouter
+
+START = datetime(2025, 1, 1, 8)
+END = datetime(2025, 1, 1, 10)
+
+
+def _http_error(status):
+    return HTTPError(
+        f"Bad response: {status}", response=SimpleNamespace(status_code=status)
+    )
+
+
+class FakeProvider(WeatherProvider):
+    def __init__(self, name, cached=False, fails=False):
+        self.name = name
+        self.cached = cached
+        self.fails = fails
+        self.calls = 0
+
+    def is_cached(self, start, end, latitude, longitude):
+        return self.cached
+
+    def histo_forecast_range(self, start, end, latitude, longitude):
+        self.calls += 1
+        if self.fails is True:
+            raise ConnectionError(f"{self.name} is down")
+        if self.fails and self.fails(longitude):
+            raise self.fails(longitude)
+        return self.name
+
+
+def _get(router):
+    return router.histo_forecast_range(
+        start=START, end=END, latitude=38.9, longitude=-77.0
+    )
+
+
+def test_router_prefers_cached_provider():
+    first, second = FakeProvider("first"), FakeProvider("second", cached=True)
+    assert _get(WeatherRouter([first, second])) == "second"
+    assert first.calls == 0
+
+
+def test_router_falls_back_and_cools_down():
+    first, second = FakeProvider("first", fails=True), FakeProvider("second")
+    router = WeatherRouter([first, second])
+    assert _get(router) == "second"
+    assert _get(router) == "second"
+    assert first.calls == 1
+
+    router.down_until["first"] = datetime.utcnow() - timedelta(seconds=1)
+    first.fails = False
+    assert _get(router) == "first"
+
+
+def test_router_raises_when_no_provider_has_weather():
+    router = WeatherRouter([FakeProvider("first", fails=True)])
+    with pytest.raises(RuntimeError, match="first is down"):
+        _get(router)
+    with pytest.raises(RuntimeError, match="cooling down"):
+        _get(router)
+
+
+def test_router_only_cools_down_for_outages():
+    errors = {-77.0: _http_error(400), -122.4: _http_error(503)}
+    provider = FakeProvider("first", fails=lambda longitude: errors.get(longitude))
+    router = WeatherRouter([provider])
+
+    def get(longitude):
+        return router.histo_forecast_range(
+            start=START, end=END, latitude=38.9, longitude=longitude
+        )
+
+    # One ride's bad request fails that ride alone, and the next location is still asked.
+    with pytest.raises(HTTPError, match="400"):
+        get(-77.0)
+    assert get(-74.0) == "first"
+    assert "first" not in router.down_until
+
+    # But still failing after the transport's retries means it's down.
+    with pytest.raises(RuntimeError, match="503"):
+        get(-122.4)
+    with pytest.raises(RuntimeError, match="cooling down"):
+        get(-74.0)
@@ -0,0 +1,106 @@
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+from requests.exceptions import ConnectionError
+
+from freezing.sync.wx.transport import RateLimiter, Transport, shared_transport
+
+
+def _response(status_code, **headers):
+    return SimpleNamespace(status_code=status_code, reason="", headers=headers)
+
+
+class FakeSession(object):
+    def __init__(self, *results):
+        self.results = list(results)
+        self.calls = 0
+
+    def get(self, url, params=None, **kwargs):
+        self.calls += 1
+        result = self.results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+def _transport(*results, max_retries=3):
+    sleeps = []
+    transport = Transport("test", max_retries=max_retries, sleep=sleeps.append)
+    transport.session = FakeSession(*results)
+    return transport, sleeps
+
+
+def test_retries_server_errors_with_exponential_backoff():
+    transport, sleeps = _transport(
+        _response(503), _response(502), ConnectionError("reset"), _response(200)
+    )
+    assert transport.get("https://example.com").status_code == 200
+    assert transport.session.calls == 4
+    assert [s for s in sleeps if s >= 1.0][:3] == [1.0, 2.0, 4.0]
+
+
+def test_honours_retry_after():
+    transport, sleeps = _transport(
+        _response(429, **{"Retry-After": "30"}), _response(200)
+    )
+    assert transport.get("https://example.com").status_code == 200
+    assert 30.0 in sleeps
+    # Still spacing requests out, though less so after a success.
+    assert transport.limiter.interval == 30.0 * 0.75
+
+
+def test_long_retry_after_is_not_waited_for():
+    transport, sleeps = _transport(
+        _response(503, **{"Retry-After": "3600"}), _response(200)
+    )
+    assert transport.get("https://example.com").status_code == 503
+    assert transport.session.calls == 1
+    assert all(s <= transport.limiter.max_interval for s in sleeps)
+    assert transport.limiter.interval == transport.limiter.max_interval
+
+
+def test_gives_up_after_max_retries():
+    transport, _ = _transport(_response(500), _response(500), max_retries=1)
+    assert transport.get("https://example.com").status_code == 500
+
+    transport, _ = _transport(ConnectionError("down"), max_retries=0)
+    with pytest.raises(ConnectionError):
+        transport.get("https://example.com")
+
+
+def test_client_errors_are_not_retried():
+    transport, sleeps = _transport(_response(404))
+    assert transport.get("https://example.com").status_code == 404
+    assert transport.session.calls == 1
+    assert sleeps == []
+
+
+def test_rate_limiter_paces_and_adapts():
+    now = [0.0]
+    sleeps = []
+    limiter = RateLimiter(min_interval=1.0, clock=lambda: now[0], sleep=sleeps.append)
+    limiter.wait()
+    limiter.wait()
+    limiter.wait()
+    assert sleeps == [1.0, 2.0]
+
+    limiter.slow_down()
+    assert limiter.interval == 2.0
+    for _ in range(10):
+        limiter.speed_up()
+    assert limiter.interval == 1.0
+
+
+def test_shared_transport_takes_each_providers_interval_from_config():
+    with patch("freezing.sync.wx.transport.config") as config, patch.dict(
+        "freezing.sync.wx.transport._transports", clear=True
+    ):
+        config.WX_MIN_REQUEST_INTERVAL = {"ncdc": 2.5}
+        config.WX_MAX_RETRIES = 5
+        ncdc = shared_transport("ncdc", min_interval=1.0)
+        wunder = shared_transport("wunder", min_interval=6.0)
+        assert (ncdc.limiter.min_interval, ncdc.max_retries) == (2.5, 5)
+        assert (wunder.limiter.min_interval, wunder.max_retries) == (6.0, 5)
+        # Every client of a provider gets the first one's transport.
+        assert shared_transport("ncdc", min_interval=0.0) is ncdc